@@ -0,0 +1,344 @@
+"""
+benchmarks of the framework, run on a machine with the browser and the driver for the browser ones:
+
+    python benchmark.py                          every benchmark which needs no browser
+    python benchmark.py wait_backends screen_shot  the named ones
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+import yaml
+from selenium import webdriver
+from selenium.webdriver.support.ui import WebDriverWait
+
+from config import LINUX_CHROMEDRIVER, LINUX_FIREFOXDRIVER, RESULT_TEMP_DIR
+from common.common import YamlLoader, load_yaml, logger, setting
+from common.driver_init import LAUNCH_PROFILES, DriverServices, WebInit
+from common.read_data import GetCaseYaml
+from common.screen_writer import ScreenWriter
+from common.table_assert import assert_table, table_array
+from common.visual_diff import VisualDiff, decode_image
+from common.wait_engine import WaitEngine
+
+
+def benchmark_case_index(cases: int = 1000, lookups: int = 10000) -> dict:
+    """
+    compare the case_name index with a linear scan over a generated locator yaml
+    :param cases: count of cases in the generated file
+    :param lookups: count of lookups
+    :return: dict of seconds
+    """
+    document = [{'model': 'Benchmark'}] + [
+        {'case_name': f'case_{i}', 'element': [{'types': 'id', 'operate': 'click', 'locate': f'id_{i}'}]}
+        for i in range(cases)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'benchmark.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.dump(document, f)
+        names = [f'case_{random.randrange(cases)}' for _ in range(lookups)]
+        readers = [GetCaseYaml(path, name) for name in names]  # absolute path is kept by os.path.join
+
+        def linear():
+            for reader in readers:
+                for data in reader.get_yaml():
+                    if data.get('case_name') == reader.case_name:
+                        break
+
+        def indexed():
+            for reader in readers:
+                reader.case_record()
+
+        return {'linear': min(timeit.repeat(linear, number=1, repeat=3)),
+                'index': min(timeit.repeat(indexed, number=1, repeat=3))}
+
+
+def benchmark_yaml_loader(cases: int = 5000) -> dict:
+    """
+    compare the shared loader with the former FullLoader parse-fail-retry path on a generated case yaml
+    :param cases: count of cases in the generated file
+    :return: dict of seconds
+    """
+    document = [{'model': 'Benchmark'}] + [
+        {'case_name': f'test_case_{i}', 'title': f'用例 {i}', 'precondition': None,
+         'testdata': [{'content': f'内容 {i}-{j}', 'assertion': j, 'assertype': '=='} for j in range(5)]}
+        for i in range(cases)]
+    raw = yaml.dump(document, allow_unicode=True).encode('GBK')  # GBK hits the retry of the former path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'benchmark.yaml')
+        with open(path, 'wb') as f:
+            f.write(raw)
+
+        def former():
+            try:
+                with open(path, encoding='utf-8') as f:
+                    return yaml.load(f, Loader=yaml.FullLoader)
+            except UnicodeDecodeError:
+                with open(path, encoding='GBK') as f:
+                    return yaml.load(f, Loader=yaml.FullLoader)
+
+        def shared():
+            with open(path, 'rb') as f:
+                return load_yaml(f.read())
+
+        return {'loader': YamlLoader.__name__,
+                'former': min(timeit.repeat(former, number=1, repeat=3)),
+                'shared': min(timeit.repeat(shared, number=1, repeat=3))}
+
+
+def benchmark_assert_table(rows: int = 2000, columns: int = 5, repeat: int = 20) -> dict:
+    """
+    time of assert_table on a rows x columns table against a python loop over the cells
+    :param rows: rows
+    :param columns: columns, the odd ones are numbers
+    :param repeat: runs of each
+    :return: dict of ms
+    """
+    rand = random.Random(0)
+    data = [[f'{rand.random() * 1000:.2f}' if c % 2 else f'text {rand.randint(0, 99)}' for c in range(columns)]
+            for _ in range(rows)]
+    names = [f'c{c}' for c in range(columns)]
+    actual, expect = table_array(data, names), table_array(data, names)
+
+    def loop():
+        for got, want in zip(data, data):
+            for index, (a, b) in enumerate(zip(got, want)):
+                assert (abs(float(a) - float(b)) <= 0.01) if index % 2 else a.strip() == b.strip()
+
+    return {'cells': rows * columns,
+            'numpy_ms': round(timeit.timeit(lambda: assert_table(actual, expect, tolerance=0.01),
+                                            number=repeat) / repeat * 1000, 3),
+            'numpy_unordered_ms': round(timeit.timeit(lambda: assert_table(actual, expect, ordered=False),
+                                                      number=repeat) / repeat * 1000, 3),
+            'loop_ms': round(timeit.timeit(loop, number=repeat) / repeat * 1000, 3)}
+
+
+def benchmark_visual_diff(width: int = 1920, height: int = 1080, repeat: int = 10) -> dict:
+    """
+    time of a full comparison of two synthetic screenshots, without writing files
+    :param width: px
+    :param height: px
+    :param repeat: runs
+    :return: dict of ms
+    """
+    import cv2
+    import numpy as np
+
+    # a page: white, a header bar, blocks of text
+    expect = np.full((height, width, 3), 255, dtype=np.uint8)
+    cv2.rectangle(expect, (0, 0), (width, 60), (60, 60, 60), -1)
+    for line in range(90, height - 20, 30):
+        cv2.putText(expect, f'line {line} of the page, some text of the result list', (40, line),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (30, 30, 30), 1, cv2.LINE_AA)
+    actual = expect.copy()
+    cv2.rectangle(actual, (width // 3, height // 3), (width // 2, height // 2), (0, 0, 255), -1)
+    ok, png = cv2.imencode('.png', actual)
+    engine = VisualDiff()
+    ignore = [[0, 0, width, 60]]
+    return {'size': f'{width}x{height}',
+            'score_same_ms': round(timeit.timeit(lambda: engine.score(expect, expect, ignore),
+                                                 number=repeat) / repeat * 1000, 1),
+            'score_changed_ms': round(timeit.timeit(lambda: engine.score(actual, expect, ignore),
+                                                    number=repeat) / repeat * 1000, 1),
+            'decode_png_ms': round(timeit.timeit(lambda: decode_image(png.tobytes()),
+                                                 number=repeat) / repeat * 1000, 1)}
+
+
+def benchmark_screen_shot(driver=None, shots: int = 10, directory: str = None) -> dict:
+    """
+    time of a screenshot in the test thread: save_screenshot plus a second capture for the report (the old
+    screen_shot) against one capture handed to the writer
+    :param driver: driver, default a new one of WebInit
+    :param shots: screenshots of each
+    :param directory: files, default RESULT_TEMP_DIR/screen_benchmark
+    :return: dict of ms
+    """
+    directory = directory or os.path.join(RESULT_TEMP_DIR, 'screen_benchmark')
+    os.makedirs(directory, exist_ok=True)
+    own = driver is None
+    if own:
+        driver = WebInit().enable
+    try:
+        start = time.perf_counter()
+        for index in range(shots):
+            driver.save_screenshot(os.path.join(directory, f'twice_{index}.png'))
+            driver.get_screenshot_as_png()
+        twice = time.perf_counter() - start
+
+        writer = ScreenWriter()
+        start = time.perf_counter()
+        for index in range(shots):
+            begin = time.perf_counter()
+            png = driver.get_screenshot_as_png()
+            writer.submit(os.path.join(directory, f'once_{index}{writer.extension}'), png,
+                          time.perf_counter() - begin)
+        once = time.perf_counter() - start
+        writer.close()
+    finally:
+        if own:
+            driver.quit()
+    return {'shots': shots, 'twice_ms': round(twice / shots * 1000, 1), 'once_ms': round(once / shots * 1000, 1),
+            'writer': writer.stats}
+
+
+# page of the wait benchmark: element i is inserted after DELAYS[i] ms
+WAIT_PAGE = """<html><body><script>
+var DELAYS = %s;
+DELAYS.forEach(function (delay, i) {
+  setTimeout(function () {
+    var el = document.createElement('div'); el.id = 'item' + i; el.textContent = 'item ' + i;
+    document.body.appendChild(el);
+  }, delay);
+});
+</script></body></html>"""
+
+
+def benchmark_wait_backends(driver=None, elements: int = 20, max_delay: float = 2.0, seed: int = 0) -> dict:
+    """
+    detection latency and webdriver commands of the polling wait against the observer wait, on a local page which
+    inserts elements after random delays
+    :param driver: driver, default a new one of WebInit
+    :param elements: elements inserted by the page
+    :param max_delay: latest insertion: s
+    :param seed: seed of the delays
+    :return: dict  backend -> {'latency_avg_ms': .., 'latency_max_ms': .., 'commands': ..}
+    """
+    quit_driver = driver is None
+    if driver is None:
+        driver = WebInit().enable
+    delays = sorted(random.Random(seed).uniform(0.05, max_delay) for _ in range(elements))
+    os.makedirs(RESULT_TEMP_DIR, exist_ok=True)
+    page = os.path.join(RESULT_TEMP_DIR, 'wait_benchmark.html')
+    with open(page, 'w', encoding='utf-8') as f:
+        f.write(WAIT_PAGE % json.dumps([round(delay * 1000) for delay in delays]))
+
+    engine = WaitEngine()
+    timeout = max_delay + 5
+    commands = {'poll': 0, 'observer': 0}
+
+    def poll(locate):
+        def find_element(d):
+            commands['poll'] += 1
+            return d.find_element('id', locate)
+        return WebDriverWait(driver, timeout, poll_frequency=setting.WEB_UI.WEB_POLL_FREQUENCY).until(find_element)
+
+    def observe(locate):
+        commands['observer'] += 1
+        return engine.observe(driver, 'id', locate, timeout=timeout)
+
+    results = dict()
+    try:
+        for backend, wait in (('poll', poll), ('observer', observe)):
+            driver.get('file://' + page)
+            start = time.perf_counter()
+            latencies = []
+            for i, delay in enumerate(delays):
+                wait(f'item{i}')
+                latencies.append(max(time.perf_counter() - start - delay, 0))
+            results[backend] = {'latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                                'latency_max_ms': round(max(latencies) * 1000, 1), 'commands': commands[backend]}
+    finally:
+        if quit_driver:
+            driver.quit()
+    logger.info(f'wait backend benchmark: {results}')
+    return results
+
+
+def benchmark_driver_service(browser: str = 'chrome', executable: str = None, repeat: int = 5) -> dict:
+    """
+    session creation time with a driver process spawned per session against the shared driver service
+    :param browser: chrome / firefox
+    :param executable: driver path, default the linux driver
+    :param repeat: sessions of each mode
+    :return: dict  {'spawn_avg_ms': .., 'shared_avg_ms': .., 'saved_ms': ..}
+    """
+    executable = executable or {'chrome': LINUX_CHROMEDRIVER, 'firefox': LINUX_FIREFOXDRIVER}[browser]
+    web = WebInit()
+    new_driver = {'chrome': lambda service: webdriver.Chrome(service=service, options=web.linux_chrome_args),
+                  'firefox': lambda service: webdriver.Firefox(service=service, options=web.linux_firefox_args)}
+    services = DriverServices()
+    results = dict()
+    for mode, service in (('spawn', lambda: DriverServices.new_service(browser, executable)),
+                          ('shared', lambda: services.lease(browser, executable))):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            driver = new_driver[browser](service())
+            times.append(time.perf_counter() - start)
+            driver.quit()
+        results[f'{mode}_avg_ms'] = round(sum(times) / len(times) * 1000, 1)
+    services.close()
+    results['saved_ms'] = round((results['spawn_avg_ms'] - results['shared_avg_ms']) * repeat, 1)
+    logger.info(f'driver service benchmark: {results}, services: {services.stats}')
+    return results
+
+
+# first contentful paint of the current page since navigation start: ms, null if the browser does not report it
+FIRST_PAINT_JS = """
+var paint = performance.getEntriesByName('first-contentful-paint')[0] || performance.getEntriesByType('paint')[0];
+return paint ? paint.startTime : null;
+"""
+
+
+def benchmark_launch_profiles(pages: list = None, profiles: list = None, repeat: int = 3,
+                              output: str = None) -> dict:
+    """
+    launch, page-load and first paint time of every launch profile on the reference pages, recorded as json to
+    compare the profiles on the pages of the project
+    :param pages: reference pages, default WEB_URL
+    :param profiles: profile names, default every built-in and WEB_PROFILES profile
+    :param repeat: loads per page
+    :param output: json file, default RESULT_TEMP_DIR/launch_profiles.json
+    :return: dict  profile -> page -> {'load_avg_ms': .., 'load_min_ms': .., 'first_paint_avg_ms': .., 'launch_ms': ..}
+    """
+    import json
+
+    pages = pages or [setting.WEB_UI.WEB_URL]
+    profiles = profiles or sorted(set(LAUNCH_PROFILES) | set(setting.section('WEB_PROFILES') or {}))
+    results = dict()
+    for name in profiles:
+        start = time.perf_counter()
+        driver = WebInit(profile=name).enable
+        if driver is None:
+            logger.error(f'launch profile: {name} can not launch the browser')
+            continue
+        launch_ms = (time.perf_counter() - start) * 1000
+        try:
+            results[name] = dict()
+            for page in pages:
+                loads, paints = [], []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    driver.get(page)
+                    loads.append((time.perf_counter() - start) * 1000)
+                    paint = driver.execute_script(FIRST_PAINT_JS)
+                    if paint is not None:
+                        paints.append(paint)
+                results[name][page] = {'load_avg_ms': round(sum(loads) / len(loads), 1),
+                                       'load_min_ms': round(min(loads), 1),
+                                       'first_paint_avg_ms': round(sum(paints) / len(paints), 1) if paints else None,
+                                       'launch_ms': round(launch_ms, 1)}
+        finally:
+            driver.quit()
+
+    output = output or os.path.join(RESULT_TEMP_DIR, 'launch_profiles.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'browser': setting.WEB_UI.WEB_BROWSER, 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'results': results}, f, indent=2)
+    logger.info(f'launch profile benchmark: {output}')
+    return results
+
+
+# benchmarks which need no browser, run when no name is given
+OFFLINE = ('case_index', 'yaml_loader', 'assert_table', 'visual_diff')
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or OFFLINE:
+        print(name, globals()[f'benchmark_{name}']())
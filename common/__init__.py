@@ -1,12 +1,31 @@
 # Author : Michael Yang
 # Date   : 5:13 pm - 5/10/22
 # File   : __init__.py.py
-from common.web_base import Base, Web, AutoRunCase
-from common.common import logger
-from common.driver_init import WebInit
-from common.common import read_conf
-from common.read_data import read_pytest_data, replace_py_yaml
+import importlib
+
+# exported name -> module, a module is only imported when one of its names is first used,
+# so importing common does not load selenium, requests or allure
+_EXPORTS = {
+    'Base': 'common.web_base',
+    'Web': 'common.web_base',
+    'AutoRunCase': 'common.web_base',
+    'logger': 'common.common',
+    'read_conf': 'common.common',
+    'setting': 'common.common',
+    'WebInit': 'common.driver_init',
+    'read_pytest_data': 'common.read_data',
+    'replace_py_yaml': 'common.read_data',
+}
 
 __all__ = ['Base', 'Web', 'AutoRunCase', 'AutoRunCase', 'logger',
-           'read_conf', 'WebInit', 'read_pytest_data', 'replace_py_yaml',
-           ]
\ No newline at end of file
+           'read_conf', 'setting', 'WebInit', 'read_pytest_data', 'replace_py_yaml',
+           ]
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
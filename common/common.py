@@ -6,32 +6,213 @@ import re
 import shutil
 import sys
 import time
-from typing import TypeVar, Tuple
+from dataclasses import dataclass, fields
+from typing import TypeVar, Tuple, Union
 
-import cv2
-import numpy as np
 import yaml
 from loguru import logger
 
-from config import RESULT_ALLURE_DIR, RESULT_JSON_DIR, RESULT_SCREEN_DIR, LOG_DIR, DIFF_IMGPATH, SETTING_YAML_DIR
+from config import BASE_DIR, RESULT_ALLURE_DIR, RESULT_JSON_DIR, RESULT_SCREEN_DIR, LOG_DIR, DIFF_IMGPATH, SETTING_YAML_DIR
 
 T = TypeVar('T')
 
+# libyaml safe loader when PyYAML is built with it, pure python safe loader otherwise
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# byte order marks, checked before the utf-8 validation
+YAML_BOMS = ((b'\xef\xbb\xbf', 'utf-8'), (b'\xff\xfe', 'utf-16-le'), (b'\xfe\xff', 'utf-16-be'))
+
+
+def decode_yaml(raw: bytes) -> str:
+    """
+    decode the content of yaml file, encoding is taken from the BOM, else utf-8 if it is valid, else GBK
+    :param raw: content of yaml file
+    :return: str
+    """
+    for bom, encoding in YAML_BOMS:
+        if raw.startswith(bom):
+            return raw[len(bom):].decode(encoding)
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('GBK')
+
+
+def load_yaml(raw: bytes) -> list or dict:
+    """
+    parse the content of yaml file with the shared safe loader
+    :param raw: content of yaml file
+    :return: parsed document
+    """
+    return yaml.load(decode_yaml(raw), Loader=YamlLoader)
+
+
+class ErrorException(Exception):
+    """
+    self defined exception class
+    """
+
+    def __init__(self, message):
+        super().__init__(message)
+
+
+@dataclass(frozen=True)
+class CurrencySetting:
+    """
+    CURRENCY section of setting.yaml
+    """
+    CASE_TYPE: str = 'web'
+    IS_CLEAN_REPORT: bool = True
+    LEVEL: str = 'DEBUG'
+    DATA_SHARD: bool = False
+
+
+@dataclass(frozen=True)
+class WebUISetting:
+    """
+    WEB_UI section of setting.yaml
+    """
+    WEB_BROWSER: str = 'Chrome'
+    WEB_URL: str = ''
+    WEB_LAUNCH_PROFILE: str = 'default'
+    WEB_IMPLICITLY_WAIT_TIME: float = 10
+    WEB_POLL_FREQUENCY: float = 0.2
+    WEB_ELEMENT_CACHE: bool = True
+    WEB_WAIT_BACKEND: str = 'poll'
+    WEB_BATCH_STEPS: bool = False
+    WEB_ADAPTIVE_WAIT: bool = True
+    WEB_STEP_WAIT: str = 'ready'
+    WEB_WAIT_POLL_MIN: float = 0.05
+    WEB_WAIT_POLL_MAX: float = 0.5
+    WEB_WAIT_QUIET: float = 0.3
+    WEB_SCREEN_FORMAT: str = 'png'
+    WEB_SCREEN_QUALITY: int = 85
+    WEB_SCREEN_QUEUE: int = 16
+    WEB_VISUAL_THRESHOLD: float = 0.001
+    WEB_VISUAL_TOLERANCE: int = 16
+    WEB_VISUAL_SSIM: float = 0.98
+    WEB_VISUAL_UPDATE: bool = False
+    WEB_IS_COLONY: bool = False
+    WEB_HUB_HOST: Union[str, list] = ''
+    WEB_SERVICE_REUSE: bool = True
+    WEB_LOCAL_GRID: bool = False
+    WEB_GRID_MAX_BROWSERS: int = 0
+    WEB_GRID_BROWSER_MB: int = 500
+    WEB_GRID_TIMEOUT: float = 300
+    WEB_HUB_SLOTS: int = 5
+    WEB_HUB_TIMEOUT: float = 300
+    WEB_SESSION_REUSE: bool = True
+    WEB_SESSION_MAX_USES: int = 50
+    WEB_SESSION_PREWARM: int = 1
+    WEB_SESSION_STANDBY: int = 1
+    WEB_SESSION_LAUNCH_WAIT: float = 60
+    WEB_HEALTH_TTL: float = 30
+    WEB_HEALTH_TIMEOUT: float = 10
+    WEB_HEALTH_HEAD: bool = True
+
+    @property
+    def hub_hosts(self) -> list:
+        """
+        hubs of WEB_HUB_HOST, a list or a comma separated str
+        :return: list of host:port
+        """
+        hosts = self.WEB_HUB_HOST
+        if isinstance(hosts, str):
+            hosts = hosts.split(',')
+        return [str(host).strip() for host in hosts or [] if str(host).strip()]
+
+
+class Setting:
+    """
+    project setting, setting.yaml is read once at import and every known section is frozen into a typed object,
+    the values are converted to the types of the fields. a setting.yaml which can not be read stops the run
+    every key can be overridden by the environment variable WEBUI_<KEY>, eg:
+        WEBUI_WEB_URL=https://www.google.com  WEBUI_WEB_IS_COLONY=true  WEBUI_LEVEL=INFO
+    demo：
+    setting.WEB_UI.WEB_URL
+    setting.CURRENCY.IS_CLEAN_REPORT
+    """
+    ENV_PREFIX = 'WEBUI_'
+    SECTIONS = {'CURRENCY': CurrencySetting, 'WEB_UI': WebUISetting}
+
+    def __init__(self, path: str = SETTING_YAML_DIR):
+        self.path = path
+        self._raw = dict()
+        self.CURRENCY = CurrencySetting()
+        self.WEB_UI = WebUISetting()
+        self._load()
+
+    @staticmethod
+    def field_value(value: T, types: type, name: str) -> T:
+        """
+        convert the value of setting.yaml or of an environment variable to the type of the setting field
+        :param value: value
+        :param types: type of field, a Union is kept as it is
+        :param name: key of the setting, for the error
+        :return:
+        """
+        try:
+            if types is bool:
+                return value.strip().lower() in ('1', 'true', 'yes', 'on') if isinstance(value, str) else bool(value)
+            if types in (int, float):
+                return types(value)
+            if types is str:
+                return str(value)
+        except (TypeError, ValueError):
+            raise ErrorException(f'setting {name}: {value!r} is not a {types.__name__}')
+        return value
+
+    def _load(self) -> None:
+        """
+        read setting.yaml and apply the environment overrides
+        :return:
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                document = load_yaml(f.read())
+        except Exception as e:
+            raise ErrorException(f'setting yaml {self.path} can not be read: {e}') from e
+
+        raw = dict()
+        for item in document or []:
+            raw.update(item)
+
+        for name, section in self.SECTIONS.items():
+            values = dict(raw.get(name) or {})
+            unknown = sorted(set(values) - {field.name for field in fields(section)})
+            if unknown:  # misspelled or removed settings would be ignored without a word
+                logger.warning(f'unknown settings in {name} of {self.path} are ignored: {unknown}')
+            for field in fields(section):
+                env = os.environ.get(self.ENV_PREFIX + field.name)
+                if env is not None:
+                    values[field.name] = env
+                if values.get(field.name) is not None:  # an empty key keeps the default
+                    values[field.name] = self.field_value(values[field.name], field.type, field.name)
+            raw[name] = values
+            setattr(self, name, section(**{f.name: values[f.name] for f in fields(section)
+                                           if values.get(f.name) is not None}))
+        self._raw = raw
+
+    def section(self, name: str) -> dict or None:
+        """
+        return a section as dict, also available for the sections without a typed object
+        :param name: section name
+        :return: dict
+        """
+        value = self._raw.get(name)
+        return dict(value) if isinstance(value, dict) else value
+
+
+setting = Setting()
+
 
 def read_conf(value: str) -> list or dict or str:
     """
-    read configuration file with yaml
+    read configuration section, served from the setting loaded once
     :param value: read key
     :return:
     """
-    try:
-        with open(SETTING_YAML_DIR, encoding='utf-8') as f:
-            data = yaml.load(f, Loader=yaml.FullLoader)
-            for item in data:
-                if item.get(value) is not None:
-                    return item.get(value)
-    except Exception as e:
-        logger.error(f'read setting yaml exception: {e}')
+    return setting.section(value)
 
 
 def find_dict(target_dist: dict, find_keys: T) -> list or int:
@@ -109,16 +290,7 @@ def is_assertion_results(actual: T, expect: T, types: str) -> bool:
         return False
 
 
-class ErrorException(Exception):
-    """
-    self defined exception class
-    """
-
-    def __init__(self, message):
-        super.__init__(message)
-
-
-levels = read_conf('CURRENCY').get('LEVEL')
+levels = setting.CURRENCY.LEVEL
 
 
 class SetLog:
@@ -183,7 +355,7 @@ class DeleteReport:
         delete the reports
         :return:
         """
-        is_clean_report = read_conf('CURRENCY').get('IS_CLEAN_REPORT')
+        is_clean_report = setting.CURRENCY.IS_CLEAN_REPORT
         if is_clean_report:  # clear the reports in RESULT_ALLURE_DIR,RESULT_JSON_DIR,RESULT_SCREEN_DIR if it's True
 
             try:
@@ -196,4 +368,32 @@ class DeleteReport:
                 logger.error(e)
 
         else:
-            logger.warning('clear report is disabled！！')
\ No newline at end of file
+            logger.warning('clear report is disabled！！')
+
+
+def import_time(module: str = 'common', top: int = 10) -> dict:
+    """
+    measure the import of a module in a fresh interpreter with python -X importtime, track it over releases
+    :param module: module name, eg: common / common.web_base / page_object.google
+    :param top: count of the slowest imports to return
+    :return: dict  {'total_us': 12345, 'top': [(cumulative_us, name), ...]}
+    """
+    import subprocess
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=BASE_DIR, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    total = next((us for us, name in reversed(rows) if name == module), None)
+    if total is None:
+        logger.error(f'import {module} failed: {proc.stderr.strip()[-500:]}')
+    return {'total_us': total, 'top': sorted(rows, reverse=True)[:top]}
+
+
+if __name__ == '__main__':
+    for name in ('common', 'common.read_data', 'common.web_base'):
+        print(name, import_time(name))
@@ -4,32 +4,25 @@
 import sys
 from typing import TypeVar
 
-from selenium.common.exceptions import SessionNotCreatedException
+from selenium.common.exceptions import SessionNotCreatedException, WebDriverException
 
 sys.path.append('../')
 import os, time
-import requests
+import threading
 
 from selenium import webdriver
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 
-from common.common import ErrorException, logger, read_conf
+from common.common import ErrorException, logger, setting
 from config import WIN_CHROMEDRIVER, LINUX_CHROMEDRIVER, MAC_CHROMEDRIVER
 from config import WIN_FIREFOXDRIVER, LINUX_FIREFOXDRIVER, MAC_FIREFOXDRIVER
 from config import IE_PATH
-from config import LOG_DIR
+from config import BASE_DIR, LOG_DIR
 
 DAY = time.strftime("%Y-%m-%d", time.localtime(time.time()))
 
 T = TypeVar('T')
 
-# read the configuration params
-WEB_UI = read_conf('WEB_UI')
-URL = WEB_UI.get('WEB_URL')
-BROWSER_NAME = WEB_UI.get('WEB_BROWSER')
-WEB_HUB_HOST = WEB_UI.get('WEB_HUB_HOST')
-WEB_IS_COLONY = WEB_UI.get('WEB_IS_COLONY')
-
 
 def if_linux_firefox() -> bool:
     """
@@ -38,7 +31,8 @@ def if_linux_firefox() -> bool:
     :return:
     """
     # 如果不是集群 并且linx firfox
-    if WEB_IS_COLONY == False and sys.platform.lower() == 'linux' and BROWSER_NAME.lower() == 'firefox':
+    web_ui = setting.WEB_UI
+    if not web_ui.WEB_IS_COLONY and sys.platform.lower() == 'linux' and web_ui.WEB_BROWSER.lower() == 'firefox':
 
         return True
 
@@ -46,29 +40,984 @@ def if_linux_firefox() -> bool:
         return False
 
 
-class WebInit:
+class HealthCheck:
     """
-    return browser driver
+    availability of the target url and the cluster hub
+    every url is probed with one pooled requests.Session (HEAD if enabled, GET if the server refuses HEAD),
+    an available url is cached for ttl seconds and a single background thread probes the known urls again every
+    ttl, so a run probes each endpoint once per interval instead of once per test. a failed probe is not cached,
+    the next check probes again, so one transient error does not fail the setups of a whole interval
+    demo：
+    health_check().check('https://www.google.com')
+    health_check().stats      {'checks': 100, 'misses': 1, 'probes': 3, 'hit_rate': 0.99, 'urls': {...}}
+    """
+
+    def __init__(self, ttl: float = None, timeout: float = None, head: bool = None):
+        web_ui = setting.WEB_UI
+        self.ttl = web_ui.WEB_HEALTH_TTL if ttl is None else ttl
+        self.timeout = web_ui.WEB_HEALTH_TIMEOUT if timeout is None else timeout
+        self.head = web_ui.WEB_HEALTH_HEAD if head is None else head
+        self._session = None
+        self._lock = threading.Lock()
+        self._url_locks = dict()
+        self._results = dict()  # url -> (available, checked at)
+        self._refresher = None
+        self._stop = threading.Event()
+        self.checks = 0
+        self.misses = 0  # checks which had to probe
+        self.probes = 0
+
+    @property
+    def session(self):
+        """
+        shared requests.Session, connections are kept alive and reused
+        :return: requests.Session
+        """
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def probe(self, url: str) -> bool:
+        """
+        request the url now
+        :param url: url
+        :return: True if the status code is 200
+        """
+        with self._lock:
+            self.probes += 1
+        try:
+            if self.head:
+                rep = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+                if rep.status_code not in (405, 501):  # HEAD is not allowed
+                    return rep.status_code == 200
+            rep = self.session.get(url, timeout=self.timeout)
+            return rep.status_code == 200
+        except Exception as e:
+            logger.error(f'url: {url} is not available. error: {e}')
+            return False
+
+    def check(self, url: str) -> bool:
+        """
+        availability of the url, probed when there is no available result younger than ttl
+        :param url: url
+        :return: bool
+        """
+        with self._lock:
+            self.checks += 1
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:  # concurrent checks of the same url share one probe
+            result = self._results.get(url)
+            if result is None or not result[0] or time.monotonic() - result[1] >= self.ttl:
+                with self._lock:
+                    self.misses += 1
+                result = (self.probe(url), time.monotonic())
+                self._results[url] = result
+        self._start_refresher()
+        return result[0]
+
+    def _start_refresher(self) -> None:
+        """
+        start the background refresher once
+        :return:
+        """
+        with self._lock:
+            if self._refresher is not None or self.ttl <= 0:
+                return
+            self._refresher = threading.Thread(target=self._refresh, name='health-check', daemon=True)
+        self._refresher.start()
+
+    def _refresh(self) -> None:
+        """
+        probe the known urls again every ttl, so check does not wait for a probe
+        :return:
+        """
+        while not self._stop.wait(self.ttl * 0.9):
+            for url in list(self._results):
+                result = (self.probe(url), time.monotonic())
+                with self._url_locks[url]:
+                    self._results[url] = result
+
+    def stop(self) -> None:
+        """
+        stop the background refresher
+        :return:
+        """
+        self._stop.set()
+
+    @property
+    def stats(self) -> dict:
+        """
+        checks, probes and the last result of every url
+        :return: dict
+        """
+        with self._lock:
+            return {'checks': self.checks, 'misses': self.misses, 'probes': self.probes,
+                    'hit_rate': round((self.checks - self.misses) / self.checks, 3) if self.checks else 0.0,
+                    'urls': {url: result[0] for url, result in self._results.items()}}
+
+
+_HEALTH_CHECK = None
+
+
+def health_check() -> HealthCheck:
+    """
+    health check service of the current process
+    :return: HealthCheck
+    """
+    global _HEALTH_CHECK
+    if _HEALTH_CHECK is None:
+        _HEALTH_CHECK = HealthCheck()
+    return _HEALTH_CHECK
+
+
+def close_health_check() -> None:
+    """
+    stop the background refresher and log the stats, nothing to do if no url was checked
+    :return:
     """
+    global _HEALTH_CHECK
+    if _HEALTH_CHECK is not None:
+        _HEALTH_CHECK.stop()
+        if _HEALTH_CHECK.checks:
+            logger.info(f'health check: {_HEALTH_CHECK.stats}')
+        _HEALTH_CHECK = None
+
+
+# words of a session error which mean the hub is busy or unreachable for now, not that it can never create it
+HUB_BUSY_MESSAGES = ('timed out', 'timeout', 'no free slot', 'no available', 'queue', 'capacity', 'too many',
+                     'unavailable', 'not ready', 'connection refused', 'max retries', 'temporarily')
+
+
+class HubDispatcher:
+    """
+    routes the new cluster sessions to the least loaded hub of WEB_HUB_HOST
+    free slots of a hub are read from the grid status endpoint (grid 4 /status, grid 3 /grid/api/hub) and cached
+    for status_ttl seconds, when it can not be read the own accounting is used: slots - sessions created here
+    a hub which is busy or unreachable is backed off exponentially, any other session error (bad capabilities,
+    a browser no node offers, authentication) is raised at once
+    demo：
+    driver = hub_dispatcher().create(lambda hub: webdriver.Remote(command_executor=f'http://{hub}/wd/hub', ...))
+    hub_dispatcher().stats   {'192.168.1.91:4444': {'active': 2, 'sessions': 10, 'queue_avg_ms': 120.3, ...}}
+    """
+
+    class _Hub:
+        __slots__ = ('host', 'active', 'sessions', 'rejections', 'free', 'status_at', 'backoff_until',
+                     'queue_time', 'queue_max')
+
+        def __init__(self, host: str):
+            self.host = host
+            self.active = 0  # sessions created here and not quit yet
+            self.sessions = 0
+            self.rejections = 0
+            self.free = None  # free slots of the last grid status, None if unknown
+            self.status_at = 0.0
+            self.backoff_until = 0.0
+            self.queue_time = 0.0
+            self.queue_max = 0.0
+
+    def __init__(self, hubs: list = None, slots: int = None, timeout: float = None, status_ttl: float = 2,
+                 backoff: float = 1, max_backoff: float = 30, poll: float = 0.5):
+        web_ui = setting.WEB_UI
+        self.hubs = [self._Hub(host) for host in (hubs if hubs is not None else web_ui.hub_hosts)]
+        if not self.hubs:
+            raise ErrorException('WEB_HUB_HOST is mandatory when using cluster mode')
+        self.slots = web_ui.WEB_HUB_SLOTS if slots is None else slots
+        self.timeout = web_ui.WEB_HUB_TIMEOUT if timeout is None else timeout
+        self.status_ttl = status_ttl
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll = poll
+        self._lock = threading.Lock()
+        self._sessions = dict()  # id(driver) -> _Hub
+
+    def grid_free(self, host: str) -> int or None:
+        """
+        free slots of a hub from its grid status
+        :param host: host:port
+        :return: int, None if the status can not be read
+        """
+        session = health_check().session
+        try:
+            rep = session.get(f'http://{host}/status', timeout=self.poll * 4)
+            if rep.status_code == 200:
+                value = rep.json().get('value') or {}
+                if 'nodes' in value:  # grid 4
+                    if not value.get('ready', True):
+                        return 0
+                    return sum(1 for node in value['nodes'] for slot in node.get('slots', [])
+                               if slot.get('session') is None)
+            rep = session.get(f'http://{host}/grid/api/hub', timeout=self.poll * 4)  # grid 3
+            if rep.status_code == 200:
+                return rep.json().get('slotCounts', {}).get('free')
+        except Exception as e:
+            logger.debug(f'grid status of hub: {host} is not available. error: {e}')
+        return None
+
+    def free_slots(self, hub: _Hub) -> int:
+        """
+        free slots of a hub, grid status if available else own accounting
+        :param hub: _Hub
+        :return: int
+        """
+        now = time.monotonic()
+        if now - hub.status_at >= self.status_ttl:
+            free = self.grid_free(hub.host)
+            with self._lock:
+                hub.free, hub.status_at = free, now
+        if hub.free is not None:
+            return hub.free
+        return self.slots - hub.active
+
+    def pick(self) -> _Hub or None:
+        """
+        the hub with the most free slots which is not backed off
+        :return: _Hub, None if every hub is full or backed off
+        """
+        now = time.monotonic()
+        candidates = [(self.free_slots(hub), -hub.active, hub) for hub in self.hubs if hub.backoff_until <= now]
+        candidates = [c for c in candidates if c[0] > 0]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda c: (c[0], c[1]))[2]
+
+    @staticmethod
+    def retryable(error: Exception) -> bool:
+        """
+        the session error means the hub is busy or unreachable, another try may succeed
+        :param error: exception of create_session
+        :return: bool
+        """
+        import urllib3
+        if isinstance(error, (ConnectionError, TimeoutError, urllib3.exceptions.HTTPError)):
+            return True
+        if isinstance(error, WebDriverException):
+            message = str(error.msg or error).lower()
+            return any(word in message for word in HUB_BUSY_MESSAGES)
+        return False
+
+    def create(self, create_session) -> T:
+        """
+        create a session on the least loaded hub, wait for a free slot up to timeout
+        :param create_session: function(host) -> driver
+        :return: driver
+        """
+        start = time.monotonic()
+        while True:
+            hub = self.pick()
+            if hub is None:
+                if time.monotonic() - start >= self.timeout:
+                    raise ErrorException(f'no free slot on hubs: {[h.host for h in self.hubs]} in {self.timeout}s')
+                time.sleep(self.poll)
+                continue
+
+            with self._lock:
+                hub.active += 1  # count the slot before the session exists, so parallel creates spread
+                if hub.free is not None:
+                    hub.free -= 1
+            try:
+                driver = create_session(hub.host)
+            except Exception as e:
+                if not self.retryable(e):
+                    with self._lock:
+                        hub.active -= 1
+                    logger.error(f'hub: {hub.host} can not create the session. error: {e}')
+                    raise
+                with self._lock:
+                    hub.active -= 1
+                    hub.rejections += 1
+                    hub.backoff_until = time.monotonic() + min(self.backoff * 2 ** (hub.rejections - 1),
+                                                               self.max_backoff)
+                logger.warning(f'hub: {hub.host} rejected the session, back off. error: {e}')
+                if time.monotonic() - start >= self.timeout:
+                    raise
+                continue
+
+            waited = time.monotonic() - start
+            with self._lock:
+                hub.sessions += 1
+                hub.queue_time += waited
+                hub.queue_max = max(hub.queue_max, waited)
+                self._sessions[id(driver)] = hub
+            self._track_quit(driver)
+            return driver
+
+    def _track_quit(self, driver: T) -> None:
+        """
+        give the slot back when the session quits
+        :param driver: driver
+        :return:
+        """
+        quit_session = driver.quit
+
+        def quit():
+            try:
+                quit_session()
+            finally:
+                self.release(driver)
+
+        driver.quit = quit
+
+    def release(self, driver: T) -> None:
+        """
+        the session of driver quit
+        :param driver: driver
+        :return:
+        """
+        with self._lock:
+            hub = self._sessions.pop(id(driver), None)
+            if hub is not None:
+                hub.active -= 1
+
+    @property
+    def stats(self) -> dict:
+        """
+        sessions and queue time per hub
+        :return: dict
+        """
+        with self._lock:
+            return {hub.host: {'active': hub.active, 'sessions': hub.sessions, 'rejections': hub.rejections,
+                               'free': hub.free,
+                               'queue_avg_ms': round(hub.queue_time / hub.sessions * 1000, 1) if hub.sessions else 0.0,
+                               'queue_max_ms': round(hub.queue_max * 1000, 1)}
+                    for hub in self.hubs}
+
+
+_HUB_DISPATCHER = None
+
+
+def hub_dispatcher() -> HubDispatcher:
+    """
+    hub dispatcher of the current process
+    :return: HubDispatcher
+    """
+    global _HUB_DISPATCHER
+    if _HUB_DISPATCHER is None:
+        _HUB_DISPATCHER = HubDispatcher()
+    return _HUB_DISPATCHER
+
+
+# sessions one driver process can host at once, 0 is unlimited. geckodriver serves a single session at a time
+SERVICE_SESSIONS = {'chrome': 0, 'firefox': 1}
+
+
+class _Lease:
+    """
+    the driver service handed to one session: the driver starts and stops it as its own service,
+    start is a no-op as the service is already running, and stop gives it back instead of killing the process.
+    every other attribute is read from and written to the service
+    """
+
+    def __init__(self, services, entry):
+        object.__setattr__(self, '_services', services)
+        object.__setattr__(self, '_entry', entry)
+        object.__setattr__(self, '_released', False)
+
+    @property
+    def service_url(self) -> str:
+        return self._entry.service.service_url
+
+    @property
+    def process(self):
+        return self._entry.service.process
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        if not self._released:
+            object.__setattr__(self, '_released', True)
+            self._services.release(self._entry)
+
+    def __getattr__(self, name: str):
+        return getattr(self._entry.service, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._entry.service, name, value)
+
+
+class DriverServices:
+    """
+    the chromedriver / geckodriver processes of the current worker, started once and reused by the sessions
+    instead of spawning a new driver process per session. a process which died is replaced on the next session
+    demo：
+    services = driver_services()
+    driver = webdriver.Chrome(service=services.lease('chrome', LINUX_CHROMEDRIVER), options=option)
+    driver.quit()   # the session ends, chromedriver keeps running for the next one
+    services.stats  {'starts': 1, 'restarts': 0, 'leases': 20, 'start_avg_ms': 210.5, 'saved_ms': 3999.5}
+    """
+
+    class _Entry:
+        __slots__ = ('browser', 'service', 'sessions', 'started', 'error')
+
+        def __init__(self, browser: str, service):
+            self.browser = browser
+            self.service = service
+            self.sessions = 0
+            self.started = threading.Event()  # set when the process is up or failed to start
+            self.error = None
+
+        @property
+        def alive(self) -> bool:
+            return self.service.process is not None and self.service.process.poll() is None
 
     def __init__(self):
-        self.browser = BROWSER_NAME.lower()
-        self.baseurl = URL
+        self._lock = threading.Lock()
+        self._services = dict()  # (browser, executable) -> [_Entry]
+        self.starts = 0
+        self.restarts = 0
+        self.leases = 0
+        self.start_time = 0.0
 
     @staticmethod
-    def inspect_url_code(url: str) -> bool:
+    def new_service(browser: str, executable: str, log_path: str = None) -> T:
+        """
+        a driver service which is not started yet
+        :param browser: chrome / firefox
+        :param executable: driver path
+        :param log_path: driver log file
+        :return: Service
         """
-        check if the url is available
+        if browser == 'chrome':
+            from selenium.webdriver.chrome.service import Service
+            return Service(executable_path=executable, log_path=log_path)
+        elif browser == 'firefox':
+            from selenium.webdriver.firefox.service import Service
+            return Service(executable_path=executable, log_path=log_path or 'geckodriver.log')
+        raise ErrorException(f'driver service of {browser} is not supported')
+
+    def lease(self, browser: str, executable: str, log_path: str = None) -> _Lease:
+        """
+        a running driver service with a free session, a new process is only started when none is running or
+        all of them are busy. the process starts outside the lock, a slow driver start only holds up the sessions
+        which wait for that process
+        :param browser: chrome / firefox
+        :param executable: driver path
+        :param log_path: driver log file
+        :return: _Lease
         """
+        limit = SERVICE_SESSIONS.get(browser, 1)
+        with self._lock:
+            entries = self._services.setdefault((browser, executable), [])
+            for entry in list(entries):
+                if entry.started.is_set() and not entry.alive:  # the driver process died, start another one
+                    logger.warning(f'{browser} driver service: {entry.service.service_url} died, restart it')
+                    entries.remove(entry)
+                    self.restarts += 1
+            entry = next((entry for entry in entries if not limit or entry.sessions < limit), None)
+            starter = entry is None
+            if starter:
+                entry = self._Entry(browser, self.new_service(browser, executable, log_path))
+                entries.append(entry)
+            entry.sessions += 1
+            self.leases += 1
+
+        if starter:
+            start = time.perf_counter()
+            try:
+                entry.service.start()
+            except Exception as e:
+                entry.error = e
+                with self._lock:
+                    self.leases -= 1
+                    if entry in entries:
+                        entries.remove(entry)
+                raise
+            finally:
+                entry.started.set()
+            with self._lock:
+                self.start_time += time.perf_counter() - start
+                self.starts += 1
+        else:
+            entry.started.wait()
+            if entry.error is not None:  # the process this session waited for did not start, try another one
+                with self._lock:
+                    self.leases -= 1
+                return self.lease(browser, executable, log_path)
+        return _Lease(self, entry)
+
+    def release(self, entry: _Entry) -> None:
+        """
+        a session of the service ended
+        :param entry: _Entry
+        :return:
+        """
+        with self._lock:
+            entry.sessions = max(entry.sessions - 1, 0)
+
+    def close(self) -> None:
+        """
+        stop every driver process
+        :return:
+        """
+        with self._lock:
+            entries = [entry for entries in self._services.values() for entry in entries]
+            self._services.clear()
+        for entry in entries:
+            try:
+                entry.service.stop()
+            except Exception as e:
+                logger.warning(f'{entry.browser} driver service did not shut down, kill it. error: {e}')
+                if entry.alive:
+                    entry.service.process.kill()
+
+    @property
+    def stats(self) -> dict:
+        """
+        saved_ms: time of the driver starts the sessions did not wait for, compared with a start per session
+        :return: dict
+        """
+        with self._lock:
+            start_avg = self.start_time / self.starts if self.starts else 0.0
+            return {'starts': self.starts, 'restarts': self.restarts, 'leases': self.leases,
+                    'running': sum(len(entries) for entries in self._services.values()),
+                    'start_avg_ms': round(start_avg * 1000, 1),
+                    'saved_ms': round((self.leases - self.starts) * start_avg * 1000, 1)}
+
+
+_DRIVER_SERVICES = None
+
+
+def driver_services() -> DriverServices:
+    """
+    driver services of the current process (xdist worker)
+    :return: DriverServices
+    """
+    global _DRIVER_SERVICES
+    if _DRIVER_SERVICES is None:
+        _DRIVER_SERVICES = DriverServices()
+    return _DRIVER_SERVICES
+
+
+def close_driver_services() -> None:
+    """
+    stop the driver processes and log their stats, nothing to do if no local session was started
+    :return:
+    """
+    global _DRIVER_SERVICES
+    if _DRIVER_SERVICES is not None:
+        _DRIVER_SERVICES.close()
+        logger.info(f'driver services: {_DRIVER_SERVICES.stats}')
+        _DRIVER_SERVICES = None
+
+
+def grid_capacity(browser_mb: int = None) -> int:
+    """
+    browsers the host can run at once: one per core, as far as the available memory allows
+    :param browser_mb: memory of one browser: MB, default WEB_GRID_BROWSER_MB
+    :return: int
+    """
+    browser_mb = browser_mb or setting.WEB_UI.WEB_GRID_BROWSER_MB
+    cores = os.cpu_count() or 1
+    try:
+        with open('/proc/meminfo') as f:
+            meminfo = dict(line.split(':', 1) for line in f)
+        free_mb = int(meminfo['MemAvailable'].split()[0]) // 1024
+    except (OSError, KeyError, ValueError):
         try:
-            rep = requests.get(url, timeout=10)  # timeout: 10s
-            code = rep.status_code
-            if code == 200:
-                return True
-            else:
-                return False
+            free_mb = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2 ** 20
+        except (AttributeError, ValueError, OSError):  # no way to read the memory, cores only
+            return cores
+    return max(1, min(cores, free_mb // browser_mb))
+
+
+class LocalGrid:
+    """
+    a grid of local driver processes shared by the xdist workers of one host, without selenium grid
+    the controller runs it and the workers ask it for a driver process over a local socket, one browser per
+    process. at most max_browsers run at once, the others queue, and a free process goes to the worker which
+    has the fewest browsers, then to the oldest request, so no worker starves the others
+    demo：
+    grid = local_grid()                  # controller
+    connect_local_grid(grid.address, grid.authkey)   # worker
+    driver = webdriver.Chrome(service=grid_client().lease('chrome', LINUX_CHROMEDRIVER), options=option)
+    grid.stats      {'max_browsers': 8, 'active': 3, 'granted': 40, 'waits': 12, 'wait_avg_ms': 850.2, ...}
+    """
+
+    class _Slot:
+        __slots__ = ('key', 'service', 'busy')
+
+        def __init__(self, key: tuple):
+            self.key = key  # (browser, executable)
+            self.service = None
+            self.busy = False
+
+        @property
+        def alive(self) -> bool:
+            return self.service is not None and self.service.process is not None \
+                and self.service.process.poll() is None
+
+    def __init__(self, max_browsers: int = None, timeout: float = None, service_factory=None):
+        web_ui = setting.WEB_UI
+        self.max_browsers = max_browsers or web_ui.WEB_GRID_MAX_BROWSERS or grid_capacity()
+        self.timeout = timeout if timeout is not None else web_ui.WEB_GRID_TIMEOUT
+        # (browser, executable) -> driver service which is not started yet
+        self.service_factory = service_factory or DriverServices.new_service
+        self.authkey = os.urandom(16)
+        self.address = None
+        self._listener = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._slots = []
+        self._waiting = []  # [worker, since] of the queued requests
+        self._active = dict()  # worker -> browsers
+        self.granted = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.starts = 0
+        self.restarts = 0
+        self.max_active = 0
+
+    def start(self) -> tuple:
+        """
+        listen on a free local port
+        :return: address (host, port)
+        """
+        from multiprocessing.connection import Listener
+        self._listener = Listener(('127.0.0.1', 0), authkey=self.authkey)
+        self.address = self._listener.address
+        threading.Thread(target=self._serve, name='local-grid', daemon=True).start()
+        logger.info(f'local grid: {self.address}, max browsers: {self.max_browsers}')
+        return self.address
+
+    def _serve(self) -> None:
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._closed:
+                    return
+                logger.warning(f'local grid refused a connection. error: {e}')
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn) -> None:
+        """
+        one session of a worker: the driver process is granted, then held until the worker releases it or
+        its connection drops
+        :param conn: Connection
+        :return:
+        """
+        try:
+            _, worker, browser, executable = conn.recv()
+            slot = self._grant(worker, (browser, executable))
+            if slot is None:
+                conn.send(None)
+                return
+            try:
+                conn.send(slot.service.service_url)
+                conn.recv()  # release, or EOFError when the worker is gone
+            except (EOFError, OSError):
+                pass
+            finally:
+                self._release(worker, slot)
         except Exception as e:
-            logger.error(f'url: {url} is not available. error: {e}')
+            if not self._closed:
+                logger.warning(f'local grid request failed. error: {e}')
+            try:
+                conn.send(None)
+            except (EOFError, OSError):
+                pass
+        finally:
+            conn.close()
+
+    def _next(self) -> list:
+        # fewest browsers first, then the oldest request
+        return min(self._waiting, key=lambda request: (self._active.get(request[0], 0), request[1]))
+
+    def _take(self, key: tuple):
+        """
+        an idle driver process of key, a new one while below max_browsers, or an idle one of another driver
+        :return: (slot, service to stop) or (None, None)
+        """
+        idle = [slot for slot in self._slots if not slot.busy]
+        slot = next((slot for slot in idle if slot.key == key), None)
+        if slot is None and len(self._slots) < self.max_browsers:
+            slot = self._Slot(key)
+            self._slots.append(slot)
+        old = None
+        if slot is None and idle:
+            slot = idle[0]
+            old, slot.key, slot.service = slot.service, key, None
+        if slot is not None:
+            slot.busy = True
+        return slot, old
+
+    def _grant(self, worker: str, key: tuple):
+        """
+        wait for a driver process of key, started or restarted as needed
+        :return: _Slot, None after timeout
+        """
+        request = [worker, time.perf_counter()]
+        deadline = request[1] + self.timeout
+        with self._cond:
+            self._waiting.append(request)
+            waited = False
+            try:
+                while True:
+                    if self._next() is request:
+                        slot, old = self._take(key)
+                        if slot is not None:
+                            break
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or self._closed:
+                        self.timeouts += 1
+                        logger.error(f'local grid: no browser for {worker} within {self.timeout}s')
+                        return None
+                    waited = True
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(request)
+                self._cond.notify_all()
+            self._active[worker] = self._active.get(worker, 0) + 1
+            self.granted += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - request[1]
+            self.max_active = max(self.max_active, sum(self._active.values()))
+
+        if old is not None:
+            old.stop()
+        if not slot.alive:
+            if slot.service is not None:
+                logger.warning(f'local grid: {key[0]} driver process died, restart it')
+                self.restarts += 1
+            try:
+                slot.service = self.service_factory(*key)
+                slot.service.start()
+                self.starts += 1
+            except Exception:
+                self._release(worker, slot)
+                raise
+        return slot
+
+    def _release(self, worker: str, slot: _Slot) -> None:
+        with self._cond:
+            slot.busy = False
+            self._active[worker] = max(self._active.get(worker, 1) - 1, 0)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """
+        stop listening and stop the driver processes
+        :return:
+        """
+        with self._cond:
+            self._closed = True
+            slots, self._slots = self._slots, []
+            self._cond.notify_all()
+        if self._listener is not None:
+            self._listener.close()
+        for slot in slots:
+            if slot.service is not None:
+                try:
+                    slot.service.stop()
+                except Exception as e:
+                    logger.warning(f'local grid: driver process did not shut down, kill it. error: {e}')
+                    if slot.alive:
+                        slot.service.process.kill()
+
+    @property
+    def stats(self) -> dict:
+        with self._cond:
+            return {'max_browsers': self.max_browsers, 'active': sum(self._active.values()),
+                    'max_active': self.max_active, 'queued': len(self._waiting), 'granted': self.granted,
+                    'waits': self.waits, 'timeouts': self.timeouts,
+                    'wait_avg_ms': round(self.wait_time / self.waits * 1000, 1) if self.waits else 0.0,
+                    'starts': self.starts, 'restarts': self.restarts, 'workers': dict(self._active)}
+
+
+class _GridLease:
+    """
+    a driver process of the local grid handed to one session, driver.quit gives it back to the grid
+    """
+
+    def __init__(self, conn, service_url: str):
+        self._conn = conn
+        self.service_url = service_url
+        self.process = None
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                conn.send(('release',))
+            except (EOFError, OSError):
+                pass
+            conn.close()
+
+
+class GridClient:
+    """
+    the side of a worker: asks the local grid for a driver process per session
+    """
+
+    def __init__(self, address: tuple, authkey: bytes, worker: str = None):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.worker = worker or os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+    def lease(self, browser: str, executable: str, log_path: str = None) -> _GridLease:
+        """
+        block until the grid grants a driver process
+        :param browser: chrome / firefox
+        :param executable: driver path
+        :param log_path: unused, the grid owns the driver processes
+        :return: _GridLease
+        """
+        from multiprocessing.connection import Client
+        conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send(('acquire', self.worker, browser, executable))
+            service_url = conn.recv()
+        except (EOFError, OSError):
+            service_url = None
+        if service_url is None:
+            conn.close()
+            raise ErrorException(f'local grid: {self.address} granted no {browser}, see the grid log')
+        return _GridLease(conn, service_url)
+
+
+_LOCAL_GRID = None
+_GRID_CLIENT = None
+
+
+def local_grid(start: bool = True) -> LocalGrid:
+    """
+    local grid of this host, started by the first call
+    :param start: start it if it is not running, else return None
+    :return: LocalGrid
+    """
+    global _LOCAL_GRID
+    if _LOCAL_GRID is None and start:
+        _LOCAL_GRID = LocalGrid()
+        _LOCAL_GRID.start()
+    return _LOCAL_GRID
+
+
+def close_local_grid() -> None:
+    """
+    stop the local grid and log its stats, nothing to do if it was never started
+    :return:
+    """
+    global _LOCAL_GRID
+    if _LOCAL_GRID is not None:
+        _LOCAL_GRID.close()
+        logger.info(f'local grid: {_LOCAL_GRID.stats}')
+        _LOCAL_GRID = None
+
+
+def connect_local_grid(address: tuple, authkey: bytes) -> GridClient:
+    """
+    local sessions of the current process are started through the local grid at address
+    :param address: (host, port)
+    :param authkey: key of the grid
+    :return: GridClient
+    """
+    global _GRID_CLIENT
+    _GRID_CLIENT = GridClient(address, authkey)
+    return _GRID_CLIENT
+
+
+def grid_client():
+    """
+    client of the local grid, None when the process is not connected to one
+    :return: GridClient
+    """
+    return _GRID_CLIENT
+
+
+# built-in browser launch profiles, extended by the WEB_PROFILES section of setting.yaml
+LAUNCH_PROFILES = {
+    'default': {  # the browser as it is
+        'page_load_strategy': 'normal',
+        'disable_images': False,
+        'disable_fonts': False,
+        'disable_extensions': False,
+        'disable_background_networking': False,
+        'blocked_urls': [],
+        'disk_cache_dir': '',
+    },
+    'fast': {  # loads less of the page, for steps which do not depend on images, fonts or third party scripts
+        'page_load_strategy': 'eager',
+        'disable_images': True,
+        'disable_fonts': True,
+        'disable_extensions': True,
+        'disable_background_networking': True,
+        'blocked_urls': [],
+        'disk_cache_dir': os.path.join('result', 'browser_cache'),
+    },
+    'fidelity': {  # the page as a user sees it, for screenshots and visual checks
+        'page_load_strategy': 'normal',
+        'disable_images': False,
+        'disable_fonts': False,
+        'disable_extensions': True,
+        'disable_background_networking': True,
+        'blocked_urls': [],
+        'disk_cache_dir': os.path.join('result', 'browser_cache'),
+    },
+}
+
+FONT_URLS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']
+
+
+def execute_cdp(driver: T, cmd: str, params: dict) -> dict:
+    """
+    run a chrome devtools command on a local or a remote (cluster) chromium session, the hub forwards the cdp
+    endpoint of chromedriver to the node
+    :param driver: driver
+    :param cmd: command, eg: Network.setBlockedURLs
+    :param params: params of the command
+    :return: dict
+    """
+    if hasattr(driver, 'execute_cdp_cmd'):
+        return driver.execute_cdp_cmd(cmd, params)
+    driver.command_executor._commands.setdefault('executeCdpCommand',
+                                                 ('POST', '/session/$sessionId/goog/cdp/execute'))
+    return driver.execute('executeCdpCommand', {'cmd': cmd, 'params': params})['value']
+
+
+def launch_profile(name: str = None) -> dict:
+    """
+    launch profile by name, the profile of setting.yaml is merged over the built-in one and the default profile
+    :param name: profile name, default WEB_LAUNCH_PROFILE
+    :return: dict
+    """
+    name = name or setting.WEB_UI.WEB_LAUNCH_PROFILE
+    custom = (setting.section('WEB_PROFILES') or {}).get(name) or {}
+    if name not in LAUNCH_PROFILES and not custom:
+        raise ErrorException(f'launch profile: {name} does not exist, only {list(LAUNCH_PROFILES)} and WEB_PROFILES')
+    profile = dict(LAUNCH_PROFILES['default'])
+    profile.update(LAUNCH_PROFILES.get(name, {}))
+    profile.update(custom)
+    return profile
+
+
+class WebInit:
+    """
+    return browser driver
+    """
+
+    def __init__(self, profile: str = None):
+        self.browser = setting.WEB_UI.WEB_BROWSER.lower()
+        self.baseurl = setting.WEB_UI.WEB_URL
+        self.profile = launch_profile(profile)
+
+    @staticmethod
+    def inspect_url_code(url: str) -> bool:
+        """
+        check if the url is available, cached by the health check of the process
+        """
+        return health_check().check(url)
 
     @property
     def url(self) -> str:
@@ -88,7 +1037,7 @@ class WebInit:
         options.add_argument('--headless')
         options.add_argument('--disable-gpu')
         options.add_argument('window-size=1200x600')
-        return options
+        return self.profile_args(options)
 
     @property
     def linux_chrome_args(self) -> T:
@@ -103,7 +1052,69 @@ class WebInit:
         # so it has to add the headless option
         option.add_argument('--disable-gpu')  # it is mentioned in google doc
         option.add_argument('window-size=1920x1080')  # set screen resolution
-        return option
+        return self.profile_args(option)
+
+    def profile_args(self, options: T) -> T:
+        """
+        apply the launch profile to chrome or firefox options
+        :param options: ChromeOptions / FirefoxOptions
+        :return: options
+        """
+        profile = self.profile
+        options.page_load_strategy = profile.get('page_load_strategy') or 'normal'
+        cache_dir = profile.get('disk_cache_dir')
+        if cache_dir:  # persistent and shared between runs, one per xdist worker
+            cache_dir = os.path.join(BASE_DIR, cache_dir, os.environ.get('PYTEST_XDIST_WORKER', 'main'))
+            os.makedirs(cache_dir, exist_ok=True)
+
+        if isinstance(options, webdriver.ChromeOptions):
+            prefs = dict()
+            if profile.get('disable_images'):
+                prefs['profile.managed_default_content_settings.images'] = 2
+            if prefs:
+                options.add_experimental_option('prefs', prefs)
+            if profile.get('disable_extensions'):
+                options.add_argument('--disable-extensions')
+            if profile.get('disable_background_networking'):
+                options.add_argument('--disable-background-networking')
+                options.add_argument('--disable-component-update')
+                options.add_argument('--disable-sync')
+            if cache_dir:
+                options.add_argument(f'--disk-cache-dir={cache_dir}')
+
+        elif isinstance(options, webdriver.FirefoxOptions):
+            if profile.get('disable_images'):
+                options.set_preference('permissions.default.image', 2)
+            if profile.get('disable_fonts'):
+                options.set_preference('browser.display.use_document_fonts', 0)
+            if profile.get('disable_extensions'):
+                options.set_preference('extensions.enabledScopes', 0)
+            if profile.get('disable_background_networking'):
+                options.set_preference('network.prefetch-next', False)
+                options.set_preference('network.dns.disablePrefetch', True)
+                options.set_preference('network.http.speculative-parallel-limit', 0)
+                options.set_preference('app.update.auto', False)
+            if cache_dir:
+                options.set_preference('browser.cache.disk.parent_directory', cache_dir)
+        return options
+
+    def profile_setup(self, driver: T) -> T:
+        """
+        apply the part of the launch profile which needs a running browser: url blocking through CDP (chromium),
+        for local and cluster sessions alike. firefox disables the fonts with a preference instead
+        :param driver: driver
+        :return: driver
+        """
+        blocked = list(self.profile.get('blocked_urls') or [])
+        if self.profile.get('disable_fonts') and self.browser != 'firefox':
+            blocked += FONT_URLS
+        if blocked:
+            try:
+                execute_cdp(driver, 'Network.enable', {})
+                execute_cdp(driver, 'Network.setBlockedURLs', {'urls': blocked})
+            except Exception as e:
+                logger.warning(f'url blocking of the launch profile is not supported by {self.browser}. error: {e}')
+        return driver
 
     @property
     def enable(self) -> T:
@@ -111,31 +1122,61 @@ class WebInit:
         use cluster mode to start the driver when WEB_IS_COLONY is enabled
         :return:
         """
-        if WEB_IS_COLONY:
+        if setting.WEB_UI.WEB_IS_COLONY:
             return self.setups()
         else:
             return self.setup()
 
+    @staticmethod
+    def service(browser: str, executable: str, log_path: str = None) -> T:
+        """
+        driver service of a local session: a driver process of the local grid when the worker is connected to
+        one, else shared by the sessions of the worker when WEB_SERVICE_REUSE is on
+        :param browser: chrome / firefox
+        :param executable: driver path
+        :param log_path: driver log file
+        :return: Service
+        """
+        if grid_client() is not None:
+            return grid_client().lease(browser, executable, log_path)
+        if setting.WEB_UI.WEB_SERVICE_REUSE:
+            return driver_services().lease(browser, executable, log_path)
+        return DriverServices.new_service(browser, executable, log_path)
+
     def browser_setup_args(self, driver: T) -> T:
         """
         setting params for standalone browser
         :param driver: driver launches browser
         :return:
         """
+        self.profile_setup(driver)
         driver.maximize_window()
         driver.get(self.url)
         return driver
 
+    def remote_options(self) -> T:
+        """
+        options of a cluster session with the launch profile, None for the browsers without options
+        :return: ChromeOptions / FirefoxOptions or None
+        """
+        if self.browser == 'chrome':
+            return self.profile_args(webdriver.ChromeOptions())
+        if self.browser == 'firefox':
+            return self.profile_args(webdriver.FirefoxOptions())
+        return None
+
     def browaer_setups_args(self, descap: str, option=None) -> T:
         """
-        setting params for cluster mode of browser
+        setting params for cluster mode of browser, the launch profile is applied as for a local session
         :param descap: launch params
-        :param option: params of browser
+        :param option: params of browser, default the options of the launch profile
         :return:
         """
-        driver = webdriver.Remote(command_executor='http://' + WEB_HUB_HOST + '/wd/hub',
-                                  desired_capabilities=descap, options=option)
-        driver.find_element()
+        option = option if option is not None else self.remote_options()
+        driver = hub_dispatcher().create(
+            lambda hub: webdriver.Remote(command_executor='http://' + hub + '/wd/hub',
+                                         desired_capabilities=descap, options=option))
+        self.profile_setup(driver)
         driver.maximize_window()
         driver.get(self.url)
         return driver
@@ -155,14 +1196,14 @@ class WebInit:
 
                     if self.browser == 'chrome':  # chrome
                         option = self.linux_chrome_args
-                        driver = webdriver.Chrome(executable_path=LINUX_CHROMEDRIVER, options=option)
-                        return self.browaer_setup_args(driver)
+                        driver = webdriver.Chrome(service=self.service('chrome', LINUX_CHROMEDRIVER), options=option)
+                        return self.browser_setup_args(driver)
 
                     elif self.browser == 'firefox':  # firefox
                         options = self.linux_firefox_args
-                        driver = webdriver.Firefox(executable_path=LINUX_FIREFOXDRIVER, options=options,
-                                                   service_log_path=log_path)
-                        drivers = self.browaer_setup_args(driver)
+                        driver = webdriver.Firefox(service=self.service('firefox', LINUX_FIREFOXDRIVER, log_path),
+                                                   options=options)
+                        drivers = self.browser_setup_args(driver)
                         return drivers  # depends on Display when launch the firefox in Linux system
 
                     else:
@@ -172,11 +1213,13 @@ class WebInit:
 
                     if self.browser == 'chrome':
 
-                        driver = webdriver.Chrome(executable_path=MAC_CHROMEDRIVER)
+                        driver = webdriver.Chrome(service=self.service('chrome', MAC_CHROMEDRIVER),
+                                                  options=self.profile_args(webdriver.ChromeOptions()))
                         return self.browser_setup_args(driver)
 
                     elif self.browser == 'firefox':
-                        driver = webdriver.Firefox(executable_path=MAC_FIREFOXDRIVER, service_log_path=log_path)
+                        driver = webdriver.Firefox(service=self.service('firefox', MAC_FIREFOXDRIVER, log_path),
+                                                   options=self.profile_args(webdriver.FirefoxOptions()))
                         return self.browser_setup_args(driver)
 
                     elif self.browser == 'safari':
@@ -193,11 +1236,13 @@ class WebInit:
                         return self.browser_setup_args(driver)
 
                     if self.browser == 'chrome':
-                        driver = webdriver.Chrome(executable_path=WIN_CHROMEDRIVER)
+                        driver = webdriver.Chrome(service=self.service('chrome', WIN_CHROMEDRIVER),
+                                                  options=self.profile_args(webdriver.ChromeOptions()))
                         return self.browser_setup_args(driver)
 
                     elif self.browser == 'firefox':
-                        driver = webdriver.Firefox(executable_path=WIN_FIREFOXDRIVER, service_log_path=log_path)
+                        driver = webdriver.Firefox(service=self.service('firefox', WIN_FIREFOXDRIVER, log_path),
+                                                   options=self.profile_args(webdriver.FirefoxOptions()))
                         return self.browser_setup_args(driver, )
 
                     else:
@@ -218,8 +1263,10 @@ class WebInit:
         :return:
         """
         current_sys = sys.platform.lower()
+        hub_host = setting.WEB_UI.hub_hosts
         try:
-            if self.inspect_url_code(self.url) and self.inspect_url_code('http://' + WEB_HUB_HOST):  # if the url and cluster host are available
+            # if the url and one of the cluster hosts are available
+            if self.inspect_url_code(self.url) and any(self.inspect_url_code('http://' + hub) for hub in hub_host):
                 if current_sys == 'linux':  # linux
                     if self.browser == 'chrome':
                         option = self.linux_chrome_args
@@ -269,7 +1316,250 @@ class WebInit:
                     logger.error(f'current system: {current_sys} is not supported yet！')
 
             else:
-                logger.error(f'url: {self.url} or cluster host: {WEB_HUB_HOST} is not available！！！')
+                logger.error(f'url: {self.url} or cluster host: {hub_host} is not available！！！')
 
         except SessionNotCreatedException:
-            logger.error('the current browser version and driver do not match, pls update the driver or chrome')
\ No newline at end of file
+            logger.error('the current browser version and driver do not match, pls update the driver or chrome')
+
+
+class SessionPool:
+    """
+    pool of warm browser sessions of the current worker, built on WebInit
+    a session is reset between tests (extra windows, cookies, storage, back to WEB_URL) instead of quitting it,
+    and retired after max_uses tests or after a failed test
+    sessions are launched by background threads: prewarm starts several at once when the worker starts, and
+    the pool keeps standby sessions ready as tests take them, so a test only launches a browser itself when
+    none is ready or on the way
+    demo：
+    pool = session_pool()
+    pool.prewarm(2)
+    driver = pool.acquire()
+    pool.release(driver, failed=False)
+    pool.stats      {'acquired': 10, 'hits': 9, 'waits': 1, 'misses': 0, 'hit_rate': 0.9, ...}
+    """
+
+    def __init__(self, factory=None, max_uses: int = None, url: str = None, standby: int = None,
+                 launch_wait: float = None):
+        web_ui = setting.WEB_UI
+        self.factory = factory if factory is not None else lambda: WebInit().enable
+        self.max_uses = max_uses if max_uses is not None else web_ui.WEB_SESSION_MAX_USES
+        self.url = url if url is not None else web_ui.WEB_URL
+        self.standby = standby if standby is not None else web_ui.WEB_SESSION_STANDBY
+        self.launch_wait = launch_wait if launch_wait is not None else web_ui.WEB_SESSION_LAUNCH_WAIT
+        self._cond = threading.Condition()
+        self._idle = []
+        self._uses = dict()  # id(driver) -> count of tests
+        self._launching = 0
+        self._closed = False
+        self.acquired = 0
+        self.hits = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.misses = 0
+        self.launched = 0
+        self.retired = 0
+        self.resets = 0
+        self.reset_time = 0.0
+        self.reset_max = 0.0
+
+    def launch(self) -> T:
+        """
+        launch a new session
+        :return: driver
+        """
+        driver = self.factory()
+        if driver is None:
+            raise ErrorException('the browser can not be launched, see the error log')
+        with self._cond:
+            self._uses[id(driver)] = 0
+            self.launched += 1
+        return driver
+
+    def _launch_background(self) -> None:
+        """
+        launch a session in a background thread and put it on standby
+        :return:
+        """
+        driver = None
+        try:
+            driver = self.launch()
+        except Exception as e:
+            logger.error(f'launch the browser in background failed. error: {e}')
+        with self._cond:
+            self._launching -= 1
+            closed = self._closed
+            if driver is not None and not closed:
+                self._idle.append(driver)
+            self._cond.notify_all()
+        if driver is not None and closed:
+            self.retire(driver)
+
+    def prewarm(self, count: int = None) -> None:
+        """
+        launch sessions concurrently in background until count sessions are ready or on the way
+        :param count: ready sessions wanted, default standby
+        :return:
+        """
+        count = self.standby if count is None else count
+        with self._cond:
+            if self._closed:
+                return
+            missing = max(count - len(self._idle) - self._launching, 0)
+            self._launching += missing
+        for _ in range(missing):
+            threading.Thread(target=self._launch_background, name='session-prewarm', daemon=True).start()
+
+    def acquire(self) -> T:
+        """
+        return a warm session, wait up to launch_wait for a session launched in background, or launch one if
+        there is none
+        :return: driver
+        """
+        with self._cond:
+            self.acquired += 1
+            if not self._idle and self._launching:
+                self.waits += 1
+                start = time.perf_counter()
+                deadline = time.monotonic() + self.launch_wait
+                while not self._idle and self._launching and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                self.wait_time += time.perf_counter() - start
+                if not self._idle and self._launching:
+                    logger.warning(f'no browser launched in background within {self.launch_wait}s, launch one')
+            elif self._idle:
+                self.hits += 1
+            driver = self._idle.pop() if self._idle else None
+            if driver is None:  # nothing ready, or the launch on the way is too slow
+                self.misses += 1
+
+        if driver is None:
+            driver = self.launch()
+        with self._cond:
+            self._uses[id(driver)] += 1
+        self.prewarm()  # keep the standby sessions
+        return driver
+
+    def reset(self, driver: T) -> None:
+        """
+        bring a session back to a clean state: one window, no cookies and storage, at WEB_URL
+        :param driver: driver
+        :return:
+        """
+        from common.web_base import element_cache
+
+        start = time.perf_counter()
+        element_cache(driver).clear()  # the elements belong to the page of the last test
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        try:
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})  # every domain, chromium only
+        except Exception:
+            pass
+        driver.delete_all_cookies()
+        try:
+            driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+        except Exception:
+            pass  # storage is not available on some pages, eg: about:blank
+        driver.get(self.url)
+
+        spent = time.perf_counter() - start
+        with self._cond:
+            self.resets += 1
+            self.reset_time += spent
+            self.reset_max = max(self.reset_max, spent)
+
+    def retire(self, driver: T) -> None:
+        """
+        quit a session
+        :param driver: driver
+        :return:
+        """
+        with self._cond:
+            self.retired += 1
+            self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f'quit the browser failed. error: {e}')
+
+    def release(self, driver: T, failed: bool = False) -> None:
+        """
+        give a session back after a test
+        :param driver: driver
+        :param failed: the test failed, the session is retired
+        :return:
+        """
+        with self._cond:
+            used_up = self._uses.get(id(driver), 0) >= self.max_uses
+        if failed or used_up:
+            self.retire(driver)
+            self.prewarm()  # the replacement is launched off the critical path
+            return
+        try:
+            self.reset(driver)
+        except Exception as e:
+            logger.warning(f'reset the browser failed, retire it. error: {e}')
+            self.retire(driver)
+            self.prewarm()
+            return
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify_all()
+
+    def close(self, timeout: float = 60) -> None:
+        """
+        quit all sessions, wait up to timeout for the sessions still launching so no browser is left behind
+        :param timeout: seconds
+        :return:
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            while self._launching and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self.retire(driver)
+
+    @property
+    def stats(self) -> dict:
+        """
+        hit rate, wait and reset latency of the pool
+        :return: dict
+        """
+        with self._cond:
+            return {'acquired': self.acquired, 'hits': self.hits, 'waits': self.waits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / self.acquired, 3) if self.acquired else 0.0,
+                    'wait_avg_ms': round(self.wait_time / self.waits * 1000, 1) if self.waits else 0.0,
+                    'launched': self.launched, 'retired': self.retired, 'resets': self.resets,
+                    'reset_avg_ms': round(self.reset_time / self.resets * 1000, 1) if self.resets else 0.0,
+                    'reset_max_ms': round(self.reset_max * 1000, 1)}
+
+
+_SESSION_POOL = None
+
+
+def session_pool() -> SessionPool:
+    """
+    session pool of the current process (xdist worker)
+    :return: SessionPool
+    """
+    global _SESSION_POOL
+    if _SESSION_POOL is None:
+        _SESSION_POOL = SessionPool()
+    return _SESSION_POOL
+
+
+def close_session_pool() -> None:
+    """
+    quit the sessions of the pool and log its stats, nothing to do if the pool was never used
+    :return:
+    """
+    global _SESSION_POOL
+    if _SESSION_POOL is not None:
+        _SESSION_POOL.close()
+        logger.info(f'session pool: {_SESSION_POOL.stats}')
+        _SESSION_POOL = None
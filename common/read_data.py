@@ -2,21 +2,53 @@
 # Date   : 9:26 pm - 5/10/22
 # File   : read_data.py
 
+import copy
+import hashlib
 import os
 import pickle
-from typing import List, Tuple
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Callable, List, Tuple, TypeVar
 
-import yaml
-from faker import Factory
-from xlrd import open_workbook
+from config import CASE_YMAL_DIR, LOCATOR_YMAL_DIR, RESULT_TEMP_DIR
+from common.common import ErrorException, load_yaml, logger, read_conf
 
-from config import CASE_YMAL_DIR, LOCATOR_YMAL_DIR
-from common.common import ErrorException, logger, read_conf
+T = TypeVar('T')
 
-fake = Factory().create('zh_CN')
+
+@lru_cache(maxsize=None)
+def get_fake(locale: str = 'zh_CN'):
+    """
+    faker instance of the locale, faker is only imported when random data is first needed
+    :param locale: faker locale
+    :return: Faker
+    """
+    from faker import Factory
+    return Factory().create(locale)
+
+
+def __getattr__(name: str):
+    # module attribute fake is kept for the former import path, built on first access
+    if name == 'fake':
+        return get_fake()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def worker_shard() -> Tuple[int, int]:
+    """
+    shard of the current pytest-xdist worker
+    :return: (worker index, worker count), (0, 1) when not running under xdist
+    """
+    worker = os.environ.get('PYTEST_XDIST_WORKER', 'gw0')
+    count = int(os.environ.get('PYTEST_XDIST_WORKER_COUNT', 1))
+    return int(worker.lstrip('gw') or 0), max(count, 1)
 
 
 # read data from excel
+EXCEL_CACHE_PREFIX = 'excel_cache_'
+
+
 class RedaExcel:
     """
     *xrld ==1.2.0
@@ -36,39 +68,381 @@ class RedaExcel:
     get data from an appointed sheet by the index or name of sheet:
     ExcelReader(excel, sheet=2)
     ExcelReader(excel, sheet='Test')
+
+    iterate rows lazily, only the chosen columns, rows and shard of the current xdist worker:
+    RedaExcel(excel).iter_rows(columns=['A', 'C'], start=0, stop=1000, shard=worker_shard())
+
+    the sheet is kept as a compact columnar form, cached in RESULT_TEMP_DIR by the content hash of the excel,
+    so the workbook is only opened again when the excel changed
     """
 
-    def __init__(self, excel: str, sheet: int or str = 0, line: bool = True):
+    def __init__(self, excel: str, sheet: int or str = 0, line: bool = True, cache_dir: str = RESULT_TEMP_DIR):
         if os.path.exists(excel):
             self.excel = excel
         else:
             raise FileNotFoundError(f'The excel: {excel} does not exist !!!')
+        if type(sheet) not in [int, str]:
+            raise ErrorException('Sheet Type Error!!!')
         self.sheet = sheet
         self.title_line = line
+        self.cache_dir = cache_dir
         self._data = list()
+        self._columnar = None
 
-    @property
-    def data(self):
-        if not self._data:
-            workbook = open_workbook(self.excel)
-
-            if type(self.sheet) not in [int, str]:
-                raise ErrorException('Sheet Type Error!!!')
-            elif type(self.sheet) == int:
+    def _read_columnar(self) -> Tuple[list, list]:
+        """
+        read the sheet from the workbook as columns
+        :return: (title, columns)
+        """
+        from xlrd import open_workbook
+        workbook = open_workbook(self.excel, on_demand=True)
+        try:
+            if type(self.sheet) == int:
                 s = workbook.sheet_by_index(self.sheet)
             else:
                 s = workbook.sheet_by_name(self.sheet)
 
             if self.title_line:
                 title = s.row_values(0)  # first line is the title
-                for col in range(1, s.nrows):  # traverse the remaining rows in turn, forming a dict with the first row
-                    self._data.append(dict(zip(title, s.row_values(col))))
+                first = 1
             else:
-                for col in range(0, s.nrows):  # return all rows with every row as a list
-                    self._data.append(s.row_values(col))
+                title = list(range(s.ncols))  # columns are named by index
+                first = 0
+            columns = [tuple(s.col_values(col, start_rowx=first)) for col in range(s.ncols)]
+        finally:
+            workbook.release_resources()
+        return title, columns
+
+    @property
+    def columnar(self) -> Tuple[list, list]:
+        """
+        compact columnar form of the sheet
+        :return: (title, columns)  columns[i] is the tuple of values under title[i]
+        """
+        if self._columnar is not None:
+            return self._columnar
+
+        with open(self.excel, 'rb') as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16)
+        digest.update(repr((self.sheet, self.title_line)).encode('utf-8'))
+        cache_file = os.path.join(self.cache_dir, f'{EXCEL_CACHE_PREFIX}{digest.hexdigest()}.pickle')
+
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    self._columnar = pickle.load(f)
+                return self._columnar
+            except Exception as e:
+                logger.warning(f'excel cache: {cache_file} is broken, rebuild it. error: {e}')
+
+        self._columnar = self._read_columnar()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = f'{cache_file}.{os.getpid()}.tmp'
+            with open(temp_file, 'wb') as f:
+                pickle.dump(self._columnar, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, cache_file)
+        except OSError as e:
+            logger.warning(f'write excel cache: {cache_file} failed. error: {e}')
+        return self._columnar
+
+    def iter_rows(self, columns: List = None, start: int = 0, stop: int = None,
+                  shard: Tuple[int, int] = None):
+        """
+        yield rows lazily
+        :param columns: titles (or column indexes if line=False) to keep, default all columns
+        :param start: first row, 0 is the first row under the title
+        :param stop: row to stop before, default the last row
+        :param shard: (index, count) only yield the rows with row % count == index, see worker_shard
+        :return: dict per row, list per row if line=False
+        """
+        title, data = self.columnar
+        if columns is None:
+            picked = list(range(len(title)))
+        else:
+            missing = [c for c in columns if c not in title]
+            if missing:
+                raise ErrorException(f'columns: {missing} do not exist in {self.excel}')
+            picked = [title.index(c) for c in columns]
+        names = [title[i] for i in picked]
+        picked_data = [data[i] for i in picked]
+
+        nrows = len(data[0]) if data else 0
+        stop = nrows if stop is None else min(stop, nrows)
+        index, count = shard if shard is not None else (0, 1)
+        first = start + (index - start) % count  # first row of the shard from start
+
+        for row in range(first, stop, count):
+            values = [column[row] for column in picked_data]
+            yield dict(zip(names, values)) if self.title_line else values
+
+    @property
+    def data(self):
+        if not self._data:
+            self._data = list(self.iter_rows())
         return self._data
 
 
+# cache of parsed yaml
+class YamlCache:
+    """
+    process-wide cache of parsed yaml documents, keyed by file path
+    an entry is reused as long as mtime and size of the file are unchanged,
+    when they changed the content hash decides whether the file is parsed again
+    demo：
+    yaml_cache.get(path, loader)   loader(raw bytes) -> parsed document
+    yaml_cache.stats               {'hits': 10, 'misses': 1, 'entries': 1}
+    """
+
+    class _Entry:
+        __slots__ = ('stat', 'digest', 'data', 'index')
+
+        def __init__(self, stat: tuple, digest: str, data):
+            self.stat = stat
+            self.digest = digest
+            self.data = data
+            self.index = None
+
+    def __init__(self):
+        self._entries = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_stat(path: str) -> tuple:
+        """
+        stat key of the file
+        :param path: file path
+        :return: (mtime_ns, size)
+        """
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _entry(self, path: str, loader: Callable, indexer: Callable = None):
+        """
+        return the up-to-date entry of path, parse the file again only when its content changed
+        :param path: file path
+        :param loader: function parsing the raw bytes of the file
+        :param indexer: function(path, document) building an index when the document is loaded
+        :return: _Entry
+        """
+        stat = self.file_stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.stat == stat:
+                self.hits += 1
+                return entry
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.digest == digest:  # touched but content unchanged
+                entry.stat = stat
+                self.hits += 1
+                return entry
+
+        data = loader(raw)
+        entry = self._Entry(stat, digest, data)
+        if indexer is not None:
+            entry.index = indexer(path, data)
+        with self._lock:
+            self._entries[path] = entry
+            self.misses += 1
+        return entry
+
+    def get(self, path: str, loader: Callable, indexer: Callable = None):
+        """
+        return the parsed document of path, parse it only when the file changed
+        :param path: file path
+        :param loader: function parsing the raw bytes of the file
+        :param indexer: function(path, document) building an index when the document is loaded
+        :return: parsed document
+        """
+        return self._entry(path, loader, indexer).data
+
+    def get_index(self, path: str, loader: Callable, indexer: Callable) -> dict:
+        """
+        return the index of the parsed document of path, built once per loaded document
+        :param path: file path
+        :param loader: function parsing the raw bytes of the file
+        :param indexer: function(path, document) building the index
+        :return: dict
+        """
+        entry = self._entry(path, loader, indexer)
+        if entry.index is None:  # loaded before by a caller without indexer
+            entry.index = indexer(path, entry.data)
+        return entry.index
+
+    def export(self) -> dict:
+        """
+        return all entries as plain data, used to persist the cache
+        :return: dict path -> (stat, digest, data)
+        """
+        with self._lock:
+            return {path: (entry.stat, entry.digest, entry.data) for path, entry in self._entries.items()}
+
+    def seed(self, entries: dict) -> None:
+        """
+        add entries exported by export, an entry is still checked against the file before it is used
+        :param entries: dict path -> (stat, digest, data)
+        :return:
+        """
+        with self._lock:
+            for path, (stat, digest, data) in entries.items():
+                self._entries[path] = self._Entry(stat, digest, data)
+
+    def invalidate(self, path: str = None) -> None:
+        """
+        drop the entry of path, or all entries when path is None
+        :param path: file path
+        :return:
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def reset_stats(self) -> None:
+        """
+        reset the hit/miss counters
+        :return:
+        """
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        hit/miss counters of the cache
+        :return: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+yaml_cache = YamlCache()
+
+
+def index_cases(path: str, document) -> dict:
+    """
+    build the case_name -> case record index of a yaml document, the first case wins on duplicate names
+    :param path: path of yaml file
+    :param document: parsed yaml document
+    :return: dict
+    """
+    index = dict()
+    if not isinstance(document, list):
+        return index
+    for record in document:
+        if not isinstance(record, dict) or record.get('case_name') is None:
+            continue
+        case_name = record.get('case_name')
+        if case_name in index:
+            logger.warning(f'duplicate case name: {case_name} in {path}, only the first one is used')
+            continue
+        index[case_name] = record
+    return index
+
+
+def own_copy(value: T) -> T:
+    """
+    copy of a cached value for the caller, the cached documents are shared by every test and are never changed
+    :param value: cached value
+    :return: deep copy of a dict or list, other values as they are
+    """
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+# precompiled data tree shared by all pytest workers
+DATA_CACHE_PREFIX = 'data_cache_'
+
+
+def data_yaml_files() -> List[str]:
+    """
+    return all yaml files of the case and locator data
+    :return: sorted list of path
+    """
+    files = []
+    for root in (CASE_YMAL_DIR, LOCATOR_YMAL_DIR):
+        for dirpath, _, filenames in os.walk(root):
+            files.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(('.yaml', '.yml')))
+    return sorted(files)
+
+
+def data_tree_digest(files: List[str]) -> str:
+    """
+    content hash of the data tree, it changes when any yaml file is added, removed or edited
+    :param files: yaml files
+    :return: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in files:
+        with open(path, 'rb') as f:
+            digest.update(path.encode('utf-8'))
+            digest.update(hashlib.blake2b(f.read(), digest_size=16).digest())
+    return digest.hexdigest()
+
+
+def load_data_cache(cache_dir: str = RESULT_TEMP_DIR) -> bool:
+    """
+    seed yaml_cache from the precompiled data tree in cache_dir, the first process of a run which finds no
+    up-to-date cache file parses the tree and writes it, the others only load it
+    a yaml which can not be parsed is logged and left out, it is loaded lazily and only the tests using it fail;
+    a cache dir which can not be read or written only means the run goes without the cache
+    :param cache_dir: dir of the cache file
+    :return: True if an existing cache file was loaded
+    """
+    try:
+        files = data_yaml_files()
+        cache_file = os.path.join(cache_dir, f'{DATA_CACHE_PREFIX}{data_tree_digest(files)}.pickle')
+    except OSError as e:
+        logger.warning(f'data cache: the data tree can not be read, no cache is used. error: {e}')
+        return False
+
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                yaml_cache.seed(pickle.load(f))
+            logger.debug(f'load data cache: {cache_file}')
+            return True
+        except Exception as e:
+            logger.warning(f'data cache: {cache_file} is broken, rebuild it. error: {e}')
+
+    parsed = set()
+    for path in files:
+        try:
+            yaml_cache.get(path, load_yaml)
+            parsed.add(path)
+        except Exception as e:
+            logger.error(f'data cache: {path} is left out, it can not be parsed. error: {e}')
+    entries = {path: entry for path, entry in yaml_cache.export().items() if path in parsed}
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in os.listdir(cache_dir):  # drop the caches of former data trees
+            if name.startswith(DATA_CACHE_PREFIX) and name.endswith('.pickle') \
+                    and name != os.path.basename(cache_file):
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except OSError:
+                    pass
+        temp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)  # atomic, workers never see a half written file
+    except Exception as e:
+        logger.warning(f'write data cache: {cache_file} failed, the run goes without it. error: {e}')
+        return False
+    logger.debug(f'build data cache: {cache_file}')
+    return False
+
+
 # read data from yaml
 class GetCaseYaml:
     """
@@ -96,27 +470,27 @@ class GetCaseYaml:
         else:  # return the locator path directly when there is no testcase name
             self.FLIE_PATH = os.path.join(LOCATOR_YMAL_DIR, f"{self.yaml_name}")
 
-    def open_yaml(self):
+    def shared_yaml(self):
         """
-        read yaml
+        the cached document itself, shared by every reader of the file: read only
         :return: dict
         """
         try:
-            with open(self.FLIE_PATH, encoding='utf-8') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
-                f.close()
-                return data
-        except UnicodeDecodeError:
-            with open(self.FLIE_PATH, encoding='GBK') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
-                f.close()
-                return data
+            return yaml_cache.get(self.FLIE_PATH, load_yaml)
         except Exception as e:
             logger.error(f'Error opening yaml file.error: {e}')
 
+    def open_yaml(self):
+        """
+        read yaml, the cached document shared by every reader of the file: read only,
+        case_record / get_param / get_set give a copy of the one record or value they return
+        :return: dict
+        """
+        return self.shared_yaml()
+
     def get_yaml(self):
         """
-        return data of yaml file
+        return data of yaml file, the records are shared with the cache: read only
         :return: dict
         """
         yaml_data = self.open_yaml()
@@ -126,16 +500,32 @@ class GetCaseYaml:
             logger.error('The yaml file is empty')
             raise 'The yaml file is empty'
 
+    def get_case_index(self) -> dict:
+        """
+        return the case_name -> case record index of the yaml file
+        :return: dict
+        """
+        try:
+            return yaml_cache.get_index(self.FLIE_PATH, load_yaml, index_cases)
+        except Exception as e:
+            logger.error(f'Error opening yaml file.error: {e}')
+            return dict()
+
+    def case_record(self) -> dict or None:
+        """
+        return the record of self.case_name
+        :return: dict
+        """
+        return self.get_case_index().get(self.case_name)
+
     def get_current_data(self):
         """
         return all data of the current column
         :return: dict
         """
-        yaml_list = self.get_yaml()
-        for yaml in yaml_list:
-            # return the current data if case name equals self.case_name
-            if yaml.get('case_name') == self.case_name:
-                return yaml
+        case = self.case_record()
+        if case is not None:
+            return own_copy(case)
         return "case name does not exist!!！"
 
     def count_test_data(self):
@@ -143,16 +533,14 @@ class GetCaseYaml:
         count the sum of yaml test data
         :return:
         """
-        yaml_list = self.get_yaml()
-        for yaml in yaml_list:
-            # return the current data if case name equals self.case_name
-            if yaml.get('case_name') == self.case_name:
-                try:
-                    testdata_len = len(yaml.get('testdata'))
+        case = self.case_record()
+        if case is not None:
+            try:
+                testdata_len = len(case.get('testdata'))
 
-                    return testdata_len
-                except Exception as e:
-                    logger.error(e)
+                return testdata_len
+            except Exception as e:
+                logger.error(e)
 
     def data_count(self):
         """
@@ -166,13 +554,12 @@ class GetCaseYaml:
         count of testing step
         :return:
         """
-        data_ist = self.get_yaml()
+        case_index = self.get_case_index()
 
-        if data_ist:
-            for data in data_ist:
-                # return the current data if case name equals self.case_name
-                if data.get('case_name') == self.case_name:
-                    return len(data.get('element'))
+        if case_index:
+            case = case_index.get(self.case_name)
+            if case is not None:
+                return len(case.get('element'))
         else:
             logger.error('test case does not exist, please check the yaml file')
             raise ErrorException('test case does not exist, please check the yaml file')
@@ -183,12 +570,9 @@ class GetCaseYaml:
         :param value:
         :return:
         """
-
-        yaml_list = self.get_yaml()
-        for yaml in yaml_list:
-            # return the current data if case name equals self.case_name
-            if yaml.get('case_name') == self.case_name:
-                return yaml.get(value)
+        case = self.case_record()
+        if case is not None:
+            return own_copy(case.get(value))
         return "case_name does not exist！"
 
     def get_set(self, index: int, vaule: str):
@@ -198,12 +582,10 @@ class GetCaseYaml:
         :param vaule:  value
         :return:
         """
-        data_list = self.get_yaml()
-        if index < self.step_count():
-            for data in data_list:
-                #
-                if data.get('case_name') == self.case_name:
-                    return data.get('element')[index].get(vaule)
+        case = self.case_record()
+        elements = case.get('element') if case is not None else None
+        if elements and index < len(elements):
+            return own_copy(elements[index].get(vaule))
         logger.error(f'there is only {self.step_count()} steps in {self.case_name}，but you typed in {index} steps！')
         return None
 
@@ -213,8 +595,8 @@ class GetCaseYaml:
         get model data
         :return: dict
         """
-        data = self.open_yaml()
-        return data[0].get('model')  #
+        data = self.shared_yaml()
+        return own_copy(data[0].get('model'))
 
     @property
     def title(self):
@@ -256,27 +638,22 @@ class GetCaseYaml:
         """
         return self.get_param('urlpath')
 
-    def test_data_values(self, ):
+    def test_data_values(self, shard: Tuple[int, int] = None):
         """
         get values of test data from yaml
+        :param shard: (index, count) only keep the rows whose stable hash belongs to the shard
         :return:  demo [('u1', 'p1', 'i1'), ('u2', 'p2', 'i2'), ('u3', 'p3', 'i3')]
         """
-
-        data_values_list = []
-
-        data_lists = self.get_yaml()
-
-        for data in data_lists:
-
-            if data.get('case_name') == self.case_name:
-                data_list = data.get('testdata')
-                if data_list is not None:
-                    for i in data_list:
-                        data_values_list.append(tuple(i.values()))
-                    return data_values_list
-                else:
-                    logger.info(f'there is no test data in current data: {data}')
-                    continue
+        case = self.case_record()
+        if case is not None:
+            data_list = case.get('testdata')
+            if data_list is not None:
+                if shard is None:
+                    return own_copy([tuple(i.values()) for i in data_list])
+                index, count = shard
+                rows = (tuple(i.values()) for i in data_list)
+                return own_copy([row for row in rows if stable_shard(row, count) == index])
+            logger.info(f'there is no test data in current data: {case}')
 
     def test_data_list(self, index: int, agrs: str) -> str:
         """
@@ -285,15 +662,11 @@ class GetCaseYaml:
         :param agrs: key
         :return:
         """
-        data_lists = self.get_yaml()
-
-        if index < self.dataCount():
+        count = self.data_count()
+        if count and index < count:
+            return own_copy(self.case_record().get('testdata')[index].get(agrs))
 
-            for data in data_lists:
-                if data.get('case_name') == self.case_name:
-                    return data.get('testdata')[index].get(agrs)
-
-        logger.error(f'there is only {self.step_count()} steps in {self.case_name}，but you typed in {index} steps！')
+        logger.error(f'there is only {self.data_count()} test data in {self.case_name}，but you typed in {index}！')
 
     def test_data(self):
         """
@@ -345,19 +718,217 @@ class GetCaseYaml:
         return self.get_set(index, 'info')
 
 
+# field -> generator, shared by RandomData and RandomPool
+RANDOM_FIELDS = {
+    'name': lambda fake: fake.name(),
+    'phone_number': lambda fake: fake.phone_number(),
+    'email': lambda fake: fake.email(),
+    'job': lambda fake: fake.job(),
+    'ssn': lambda fake: fake.ssn(min_age=18, max_age=90),
+    'company': lambda fake: fake.company(),
+    'city': lambda fake: fake.city_name(),
+    'province': lambda fake: fake.province(),
+    'country': lambda fake: fake.country(),
+    'address': lambda fake: fake.address(),
+    'time': lambda fake: fake.time(),
+    'year': lambda fake: (fake.month(), fake.month_name()),
+    'month': lambda fake: fake.month(),
+    'date_this_month': lambda fake: fake.date_time_this_month(before_now=True, after_now=False, tzinfo=None),
+    'date_this_decade': lambda fake: fake.date_time_this_year(before_now=True, after_now=False, tzinfo=None),
+    'date_time_this_century': lambda fake: fake.date_time_this_century(before_now=True, after_now=False, tzinfo=None),
+    'day_of_week': lambda fake: fake.day_of_week(),
+}
+
+# values of a field generated from one seed, the blocks of a field are dealt out to the workers in turn
+RANDOM_BLOCK = 64
+
+
+class RandomPool:
+    """
+    pools of pre-generated random data per field, built in batches
+    the values of a field are one stream of blocks of RANDOM_BLOCK values, block b is generated by a faker seeded
+    by (seed, field, b) and belongs to worker b % count. a worker only generates its own blocks, so the workers
+    never produce the same part of the stream, nothing is thrown away, and together they produce exactly the
+    values of a run with one process
+    a pool is refilled by a background thread once it drops below low_water
+    unique fields never repeat within a worker; across workers a value only repeats when the stream itself
+    repeats it, as it would in a run with one process
+    demo：
+    pool = RandomPool(seed=2022, size=1000, unique=('email', 'phone_number'))
+    pool.take('email')
+    pool.stats        {'generated': 2000, 'refills': 1, 'pools': {'email': 999}}
+    """
+
+    def __init__(self, seed: int = 0, size: int = 1000, low_water: int = None, locale: str = 'zh_CN',
+                 unique: Tuple = (), shard: Tuple[int, int] = None):
+        self.seed = seed
+        self.size = size
+        self.low_water = size // 4 if low_water is None else low_water
+        self.locale = locale
+        self.unique = set(unique)
+        self.index, self.count = shard if shard is not None else worker_shard()
+        self._lock = threading.Lock()
+        self._pools = dict()  # field -> deque of values
+        self._fill_locks = dict()  # field -> lock around the faker of the field
+        self._streams = dict()  # field -> generator of the blocks of this worker
+        self._seen = dict()  # field -> generated values of unique fields
+        self._refilling = set()
+        self.generated = 0
+        self.refills = 0
+
+    def _field(self, field: str):
+        """
+        return the pool and the fill lock of a field, created on first use
+        :param field: key of RANDOM_FIELDS
+        :return: (deque, Lock)
+        """
+        with self._lock:
+            if field not in self._pools:
+                if field not in RANDOM_FIELDS:
+                    raise ErrorException(f'random field: {field} is not supported, only {list(RANDOM_FIELDS)}')
+                self._pools[field] = deque()
+                self._fill_locks[field] = threading.Lock()
+            return self._pools[field], self._fill_locks[field]
+
+    def _stream(self, field: str):
+        """
+        values of the blocks of this worker: index, index + count, ..
+        :param field: key of RANDOM_FIELDS
+        :return: generator
+        """
+        from faker import Factory
+        fake = Factory().create(self.locale)
+        generate = RANDOM_FIELDS[field]
+        block = self.index
+        while True:
+            key = f'{self.seed}:{field}:{block}'.encode('utf-8')
+            fake.seed_instance(int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big'))
+            for _ in range(RANDOM_BLOCK):
+                yield generate(fake)
+            block += self.count
+
+    def _fill(self, field: str) -> None:
+        """
+        generate values until the pool of the field holds size values
+        :param field: key of RANDOM_FIELDS
+        :return:
+        """
+        values, fill_lock = self._field(field)
+        with fill_lock:
+            stream = self._streams.get(field)
+            if stream is None:
+                stream = self._streams[field] = self._stream(field)
+            unique = field in self.unique
+            seen = self._seen.setdefault(field, set()) if unique else None
+            attempts = (self.size - len(values)) * 20
+            batch = []
+            while len(values) + len(batch) < self.size and attempts > 0:
+                attempts -= 1
+                value = next(stream)
+                if unique:
+                    if value in seen:
+                        continue
+                    seen.add(value)
+                batch.append(value)
+            if len(values) + len(batch) < self.size:
+                logger.warning(f'random field: {field} is exhausted, the pool holds {len(values) + len(batch)} values')
+            values.extend(batch)
+            with self._lock:
+                if batch:
+                    self.generated += len(batch)
+                    self.refills += 1
+                self._refilling.discard(field)
+
+    def _refill_async(self, field: str) -> None:
+        """
+        refill the pool of the field in a background thread, at most one thread per field
+        :param field: key of RANDOM_FIELDS
+        :return:
+        """
+        with self._lock:
+            if field in self._refilling:
+                return
+            self._refilling.add(field)
+        threading.Thread(target=self._fill, args=(field,), name=f'random-pool-{field}', daemon=True).start()
+
+    def take(self, field: str) -> T:
+        """
+        one value of the field, generate a batch synchronously only when the pool is empty
+        :param field: key of RANDOM_FIELDS
+        :return:
+        """
+        values, _ = self._field(field)
+        while True:
+            try:
+                value = values.popleft()
+                break
+            except IndexError:
+                self._fill(field)
+                if not values:
+                    raise ErrorException(f'random field: {field} can not generate more values')
+        if len(values) < self.low_water:
+            self._refill_async(field)
+        return value
+
+    @property
+    def stats(self) -> dict:
+        """
+        counters of the pools
+        :return: dict
+        """
+        with self._lock:
+            return {'generated': self.generated, 'refills': self.refills,
+                    'pools': {field: len(values) for field, values in self._pools.items()}}
+
+
+@lru_cache(maxsize=None)
+def random_pool(seed: int = 0, size: int = 1000, locale: str = 'zh_CN') -> RandomPool:
+    """
+    shared RandomPool of the current process
+    :param seed: seed of the run
+    :param size: values per field
+    :param locale: faker locale
+    :return: RandomPool
+    """
+    return RandomPool(seed=seed, size=size, locale=locale)
+
+
 # faker random data
 class RandomData:
     """
     based on fake
+    pool mode takes the values from a RandomPool of the current xdist worker instead of calling faker per access:
+    RandomData(pool=True, seed=2022).random_name
     """
 
+    def __init__(self, pool: bool = False, seed: int = 0, size: int = 1000, locale: str = 'zh_CN'):
+        self.pool = random_pool(seed=seed, size=size, locale=locale) if pool else None
+
+    def take(self, field: str) -> T:
+        """
+        one value of the field
+        :param field: key of RANDOM_FIELDS
+        :return:
+        """
+        if self.pool is not None:
+            return self.pool.take(field)
+        return RANDOM_FIELDS[field](self.fake)
+
+    @property
+    def fake(self):
+        """
+        shared zh_CN faker instance
+        :return: Faker
+        """
+        return get_fake()
+
     @property
     def random_name(self):
         """
         name
         :return: str
         """
-        return fake.name()
+        return self.take('name')
 
     @property
     def random_phone_number(self):
@@ -365,7 +936,7 @@ class RandomData:
         phone number
         :return:  int
         """
-        return fake.phone_number()
+        return self.take('phone_number')
 
     @property
     def random_email(self):
@@ -373,7 +944,7 @@ class RandomData:
         email
         :return:
         """
-        return fake.email()
+        return self.take('email')
 
     @property
     def random_job(self):
@@ -381,7 +952,7 @@ class RandomData:
        job name
        :return:
        """
-        return fake.job()
+        return self.take('job')
 
     @property
     def random_ssn(self):
@@ -389,7 +960,7 @@ class RandomData:
        state name
        :return:
        """
-        return fake.ssn(min_age=18, max_age=90)
+        return self.take('ssn')
 
     @property
     def random_company(self):
@@ -397,7 +968,7 @@ class RandomData:
         company name
         :return:
         """
-        return fake.company()
+        return self.take('company')
 
     @property
     def random_city(self):
@@ -405,7 +976,7 @@ class RandomData:
         cite
         :return:  str
         """
-        return fake.city_name()
+        return self.take('city')
 
     @property
     def random_province(self):
@@ -413,7 +984,7 @@ class RandomData:
         province name
         :return:  str
         """
-        return fake.province()
+        return self.take('province')
 
     @property
     def random_country(self):
@@ -421,7 +992,7 @@ class RandomData:
         country name
         :return:  str
         """
-        return fake.country()
+        return self.take('country')
 
     @property
     def random_address(self):
@@ -429,7 +1000,7 @@ class RandomData:
         address name
         :return:  str
         """
-        return fake.address()
+        return self.take('address')
 
     @property
     def random_time(self):
@@ -437,7 +1008,7 @@ class RandomData:
         time 24H   22:00:00
         :return: str
         """
-        return fake.time()
+        return self.take('time')
 
     @property
     def random_year(self):
@@ -445,7 +1016,7 @@ class RandomData:
         year
         :return: str[0] - number month  str[1] - english  monthe
         """
-        return (fake.month(), fake.month_name())
+        return self.take('year')
 
     @property
     def random_month(self):
@@ -453,7 +1024,7 @@ class RandomData:
         month
         :return: str
         """
-        return fake.month()
+        return self.take('month')
 
     @property
     def random_date_this_month(self):
@@ -461,7 +1032,7 @@ class RandomData:
         local time of this month
         :return: str
         """
-        return fake.date_time_this_month(before_now=True, after_now=False, tzinfo=None)
+        return self.take('date_this_month')
 
     @property
     def random_date_this_decade(self):
@@ -469,7 +1040,7 @@ class RandomData:
         local time of this year
         :return: str
         """
-        return fake.date_time_this_year(before_now=True, after_now=False, tzinfo=None)
+        return self.take('date_this_decade')
 
     @property
     def random_date_time_this_century(self):
@@ -477,7 +1048,7 @@ class RandomData:
         local time of this centry
         :return: str
         """
-        return fake.date_time_this_century(before_now=True, after_now=False, tzinfo=None)
+        return self.take('date_time_this_century')
 
     @property
     def random_day_of_week(self):
@@ -485,7 +1056,7 @@ class RandomData:
         week
         :return:  str
         """
-        return fake.day_of_week()
+        return self.take('day_of_week')
 
     def random_date_of_birth(self, age):
         """
@@ -493,7 +1064,7 @@ class RandomData:
         :param age:  int  age range
         :return:  str
         """
-        return fake.date_of_birth(tzinfo=None, minimum_age=0, maximum_age=age)
+        return self.fake.date_of_birth(tzinfo=None, minimum_age=0, maximum_age=age)
 
 
 def replace_py_yaml(file):
@@ -505,18 +1076,99 @@ def replace_py_yaml(file):
     return os.path.basename(file).replace('py', 'yaml')
 
 
+class DataRows(list):
+    """
+    rows returned by read_pytest_data, shard is the (index, count) they were sharded by or None
+    the conftest leaves the tests parametrized with sharded rows to that sharding instead of sharding them again
+    """
+
+    def __init__(self, rows, shard: Tuple[int, int] = None):
+        super().__init__(rows)
+        self.shard = shard
+
+
+def data_shard(config: T) -> Tuple[int, int] or None:
+    """
+    shard of the rows and tests this pytest process collects: its xdist worker under `pytest -n N --dist each`
+    with DATA_SHARD on, which the controller passes in config.workerinput, else None for every row
+    :param config: pytest config
+    :return: (worker index, worker count) or None
+    """
+    workerinput = getattr(config, 'workerinput', {})
+    if not workerinput.get('data_shard'):
+        return None
+    return int(workerinput['workerid'].lstrip('gw') or 0), max(int(workerinput['workercount']), 1)
+
+
+def shard_items(items: list, shard: Tuple[int, int]) -> Tuple[list, list]:
+    """
+    split the collected tests of a shard: a test parametrized with rows of read_pytest_data or by the testdata
+    mark, sharded already, is kept, any other test is kept when the stable hash of its node id belongs to the shard
+    :param items: collected pytest items
+    :param shard: (index, count)
+    :return: (selected, deselected)
+    """
+    index, count = shard
+    selected, deselected = [], []
+    for item in items:
+        if data_sharded(item) or stable_shard(item.nodeid, count) == index:
+            selected.append(item)
+        else:
+            deselected.append(item)
+    return selected, deselected
+
+
+def data_sharded(item: T) -> bool:
+    """
+    the test is parametrized with rows which read_pytest_data sharded, the rows of the testdata mark are read with
+    the shard of the run
+    :param item: pytest item
+    :return: bool
+    """
+    if next(item.iter_markers('testdata'), None) is not None:
+        return True
+    for mark in item.iter_markers('parametrize'):
+        rows = mark.args[1] if len(mark.args) > 1 else mark.kwargs.get('argvalues')
+        if isinstance(rows, DataRows) and rows.shard is not None:
+            return True
+    return False
+
+
+def stable_shard(value: T, count: int) -> int:
+    """
+    shard index of a value, stable across processes and runs
+    :param value: row or node id
+    :param count: count of shards
+    :return: int
+    """
+    return int.from_bytes(hashlib.blake2b(repr(value).encode('utf-8'), digest_size=8).digest(), 'big') % count
+
+
 # get test data (tuple) WEB
-def read_pytest_data(yaml_name: str, case_name: str, ) -> List or Tuple:
+def read_pytest_data(yaml_name: str, case_name: str, shard: Tuple[int, int] = None) -> List or Tuple:
     """
     * pytest.mark.parametrize()  * only used in pytest architecture
-    *
+    * with a shard only the rows whose stable hash belongs to it are returned, eg data_shard(config) of the
+    * xdist worker, so every worker only collects the rows it runs, see the testdata mark in testcase/conftest.py
     :param yaml_name: yaml name
     :param case_name:   testcase data
+    :param shard: (index, count), None returns every row
     :return:
     """
     yaml = replace_py_yaml(yaml_name)
-    testdata = GetCaseYaml(yaml, case_name).test_data_values()
-    return testdata
+    testdata = GetCaseYaml(yaml, case_name).test_data_values(shard=shard)
+    return DataRows(testdata, shard) if testdata is not None else testdata
+
+
+def read_table_data(yaml_name: str, case_name: str) -> dict:
+    """
+    expected table of a case: columns, rows and the optional tolerance, ordered, key and compare
+    :param yaml_name: yaml name
+    :param case_name: testcase data
+    :return: dict
+    """
+    yaml = replace_py_yaml(yaml_name)
+    return GetCaseYaml(yaml, case_name).get_param('table')
 
 
 #  get testing data of http
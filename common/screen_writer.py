@@ -0,0 +1,226 @@
+import os
+import queue
+import threading
+import time
+
+from common.common import logger, setting
+
+# file extension of the screenshot formats, the report always gets the png
+SCREEN_FORMATS = {'png': '.png', 'jpg': '.jpg', 'jpeg': '.jpg', 'webp': '.webp'}
+
+
+class ScreenWriter:
+    """
+    background writer of the screenshots: the test thread captures the png once and goes on, a daemon thread
+    re-encodes it (jpg / webp with opencv, optional) and writes the file
+    the queue is bounded, a test waits when it is full instead of holding every screenshot in memory
+    demo：
+    writer = screen_writer()
+    writer.submit(filepath, driver.get_screenshot_as_png(), capture_time)
+    writer.flush()
+    writer.stats     {'captures': 3, 'capture_avg_ms': 84.1, 'queue_max': 2, 'written': 3, ...}
+    """
+
+    def __init__(self, fmt: str = None, quality: int = None, queue_size: int = None):
+        web_ui = setting.WEB_UI
+        fmt = str(fmt or web_ui.WEB_SCREEN_FORMAT).lower()
+        if fmt not in SCREEN_FORMATS:
+            logger.warning(f'unknown screenshot format {fmt}, png is used')
+            fmt = 'png'
+        if fmt != 'png' and self._cv2() is None:
+            logger.warning(f'opencv is not installed, screenshots are saved as png instead of {fmt}')
+            fmt = 'png'
+        self.format = 'jpg' if fmt == 'jpeg' else fmt
+        self.quality = int(quality if quality is not None else web_ui.WEB_SCREEN_QUALITY)
+        size = queue_size if queue_size is not None else web_ui.WEB_SCREEN_QUEUE
+        self._queue = queue.Queue(maxsize=size) if size > 0 else None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.captures = 0
+        self.capture_time = 0.0
+        self.capture_max = 0.0
+        self.queue_max = 0
+        self.blocked = 0
+        self.block_time = 0.0
+        self.written = 0
+        self.failed = 0
+        self.write_time = 0.0
+        self.bytes = 0
+
+    @staticmethod
+    def _cv2():
+        try:
+            import cv2  # only jpg / webp need it
+            return cv2
+        except ImportError:
+            return None
+
+    @property
+    def extension(self) -> str:
+        """
+        extension of the screenshot files
+        :return: str
+        """
+        return SCREEN_FORMATS[self.format]
+
+    def submit(self, filepath: str, png: bytes, capture_time: float = 0.0) -> None:
+        """
+        hand a captured png to the writer, it is written in the test thread when the queue is off
+        :param filepath: file of the screenshot
+        :param png: bytes of get_screenshot_as_png
+        :param capture_time: time of the capture: s
+        :return:
+        """
+        with self._lock:
+            self.captures += 1
+            self.capture_time += capture_time
+            self.capture_max = max(self.capture_max, capture_time)
+        if self._queue is None:
+            self.write(filepath, png)
+            return
+        self._start()
+        try:
+            self._queue.put_nowait((filepath, png))
+        except queue.Full:  # the writer is behind, wait for a free slot
+            start = time.perf_counter()
+            self._queue.put((filepath, png))
+            with self._lock:
+                self.blocked += 1
+                self.block_time += time.perf_counter() - start
+        with self._lock:
+            self.queue_max = max(self.queue_max, self._queue.qsize())
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='screen-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self.write(*item)
+            finally:
+                self._queue.task_done()
+
+    def encode(self, png: bytes) -> bytes:
+        """
+        png bytes in the format of the writer
+        :param png: bytes
+        :return: bytes
+        """
+        if self.format == 'png':
+            return png
+        import numpy as np
+        cv2 = self._cv2()
+        image = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_COLOR)
+        flag = cv2.IMWRITE_JPEG_QUALITY if self.format == 'jpg' else cv2.IMWRITE_WEBP_QUALITY
+        ok, data = cv2.imencode(self.extension, image, [flag, self.quality])
+        if not ok:
+            raise ValueError(f'opencv could not encode the screenshot as {self.format}')
+        return data.tobytes()
+
+    def write(self, filepath: str, png: bytes) -> None:
+        """
+        encode and write one screenshot, an error is logged and counted instead of raised
+        :param filepath: file of the screenshot
+        :param png: bytes
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            data = self.encode(png)
+            os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+            with open(filepath, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            logger.error(f'error when saving the screenshot {filepath} -> {e}')
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            self.written += 1
+            self.bytes += len(data)
+            self.write_time += time.perf_counter() - start
+
+    def flush(self) -> None:
+        """
+        wait until the queued screenshots are on disk
+        :return:
+        """
+        if self._queue is not None and self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """
+        flush the queue and stop the writer thread
+        :return:
+        """
+        self.flush()
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    @property
+    def depth(self) -> int:
+        """
+        screenshots waiting for the writer
+        :return: int
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        capture latency of the test thread, queue depth and the writes
+        :return: dict
+        """
+        with self._lock:
+            return {'format': self.format, 'captures': self.captures,
+                    'capture_avg_ms': round(self.capture_time / self.captures * 1000, 1) if self.captures else 0.0,
+                    'capture_max_ms': round(self.capture_max * 1000, 1),
+                    'queue_depth': self.depth, 'queue_max': self.queue_max,
+                    'blocked': self.blocked, 'block_ms': round(self.block_time * 1000, 1),
+                    'written': self.written, 'failed': self.failed,
+                    'write_avg_ms': round(self.write_time / self.written * 1000, 1) if self.written else 0.0,
+                    'bytes': self.bytes}
+
+
+_SCREEN_WRITER = None
+
+
+def screen_writer() -> ScreenWriter:
+    """
+    screenshot writer of the current process
+    :return: ScreenWriter
+    """
+    global _SCREEN_WRITER
+    if _SCREEN_WRITER is None:
+        _SCREEN_WRITER = ScreenWriter()
+    return _SCREEN_WRITER
+
+
+def flush_screen_writer() -> None:
+    """
+    wait for the queued screenshots, nothing to do if no screenshot was taken
+    :return:
+    """
+    if _SCREEN_WRITER is not None:
+        _SCREEN_WRITER.flush()
+
+
+def close_screen_writer() -> None:
+    """
+    write the queued screenshots, stop the writer and log its stats
+    :return:
+    """
+    global _SCREEN_WRITER
+    if _SCREEN_WRITER is not None:
+        _SCREEN_WRITER.close()
+        if _SCREEN_WRITER.captures:
+            logger.info(f'screenshots: {_SCREEN_WRITER.stats}')
+        _SCREEN_WRITER = None
@@ -0,0 +1,232 @@
+from typing import List, TypeVar
+
+from common.common import ErrorException, logger
+
+T = TypeVar('T')
+
+
+class TableMismatch(AssertionError):
+    """
+    the table differs from the expected one, diff holds the mismatched cells
+    """
+
+    def __init__(self, message: str, diff: list = None):
+        super().__init__(message)
+        self.diff = diff or []
+
+
+def _numpy():
+    import numpy  # only the table assertions need it
+    return numpy
+
+
+def to_float(column: T) -> T or None:
+    """
+    the text column as float64, '1,234.5' is 1234.5 and '' is nan
+    :param column: array of str
+    :return: float array, None if a cell is not a number
+    """
+    np = _numpy()
+    if not len(column):  # nothing says the column holds numbers
+        return None
+    cleaned = np.char.replace(np.char.strip(column.astype(str)), ',', '')
+    cleaned = np.where(cleaned == '', 'nan', cleaned)
+    try:
+        return cleaned.astype(np.float64)
+    except ValueError:
+        return None
+
+
+def table_names(columns: list, width: int) -> list:
+    """
+    unique field names for width columns, the missing or empty ones are col<index>
+    """
+    names = []
+    for index in range(width):
+        name = str(columns[index]).strip() if index < len(columns) and columns[index] is not None else ''
+        name = name or f'col{index}'
+        while name in names:
+            name += f'_{index}'
+        names.append(name)
+    return names
+
+
+_TABLE_CLASS = None
+
+
+def _table_class():
+    global _TABLE_CLASS
+    if _TABLE_CLASS is None:
+        np = _numpy()
+
+        class Table(np.recarray):
+            """
+            structured array of table_array, text keeps the cells as they were read: (rows, columns) array of str
+            an array derived from it (a slice, a sorted copy) has no text, its cells are used as text instead
+            """
+
+            def __array_finalize__(self, obj):
+                self.text = None
+
+        _TABLE_CLASS = Table
+    return _TABLE_CLASS
+
+
+def table_array(rows: List[list], columns: list = None, numeric: bool or list = True) -> T:
+    """
+    rows of cells as a numpy structured array, one field per column: float64 when every cell of the column is a
+    number and numeric is on, else str. short rows (colspan) are padded with ''. the cells as read stay in
+    .text, so a column which looks like numbers can still be compared as text
+    demo：
+    data = table_array([['apple', '3', '1.20'], ['pear', '5', '0.80']], columns=['name', 'qty', 'price'])
+    data['price'].sum()   2.0
+    data.text[0, 2]       '1.20'
+    :param rows: list of rows
+    :param columns: column names, default col0, col1, ..
+    :param numeric: convert the number columns to float64, a list only converts the columns it names
+    :return: numpy.recarray
+    """
+    np = _numpy()
+    width = max([len(row) for row in rows] + [len(columns or [])])
+    text = np.array([[('' if cell is None else str(cell)) for cell in row] + [''] * (width - len(row))
+                     for row in rows], dtype=str).reshape(len(rows), width)
+    names = table_names(columns or [], width)
+    dtype, arrays = [], []
+    for index in range(width):
+        column = text[:, index]
+        convert = names[index] in numeric if isinstance(numeric, (list, tuple, set)) else numeric
+        number = to_float(column) if convert else None
+        arrays.append(column if number is None else number)
+        dtype.append((names[index], arrays[-1].dtype))
+    table = np.zeros(len(rows), dtype=dtype).view(_table_class())
+    for name, array in zip(names, arrays):
+        table[name] = array
+    table.text = text
+    return table
+
+
+def table_text(table: T, column: str) -> T:
+    """
+    the cells of a column as read, stripped: array of str
+    :param table: structured array of table_array
+    :param column: column name
+    :return: array of str
+    """
+    np = _numpy()
+    text = getattr(table, 'text', None)
+    if text is not None and len(text) == len(table):
+        return np.char.strip(text[:, table.dtype.names.index(column)])
+    return np.char.strip(table[column].astype(str))
+
+
+def compare_keys(actual: T, expect: T, columns: list) -> dict:
+    """
+    values to compare of every column, typed by the expected column: floats when the expected column holds numbers
+    and every actual cell is one, else the stripped text of both
+    :return: dict  column -> (actual values, expected values)
+    """
+    keys = dict()
+    for column in columns:
+        want = expect[column]
+        if want.dtype.kind == 'f':
+            got = actual[column] if actual[column].dtype.kind == 'f' else to_float(table_text(actual, column))
+            if got is not None or not len(actual):
+                keys[column] = (got if got is not None else want[:0], want)
+                continue
+        keys[column] = (table_text(actual, column), table_text(expect, column))
+    return keys
+
+
+def assert_table(actual: T, expect: T, columns: list = None, tolerance: dict or float = None,
+                 ordered: bool = True, key: list = None, max_diff: int = 20) -> dict:
+    """
+    compare two tables column by column with numpy instead of one cell at a time
+    number columns (of the expected table) are compared with np.isclose and the tolerance of the column,
+    the others as the stripped text read from the page. unordered tables are sorted by the key columns first,
+    typed the same way on both sides
+    :param actual: structured array of table_array
+    :param expect: structured array of table_array
+    :param columns: columns to compare, default every column of expect
+    :param tolerance: absolute tolerance, one for every number column or {column: tolerance}
+    :param ordered: the rows must be in the same order, else they are matched after sorting
+    :param key: columns to sort by when not ordered, default the compared columns
+    :param max_diff: mismatched cells listed in the error
+    :return: dict  {'rows': .., 'columns': .., 'cells': ..}
+    """
+    np = _numpy()
+    columns = list(columns or expect.dtype.names)
+    missing = [column for column in columns if column not in (actual.dtype.names or ())]
+    if missing:
+        raise TableMismatch(f'columns {missing} are not in the table, it has {list(actual.dtype.names or [])}')
+    if len(actual) != len(expect):
+        raise TableMismatch(f'the table has {len(actual)} rows, {len(expect)} expected')
+
+    sort_by = list(key or columns) if not ordered and len(actual) else []
+    unknown = [column for column in sort_by if column not in (actual.dtype.names or ()) or
+               column not in expect.dtype.names]
+    if unknown:
+        raise TableMismatch(f'key columns {unknown} are not in both tables')
+    keys = compare_keys(actual, expect, list(dict.fromkeys(columns + sort_by)))
+    got_order = want_order = slice(None)
+    if sort_by:
+        # rank the keys of both sides together so a column sorts the same way in both, np.lexsort sorts by the
+        # last key first
+        got_ranks, want_ranks = [], []
+        for column in reversed(sort_by):
+            got, want = keys[column]
+            ranks = np.unique(np.concatenate([got, want]), return_inverse=True)[1].reshape(-1)
+            got_ranks.append(ranks[:len(got)])
+            want_ranks.append(ranks[len(got):])
+        got_order, want_order = np.lexsort(got_ranks), np.lexsort(want_ranks)
+
+    mismatch = np.zeros((len(actual), len(columns)), dtype=bool)
+    for index, column in enumerate(columns):
+        got, want = keys[column][0][got_order], keys[column][1][want_order]
+        if want.dtype.kind == 'f':
+            atol = tolerance.get(column, 0) if isinstance(tolerance, dict) else (tolerance or 0)
+            mismatch[:, index] = ~np.isclose(got, want, rtol=0, atol=atol, equal_nan=True)
+        else:
+            mismatch[:, index] = got != want
+
+    cells = int(mismatch.sum())
+    summary = {'rows': len(actual), 'columns': len(columns), 'cells': mismatch.size, 'mismatched': cells}
+    if cells:
+        diff = [{'row': int(row), 'column': columns[col], 'actual': keys[columns[col]][0][got_order][row].item(),
+                 'expect': keys[columns[col]][1][want_order][row].item()}
+                for row, col in np.argwhere(mismatch)[:max_diff]]
+        lines = '\n'.join(f"  row {d['row']} {d['column']}: {d['actual']!r} != {d['expect']!r}" for d in diff)
+        more = f'\n  ... {cells - len(diff)} more' if cells > len(diff) else ''
+        raise TableMismatch(f'{cells} of {mismatch.size} cells differ:\n{lines}{more}', diff)
+    logger.debug(f'table assertion passed: {summary}')
+    return summary
+
+
+def assert_table_case(actual: T, table: dict, max_diff: int = 20) -> dict:
+    """
+    compare a table with the 'table' of a case in data/case
+    - case_name: test_report_grid
+      table:
+        columns: [name, qty, price]
+        tolerance: {price: 0.01}      # optional
+        ordered: False                # optional, default True
+        key: [name]                   # optional, sort columns when not ordered
+        compare: [name, price]        # optional, columns to compare, default every column
+        rows:
+          - [apple, 3, 1.20]
+    :param actual: structured array of table_array
+    :param table: dict of the case
+    :param max_diff: mismatched cells listed in the error
+    :return: dict
+    """
+    if not isinstance(table, dict) or 'rows' not in table:
+        raise ErrorException(f'the expected table needs rows and columns, got {table}')
+    rows = table['rows'] or []
+    width = max([len(row) for row in rows] + [len(table.get('columns') or [])])
+    # a column is a number column when the yaml has numbers in it, a quoted '007' stays text
+    numeric = [name for index, name in enumerate(table_names(table.get('columns') or [], width))
+               if any(len(row) > index and row[index] is not None for row in rows)
+               and all(isinstance(row[index], (int, float)) and not isinstance(row[index], bool)
+                       for row in rows if len(row) > index and row[index] is not None)]
+    expect = table_array(rows, columns=table.get('columns'), numeric=numeric)
+    return assert_table(actual, expect, columns=table.get('compare'), tolerance=table.get('tolerance'),
+                        ordered=table.get('ordered', True), key=table.get('key'), max_diff=max_diff)
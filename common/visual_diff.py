@@ -0,0 +1,318 @@
+import os
+import threading
+import time
+from typing import TypeVar
+
+from config import DIFF_IMGPATH, RESULT_SCREEN_DIR
+from common.common import ErrorException, logger, setting
+
+T = TypeVar('T')
+
+# constants of the structural similarity (SSIM) for 8 bit images
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+class VisualMismatch(AssertionError):
+    """
+    the screenshot differs from its baseline, result holds the scores and the heatmap
+    """
+
+    def __init__(self, message: str, result: dict = None):
+        super().__init__(message)
+        self.result = result or {}
+
+
+def _cv2():
+    import cv2  # only the visual regression needs opencv and numpy
+    import numpy
+    return cv2, numpy
+
+
+def decode_image(image: T) -> T:
+    """
+    image as a BGR array, decoded in memory
+    :param image: png / jpg bytes, a file path or an array
+    :return: numpy.ndarray  height x width x 3 uint8
+    """
+    cv2, np = _cv2()
+    if isinstance(image, (bytes, bytearray)):
+        array = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    elif isinstance(image, str):
+        # np.fromfile + imdecode also reads the paths imread can not (non-ascii on windows)
+        array = cv2.imdecode(np.fromfile(image, dtype=np.uint8), cv2.IMREAD_COLOR) if os.path.isfile(image) else None
+    else:
+        array = image
+    if array is None:
+        raise ErrorException(f'image can not be decoded: {image if isinstance(image, str) else type(image)}')
+    if array.ndim == 2:
+        array = cv2.cvtColor(array, cv2.COLOR_GRAY2BGR)
+    elif array.shape[2] == 4:
+        array = cv2.cvtColor(array, cv2.COLOR_BGRA2BGR)
+    return array
+
+
+def region_slices(regions: list = None) -> list:
+    """
+    numpy slices of the ignored regions
+    :param regions: [x, y, width, height] or {'x': .., 'y': .., 'width': .., 'height': ..} in pixels
+    :return: list of (rows, columns) slices
+    """
+    slices = []
+    for region in regions or []:
+        if isinstance(region, dict):
+            region = (region['x'], region['y'], region['width'], region['height'])
+        x, y, width, height = (int(round(float(value))) for value in region)
+        slices.append((slice(max(y, 0), max(y + height, 0)), slice(max(x, 0), max(x + width, 0))))
+    return slices
+
+
+def region_mask(shape: tuple, regions: list = None) -> T:
+    """
+    mask of the compared pixels, 0 inside the ignored regions and 255 elsewhere
+    :param shape: (height, width) of the image
+    :param regions: regions of region_slices
+    :return: numpy.ndarray of uint8
+    """
+    _, np = _cv2()
+    mask = np.full(shape[:2], 255, dtype=np.uint8)
+    for rows, columns in region_slices(regions):
+        mask[rows, columns] = 0
+    return mask
+
+
+def ssim_map(actual: T, expect: T) -> T:
+    """
+    structural similarity of every pixel of two gray images, gaussian window 7x7, sigma 1.5
+    :param actual: gray float32 array
+    :param expect: gray float32 array
+    :return: float32 array, 1 where the structure is the same
+    """
+    cv2, _ = _cv2()
+
+    def blur(image):
+        return cv2.GaussianBlur(image, (7, 7), 1.5)
+
+    # opencv arithmetic instead of numpy expressions, fewer temporaries of the image size
+    mu_a, mu_b = blur(actual), blur(expect)
+    mu_aa, mu_bb, mu_ab = cv2.multiply(mu_a, mu_a), cv2.multiply(mu_b, mu_b), cv2.multiply(mu_a, mu_b)
+    var_sum = cv2.subtract(cv2.add(blur(cv2.multiply(actual, actual)), blur(cv2.multiply(expect, expect))),
+                           cv2.add(mu_aa, mu_bb))
+    cov = cv2.subtract(blur(cv2.multiply(actual, expect)), mu_ab)
+    numerator = cv2.multiply(cv2.add(cv2.multiply(mu_ab, 2), SSIM_C1), cv2.add(cv2.multiply(cov, 2), SSIM_C2))
+    denominator = cv2.multiply(cv2.add(cv2.add(mu_aa, mu_bb), SSIM_C1), cv2.add(var_sum, SSIM_C2))
+    return cv2.divide(numerator, denominator)
+
+
+def heatmap(actual: T, diff: T, mask: T) -> T:
+    """
+    the screenshot with its differences in the jet colors on top, the ignored regions darkened
+    :param actual: BGR array
+    :param diff: uint8 array of the pixel difference
+    :param mask: uint8 array of region_mask
+    :return: BGR array
+    """
+    cv2, np = _cv2()
+    colors = cv2.applyColorMap(cv2.normalize(diff, None, 0, 255, cv2.NORM_MINMAX), cv2.COLORMAP_JET)
+    image = cv2.addWeighted(actual, 0.4, colors, 0.6, 0)
+    image[diff == 0] = actual[diff == 0]
+    image[mask == 0] //= 3
+    return image
+
+
+class VisualDiff:
+    """
+    compare screenshots with their baselines in DIFF_IMGPATH
+    a pixel is changed when one channel differs by more than tolerance, the comparison fails when the share of
+    changed pixels is above threshold or the mean SSIM is below min_ssim. the ignored regions count for neither
+    a missing baseline fails the comparison, update (WEB_VISUAL_UPDATE) creates the missing baselines and replaces
+    the others. on failure the heatmap and the screenshot are written to RESULT_SCREEN_DIR/visual
+    demo：
+    engine = visual_diff()
+    engine.assert_image(driver.get_screenshot_as_png(), 'google_home', ignore=[[0, 0, 200, 40]])
+    engine.stats      {'compared': 3, 'failed': 1, 'missing': 0, 'created': 0, 'updated': 0, 'compare_avg_ms': 18.2}
+    """
+
+    def __init__(self, baseline_dir: str = None, output_dir: str = None, threshold: float = None,
+                 tolerance: int = None, min_ssim: float = None, update: bool = None):
+        web_ui = setting.WEB_UI
+        self.baseline_dir = baseline_dir or DIFF_IMGPATH
+        self.output_dir = output_dir or os.path.join(RESULT_SCREEN_DIR, 'visual')
+        self.threshold = threshold if threshold is not None else web_ui.WEB_VISUAL_THRESHOLD
+        self.tolerance = tolerance if tolerance is not None else web_ui.WEB_VISUAL_TOLERANCE
+        self.min_ssim = min_ssim if min_ssim is not None else web_ui.WEB_VISUAL_SSIM
+        self.update = update if update is not None else web_ui.WEB_VISUAL_UPDATE
+        self._lock = threading.Lock()
+        self.compared = 0
+        self.failed = 0
+        self.missing = 0
+        self.created = 0
+        self.updated = 0
+        self.compare_time = 0.0
+        self.compare_max = 0.0
+
+    def baseline(self, name: str) -> str:
+        """
+        file of the baseline
+        :param name: name of the baseline, without extension
+        :return: str
+        """
+        return os.path.join(self.baseline_dir, f'{name}.png')
+
+    def save(self, path: str, image: T) -> str:
+        """
+        write an image as png
+        :param path: file
+        :param image: BGR array
+        :return: path
+        """
+        cv2, _ = _cv2()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ok, data = cv2.imencode('.png', image)
+        if not ok:
+            raise ErrorException(f'image can not be encoded: {path}')
+        data.tofile(path)
+        return path
+
+    def score(self, actual: T, expect: T, ignore: list = None) -> dict:
+        """
+        changed pixels and SSIM of two images of the same size, nothing is written
+        SSIM is computed on the gray images, at half the size above 1000 px wide: the score of a page barely
+        moves and it is 4 times cheaper
+        :param actual: BGR array
+        :param expect: BGR array
+        :param ignore: regions of region_slices
+        :return: dict  {'changed': .., 'ratio': .., 'ssim': .., 'diff': uint8 array, 'mask': uint8 array}
+        """
+        cv2, np = _cv2()
+        width = actual.shape[1]
+        mask = region_mask(actual.shape, ignore)
+        compared = cv2.countNonZero(mask)
+        # largest difference of the 3 channels, the ignored regions are 0
+        blue, green, red = cv2.split(cv2.absdiff(actual, expect))
+        diff = cv2.max(cv2.max(blue, green), red)
+        for rows, columns in region_slices(ignore):
+            diff[rows, columns] = 0
+        changed = cv2.countNonZero(cv2.threshold(diff, self.tolerance, 255, cv2.THRESH_BINARY)[1])
+        ssim = 1.0
+        if changed and compared:  # no pixel beyond the tolerance, the structure is the same
+            gray_a = cv2.cvtColor(actual, cv2.COLOR_BGR2GRAY)
+            gray_b = cv2.cvtColor(expect, cv2.COLOR_BGR2GRAY)
+            ssim_mask = mask
+            if width > 1000:
+                gray_a, gray_b, ssim_mask = cv2.pyrDown(gray_a), cv2.pyrDown(gray_b), mask[::2, ::2]
+            ssim = float(cv2.mean(ssim_map(np.float32(gray_a), np.float32(gray_b)), mask=ssim_mask)[0])
+        return {'changed': changed, 'ratio': changed / compared if compared else 0.0, 'ssim': ssim,
+                'diff': diff, 'mask': mask}
+
+    def compare(self, image: T, name: str, ignore: list = None, update: bool = None) -> dict:
+        """
+        compare a screenshot with the baseline name
+        :param image: png bytes, file or BGR array
+        :param name: name of the baseline in DIFF_IMGPATH
+        :param ignore: regions of region_slices
+        :param update: write the screenshot as the baseline, default the update of the engine
+        :return: dict  {'name': .., 'passed': .., 'status': compared / missing / created / updated, 'ratio': ..,
+                        'ssim': ..}
+        """
+        start = time.perf_counter()
+        actual = decode_image(image)
+        path = self.baseline(name)
+        update = self.update if update is None else update
+        if not update and not os.path.isfile(path):
+            with self._lock:
+                self.missing += 1
+            actual_path = self.save(os.path.join(self.output_dir, f'{name}_{round(time.time() * 1000)}_actual.png'),
+                                    actual)
+            return {'name': name, 'passed': False, 'status': 'missing', 'baseline': path, 'actual': actual_path,
+                    'ratio': 1.0, 'ssim': 0.0,
+                    'reason': f'there is no baseline {path}, check the screenshot and create it with '
+                              f'update=True or WEB_VISUAL_UPDATE: True'}
+        if update:
+            status = 'updated' if os.path.isfile(path) else 'created'
+            self.save(path, actual)
+            with self._lock:
+                setattr(self, status, getattr(self, status) + 1)
+            logger.info(f'visual baseline {status}: {path}')
+            return {'name': name, 'passed': True, 'status': status, 'baseline': path, 'ratio': 0.0, 'ssim': 1.0}
+
+        expect = decode_image(path)
+        result = {'name': name, 'status': 'compared', 'baseline': path}
+        if actual.shape != expect.shape:
+            result.update(passed=False, ratio=1.0, ssim=0.0,
+                          reason=f'size {actual.shape[1]}x{actual.shape[0]} != '
+                                 f'{expect.shape[1]}x{expect.shape[0]} of the baseline')
+            diff, mask = None, None
+        else:
+            score = self.score(actual, expect, ignore)
+            diff, mask = score.pop('diff'), score.pop('mask')
+            result.update(score, passed=score['ratio'] <= self.threshold and score['ssim'] >= self.min_ssim)
+        elapsed = time.perf_counter() - start
+        result['compare_ms'] = round(elapsed * 1000, 1)
+        with self._lock:
+            self.compared += 1
+            self.failed += 0 if result['passed'] else 1
+            self.compare_time += elapsed
+            self.compare_max = max(self.compare_max, elapsed)
+
+        if not result['passed']:  # the images are only written when they differ
+            stamp = round(time.time() * 1000)
+            result['actual'] = self.save(os.path.join(self.output_dir, f'{name}_{stamp}_actual.png'), actual)
+            if diff is not None:
+                result['heatmap'] = self.save(os.path.join(self.output_dir, f'{name}_{stamp}_diff.png'),
+                                              heatmap(actual, diff, mask))
+        logger.debug(f"visual {name}: {({k: v for k, v in result.items() if k != 'baseline'})}")
+        return result
+
+    def assert_image(self, image: T, name: str, ignore: list = None, update: bool = None) -> dict:
+        """
+        compare and raise VisualMismatch when the screenshot differs from the baseline
+        :param image: png bytes, file or BGR array
+        :param name: name of the baseline in DIFF_IMGPATH
+        :param ignore: regions of region_slices
+        :param update: write the screenshot as the baseline
+        :return: dict of compare
+        """
+        result = self.compare(image, name, ignore=ignore, update=update)
+        if not result['passed']:
+            reason = result.get('reason') or (f"{result['ratio']:.4%} pixels changed (max {self.threshold:.4%}), "
+                                              f"ssim {result['ssim']:.4f} (min {self.min_ssim})")
+            where = result.get('heatmap') or result.get('actual')
+            raise VisualMismatch(f"screenshot {name} differs from its baseline: {reason}, see {where}", result)
+        return result
+
+    @property
+    def stats(self) -> dict:
+        """
+        comparisons, failures, missing and written baselines and the time of a comparison
+        :return: dict
+        """
+        with self._lock:
+            return {'compared': self.compared, 'failed': self.failed, 'missing': self.missing,
+                    'created': self.created, 'updated': self.updated,
+                    'compare_avg_ms': round(self.compare_time / self.compared * 1000, 1) if self.compared else 0.0,
+                    'compare_max_ms': round(self.compare_max * 1000, 1)}
+
+
+_VISUAL_DIFF = None
+
+
+def visual_diff() -> VisualDiff:
+    """
+    visual regression engine of the current process
+    :return: VisualDiff
+    """
+    global _VISUAL_DIFF
+    if _VISUAL_DIFF is None:
+        _VISUAL_DIFF = VisualDiff()
+    return _VISUAL_DIFF
+
+
+def report_visual() -> None:
+    """
+    log the stats of the visual regression engine, nothing to do if it compared nothing
+    :return:
+    """
+    if _VISUAL_DIFF is not None and (_VISUAL_DIFF.compared or _VISUAL_DIFF.missing or _VISUAL_DIFF.created
+                                     or _VISUAL_DIFF.updated):
+        logger.info(f'visual regression: {_VISUAL_DIFF.stats}')
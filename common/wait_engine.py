@@ -0,0 +1,316 @@
+import threading
+import time
+import weakref
+from typing import TypeVar
+
+from common.common import ErrorException, logger, setting
+
+T = TypeVar('T')
+
+# signature of the document: element count and body size, unchanged while the dom is quiet
+DOM_SIGNATURE_JS = ("return document.getElementsByTagName('*').length + ':' + "
+                    "(document.body ? document.body.innerHTML.length : 0);")
+
+# state of the network: ready state, finished resources and time since the last one finished: ms
+NETWORK_STATE_JS = """
+var entries = performance.getEntriesByType('resource');
+var last = 0;
+for (var i = 0; i < entries.length; i++) { last = Math.max(last, entries[i].responseEnd); }
+return [document.readyState, entries.length, performance.now() - last];
+"""
+
+# token of the current document, kept on its window so a new document (navigation, reload) gets a new one
+DOCUMENT_TOKEN_JS = """
+return window.__documentToken || (window.__documentToken = Math.random().toString(36).slice(2));
+"""
+
+ELEMENT_RECT_JS = """
+var r = arguments[0].getBoundingClientRect();
+return [r.x, r.y, r.width, r.height, !!(r.width || r.height)];
+"""
+
+
+# finds a locator in the current document of the browser, shared by the scripts which run in the page
+FIND_JS = """
+function shown(el) { return !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length); }
+function find(by, value, many, visible) {
+  var found = [];
+  if (by === 'css selector') { found = document.querySelectorAll(value); }
+  else if (by === 'xpath') {
+    var snapshot = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (var i = 0; i < snapshot.snapshotLength; i++) { found.push(snapshot.snapshotItem(i)); }
+  }
+  else if (by === 'id') { var el = document.getElementById(value); found = el ? [el] : []; }
+  else if (by === 'name') { found = document.getElementsByName(value); }
+  else if (by === 'class name') { found = document.getElementsByClassName(value); }
+  else if (by === 'tag name') { found = document.getElementsByTagName(value); }
+  else {
+    var links = document.getElementsByTagName('a');
+    for (var j = 0; j < links.length; j++) {
+      var text = (links[j].innerText || links[j].textContent || '').trim();
+      if (by === 'link text' ? text === value : text.indexOf(value) >= 0) { found.push(links[j]); }
+    }
+  }
+  found = Array.prototype.slice.call(found);
+  if (visible) { found = found.filter(shown); }
+  return found.length ? (many ? found : found[0]) : null;
+}
+"""
+
+# waits in the browser for a locator to match: checks once, then again on every dom mutation (and every 250 ms for
+# changes no mutation reports, e.g. a css animation), and calls back with the element(s) or null after the timeout
+OBSERVE_JS = FIND_JS + """
+var by = arguments[0], value = arguments[1], many = arguments[2], visible = arguments[3], timeout = arguments[4];
+var done = arguments[arguments.length - 1];
+var result = find(by, value, many, visible);
+if (result) { done(result); return; }
+var finished = false, observer, tick, timer;
+function finish(r) {
+  if (finished) { return; }
+  finished = true; observer.disconnect(); clearInterval(tick); clearTimeout(timer); done(r);
+}
+function check() { var r = find(by, value, many, visible); if (r) { finish(r); } }
+observer = new MutationObserver(check);
+observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+tick = setInterval(check, 250);
+timer = setTimeout(function () { finish(null); }, timeout);
+"""
+
+# locate types FIND_JS can find
+OBSERVE_BY = ('css selector', 'xpath', 'id', 'name', 'class name', 'tag name', 'link text', 'partial link text')
+
+# driver -> script timeout set for the async scripts: s
+_SCRIPT_TIMEOUTS = weakref.WeakKeyDictionary()
+
+
+def script_timeout(driver: T, seconds: float) -> None:
+    """
+    make sure an async script of the driver may run seconds, the timeout is only raised, never lowered
+    :param driver: driver
+    :param seconds: s
+    :return:
+    """
+    if _SCRIPT_TIMEOUTS.get(driver, 0) < seconds:
+        driver.set_script_timeout(seconds)
+        _SCRIPT_TIMEOUTS[driver] = seconds
+
+
+def find(driver: T, ctx: dict) -> T or None:
+    """
+    element of the condition without waiting, None if it is not there yet
+    """
+    elements = driver.find_elements(ctx['by'], ctx['locate'])
+    index = ctx.get('index') or 0
+    return elements[index] if len(elements) > index else None
+
+
+def quiet(ctx: dict, value) -> bool:
+    """
+    True when value did not change for the quiet period
+    """
+    now = time.perf_counter()
+    if ctx.get('last') != value:
+        ctx['last'], ctx['since'] = value, now
+        return False
+    return now - ctx['since'] >= ctx['quiet']
+
+
+def element_stable(driver: T, ctx: dict) -> bool:
+    element = find(driver, ctx)
+    if element is None:
+        return False
+    rect = driver.execute_script(ELEMENT_RECT_JS, element)
+    return rect[-1] and quiet(ctx, tuple(rect))
+
+
+def document_changed(driver: T, ctx: dict) -> bool:
+    # a click which loads another page may return before the navigation starts, the old document is still
+    # complete then, so a navigation is only seen when the document token of before the action changed
+    return driver.execute_script(DOCUMENT_TOKEN_JS) != ctx['token']
+
+
+def network_idle(driver: T, ctx: dict) -> bool:
+    # no request can be seen before it finishes, so idle is: loaded and no resource finished for the quiet period
+    state, count, idle_ms = driver.execute_script(NETWORK_STATE_JS)
+    return state == 'complete' and idle_ms >= ctx['quiet'] * 1000 and quiet(ctx, count)
+
+
+# condition -> check(driver, ctx), polled until it returns True. ctx holds the arguments of the wait
+# (by, locate, index, url, quiet) and the state a condition keeps between polls
+WAIT_CONDITIONS = {
+    'ready': lambda driver, ctx: driver.execute_script('return document.readyState;') == 'complete',
+    'present': lambda driver, ctx: find(driver, ctx) is not None,
+    'visible': lambda driver, ctx: bool(find(driver, ctx)) and find(driver, ctx).is_displayed(),
+    'value_empty': lambda driver, ctx: bool(find(driver, ctx)) and not find(driver, ctx).get_property('value'),
+    'element_stable': element_stable,
+    'dom_quiet': lambda driver, ctx: quiet(ctx, driver.execute_script(DOM_SIGNATURE_JS)),
+    'network_idle': network_idle,
+    'url_changed': lambda driver, ctx: driver.current_url != ctx['url'],
+    'document_changed': document_changed,
+    'navigated': lambda driver, ctx: document_changed(driver, ctx) and WAIT_CONDITIONS['ready'](driver, ctx),
+}
+
+# conditions which compare with the document before the action
+DOCUMENT_CONDITIONS = ('document_changed', 'navigated')
+
+# conditions which need a locator
+ELEMENT_CONDITIONS = ('present', 'visible', 'value_empty', 'element_stable')
+
+# quiet period of a condition when the wait does not pass one, the others use WEB_WAIT_QUIET: s
+QUIET_TIME = {'element_stable': 0.1}
+
+
+class WaitEngine:
+    """
+    waits for a condition of the page instead of sleeping a fixed time: polls with backoff from poll_min up to
+    poll_max and returns as soon as the condition holds
+    a wait which replaces a fixed sleep passes that sleep as budget: it waits at most budget, and the time
+    it did not need is counted as saved
+    demo：
+    wait_engine().wait(driver, 'element_stable', by='id', locate='su', budget=0.5)
+    wait_engine().stats   {'waits': 120, 'met': 118, 'timeouts': 2, 'budget_s': 60.0, 'waited_s': 7.2, ...}
+    """
+
+    def __init__(self, poll_min: float = None, poll_max: float = None, quiet: float = None):
+        web_ui = setting.WEB_UI
+        self.poll_min = poll_min if poll_min is not None else web_ui.WEB_WAIT_POLL_MIN
+        self.poll_max = poll_max if poll_max is not None else web_ui.WEB_WAIT_POLL_MAX
+        self.quiet = quiet if quiet is not None else web_ui.WEB_WAIT_QUIET
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.met = 0
+        self.timeouts = 0
+        self.polls = 0
+        self.budget = 0.0  # fixed sleeps replaced: s
+        self.waited = 0.0  # time spent in the waits which replaced them: s
+        self.conditions = dict()
+        self.observed = 0
+        self.observe_timeouts = 0
+        self.observe_time = 0.0
+
+    def wait(self, driver: T, condition: str, by: str = None, locate: str = None, index: int = None,
+             url: str = None, token: str = None, timeout: float = None, budget: float = None,
+             quiet: float = None, raise_error: bool = False) -> bool:
+        """
+        poll the condition until it holds
+        :param driver: driver
+        :param condition: one of WAIT_CONDITIONS
+        :param by: locate type of the element conditions
+        :param locate: locator of the element conditions
+        :param index: index of the element when the locator matches several
+        :param url: url before the action, for url_changed
+        :param token: DOCUMENT_TOKEN_JS before the action, for document_changed / navigated
+        :param timeout: longest wait: s, default budget, then WEB_IMPLICITLY_WAIT_TIME
+        :param budget: the fixed sleep this wait replaces: s
+        :param quiet: how long dom_quiet / network_idle / element_stable must stay unchanged: s,
+                      default QUIET_TIME or WEB_WAIT_QUIET, at most half the budget
+        :param raise_error: raise ErrorException on timeout instead of returning False
+        :return: bool  the condition holds
+        """
+        check = WAIT_CONDITIONS.get(condition)
+        if check is None:
+            raise ErrorException(f'wait condition {condition} is not supported, only {list(WAIT_CONDITIONS)}')
+        if condition in ELEMENT_CONDITIONS and not (by and locate):
+            raise ErrorException(f'wait condition {condition} needs a locator')
+        if timeout is None:
+            timeout = budget if budget is not None else setting.WEB_UI.WEB_IMPLICITLY_WAIT_TIME
+        if quiet is None:
+            quiet = QUIET_TIME.get(condition, self.quiet)
+            if budget:  # a quiet period longer than the budget could never be met, keep half of it to see a change
+                quiet = min(quiet, budget / 2)
+        ctx = {'by': by, 'locate': locate, 'index': index, 'url': url, 'token': token, 'quiet': quiet}
+
+        start = time.perf_counter()
+        deadline = start + timeout
+        interval = self.poll_min
+        polls = 0
+        while True:
+            polls += 1
+            try:
+                met = bool(check(driver, ctx))
+            except Exception as e:  # the page is changing under the check, e.g. a stale element
+                logger.debug(f'wait condition {condition} not checked: {e}')
+                met = False
+            now = time.perf_counter()
+            if met or now >= deadline:
+                break
+            time.sleep(min(interval, deadline - now))
+            interval = min(interval * 1.5, self.poll_max)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.waits += 1
+            self.polls += polls
+            self.met += met
+            self.timeouts += not met
+            self.conditions[condition] = self.conditions.get(condition, 0) + 1
+            if budget:
+                self.budget += budget
+                self.waited += elapsed
+        logger.debug(f'wait {condition} {locate or ""}: {"met" if met else "timeout"} in {elapsed:.3f}s')
+        if not met and raise_error:
+            raise ErrorException(f'wait condition {condition} {locate or ""} did not hold within {timeout}s')
+        return met
+
+    def observe(self, driver: T, by: str, locate: str, many: bool = False, visible: bool = False,
+                timeout: float = None) -> T or None:
+        """
+        wait for the locator in the browser with a MutationObserver: one execute_async_script per wait instead of
+        one find_element round trip per poll
+        raises WebDriverException when the script can not run, e.g. the page navigated during the wait
+        :param driver: driver
+        :param by: one of OBSERVE_BY
+        :param locate: locator
+        :param many: return every match instead of the first one
+        :param visible: only match visible elements
+        :param timeout: longest wait: s, default WEB_IMPLICITLY_WAIT_TIME
+        :return: element, list of elements, None after the timeout
+        """
+        if by not in OBSERVE_BY:
+            raise ErrorException(f'observer wait does not support locate type {by}, only {OBSERVE_BY}')
+        timeout = setting.WEB_UI.WEB_IMPLICITLY_WAIT_TIME if timeout is None else timeout
+        script_timeout(driver, timeout + 5)  # the script must be able to outlive its own timeout
+
+        start = time.perf_counter()
+        result = driver.execute_async_script(OBSERVE_JS, by, locate, many, visible, int(timeout * 1000))
+        with self._lock:
+            self.observed += 1
+            self.observe_timeouts += not result
+            self.observe_time += time.perf_counter() - start
+        return result or None
+
+    @property
+    def stats(self) -> dict:
+        """
+        saved_s: fixed sleep budget the waits did not need
+        :return: dict
+        """
+        with self._lock:
+            return {'waits': self.waits, 'met': self.met, 'timeouts': self.timeouts, 'polls': self.polls,
+                    'budget_s': round(self.budget, 3), 'waited_s': round(self.waited, 3),
+                    'saved_s': round(self.budget - self.waited, 3), 'conditions': dict(self.conditions),
+                    'observed': self.observed, 'observe_timeouts': self.observe_timeouts,
+                    'observe_avg_ms': round(self.observe_time / self.observed * 1000, 1) if self.observed else 0.0}
+
+
+_WAIT_ENGINE = None
+
+
+def wait_engine() -> WaitEngine:
+    """
+    wait engine of the current process
+    :return: WaitEngine
+    """
+    global _WAIT_ENGINE
+    if _WAIT_ENGINE is None:
+        _WAIT_ENGINE = WaitEngine()
+    return _WAIT_ENGINE
+
+
+def report_waits() -> None:
+    """
+    log the stats of the wait engine, nothing to do if it did not wait
+    :return:
+    """
+    if _WAIT_ENGINE is not None and (_WAIT_ENGINE.waits or _WAIT_ENGINE.observed):
+        logger.info(f'adaptive wait: {_WAIT_ENGINE.stats}')
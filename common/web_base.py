@@ -2,13 +2,15 @@
 # Date   : 9:18 pm - 5/10/22
 # File   : web_base.py
 
+import functools
 import os
 import sys
 import time
+import weakref
 from enum import Enum
-from typing import TypeVar
+from typing import NamedTuple, Tuple, TypeVar
 
-import allure
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -17,23 +19,16 @@ from selenium.webdriver.support.select import Select
 from selenium.webdriver.support.ui import WebDriverWait
 
 from config import RESULT_SCREEN_DIR
-from common.common import ErrorException, logger, is_assertion, read_conf
-from common.read_data import GetCaseYaml, replace_py_yaml
+from common.common import ErrorException, logger, is_assertion, setting
+from common.read_data import GetCaseYaml, read_table_data, replace_py_yaml
+from common.screen_writer import screen_writer
+from common.visual_diff import visual_diff
+from common.table_assert import assert_table_case, table_array
+from common.wait_engine import DOCUMENT_CONDITIONS, DOCUMENT_TOKEN_JS, FIND_JS, OBSERVE_BY, WAIT_CONDITIONS, \
+    script_timeout, wait_engine
 
 EM = TypeVar('EM')  # any type
 
-# 读取配置参数
-WEB_UI = read_conf('WEB_UI')
-WEB_POLL_FREQUENCY = WEB_UI.get('WEB_IMPLICITLY_WAIT_TIME')
-WEB_IMPLICITLY_WAIT_TIME = WEB_UI.get('WEB_POLL_FREQUENCY')
-
-# 读取 项目类型
-CASE_TYPE = read_conf('CURRENCY').get('CASE_TYPE')
-
-if CASE_TYPE.lower() == 'web':
-    POLL_FREQUENCY = WEB_POLL_FREQUENCY
-    IMPLICITLY_WAIT_TIME = WEB_IMPLICITLY_WAIT_TIME
-
 
 class Locate(Enum):
     """
@@ -83,47 +78,272 @@ class Operation(Enum):
                      'web_url', 'web_title', 'web_html_content', 'iframe']
 
 
+# locate type -> selenium By, resolved By values map to themselves so compiled steps can be passed back in
+WEB_BY = {
+    'id': By.ID,
+    'xpath': By.XPATH,
+    'link_text': By.LINK_TEXT,
+    'link': By.LINK_TEXT,
+    'partial_link_text': By.PARTIAL_LINK_TEXT,
+    'partial': By.PARTIAL_LINK_TEXT,
+    'name': By.NAME,
+    'tag_name': By.TAG_NAME,
+    'tag': By.TAG_NAME,
+    'class_name': By.CLASS_NAME,
+    'class': By.CLASS_NAME,
+    'css_selector': By.CSS_SELECTOR,
+    'css': By.CSS_SELECTOR,
+    'function': 'function',
+}
+WEB_BY.update({by: by for by in list(WEB_BY.values())})
+
+# operations which type in the text passed to the step
+TEXT_OPERATIONS = ('input', 'clear_continue_input', 'jsclear_continue_input')
+
+# operations which may load another page, the wait after them first looks for a new document
+NAVIGATING_OPERATIONS = ('click', 'submit')
+
+# operations whose script in BATCH_JS does what the native step does, run in one script by the batched mode of
+# webexe. inputs and clears stay native: send_keys / clear send key events and respect maxlength and input masks,
+# a script setting the value does not. click and submit need real mouse events and may leave the page
+BATCH_OPERATIONS = ('jsclear', 'text', 'scroll')
+
+# runs steps in the page in order: waits in the page for the element of every step (up to the timeout), then
+# reads, clears or scrolls it like the native operation, and calls back with [{ok, value, error, found}] of
+# the steps it ran, stopping at the first failed one. found tells whether the failed step reached its element
+BATCH_JS = FIND_JS + """
+var steps = arguments[0], timeout = arguments[1], done = arguments[arguments.length - 1];
+var operations = {
+  jsclear: function (el) { el.value = ''; },
+  // WebElement.text: '' for a hidden element, nbsp as space, trimmed
+  text: function (el) { return shown(el) ? (el.innerText || '').replace(/\u00a0/g, ' ').trim() : ''; },
+  scroll: function (el) { el.scrollIntoView(); }
+};
+var results = [], i = 0;
+function next() {
+  if (i >= steps.length) { done(results); return; }
+  var step = steps[i], start = Date.now();
+  (function attempt() {
+    var found = find(step.by, step.locate, true, false), el = found && found[step.index || 0];
+    if (!el) {
+      if (Date.now() - start < timeout) { setTimeout(attempt, 50); return; }
+      results.push({ok: false, found: false, error: 'element ' + step.by + ': ' + step.locate + ' not found'});
+      done(results); return;
+    }
+    try {
+      var value = operations[step.operate](el);
+      results.push({ok: true, value: value === undefined ? null : value});
+    } catch (e) {
+      results.push({ok: false, found: true, error: String(e)}); done(results); return;
+    }
+    i++; setTimeout(next, 0);  // the handlers of the step run before the next one
+  })();
+}
+next();
+"""
+
+# fields of web_elements_data
+BULK_FIELDS = ('text', 'value', 'tag', 'rect', 'visible')
+
+# data of every match of a locator in one call: waits in the page for a first match up to the timeout, then
+# calls back with [{field: value, 'attrs': {name: value}}] in document order, [] if nothing matched
+BULK_JS = FIND_JS + """
+var by = arguments[0], value = arguments[1], fields = arguments[2], attrs = arguments[3], timeout = arguments[4];
+var done = arguments[arguments.length - 1], start = Date.now();
+function data(el) {
+  var row = {}, visible = shown(el);
+  for (var i = 0; i < fields.length; i++) {
+    var field = fields[i];
+    if (field === 'text') { row.text = visible ? (el.innerText || '').trim() : ''; }
+    else if (field === 'value') { row.value = el.value === undefined ? null : el.value; }
+    else if (field === 'tag') { row.tag = el.tagName.toLowerCase(); }
+    else if (field === 'rect') { var r = el.getBoundingClientRect(); row.rect = [r.x, r.y, r.width, r.height]; }
+    else if (field === 'visible') { row.visible = visible; }
+  }
+  if (attrs.length) {
+    row.attrs = {};
+    for (var j = 0; j < attrs.length; j++) { row.attrs[attrs[j]] = el.getAttribute(attrs[j]); }
+  }
+  return row;
+}
+(function attempt() {
+  var found = find(by, value, true, false);
+  if (!found && Date.now() - start < timeout) { setTimeout(attempt, 50); return; }
+  done((found || []).map(data));
+})();
+"""
+
+# boxes of the elements in the arguments in device pixels of the viewport, like the screenshot: [[x, y, w, h]]
+SCREEN_RECTS_JS = """
+var ratio = window.devicePixelRatio || 1;
+return Array.prototype.map.call(arguments, function (el) {
+  var r = el.getBoundingClientRect();
+  return [r.left * ratio, r.top * ratio, r.width * ratio, r.height * ratio];
+});
+"""
+
+# cell text of a table (or any element with tr rows) in one call: {columns: [..], rows: [[..]]}, the first row
+# is the header when header is on and the rows of thead are never data. null if the table is not found in time
+TABLE_JS = FIND_JS + """
+var by = arguments[0], value = arguments[1], header = arguments[2], timeout = arguments[3];
+var done = arguments[arguments.length - 1], start = Date.now();
+function texts(tr) {
+  return Array.prototype.map.call(tr.cells || tr.children, function (td) { return (td.innerText || '').trim(); });
+}
+(function attempt() {
+  var table = find(by, value, false, false);
+  if (!table) {
+    if (Date.now() - start < timeout) { setTimeout(attempt, 50); return; }
+    done(null); return;
+  }
+  var rows = Array.prototype.slice.call(table.rows || table.querySelectorAll('tr'));
+  var head = table.tHead ? Array.prototype.slice.call(table.tHead.rows) : [];
+  var columns = header && rows.length ? texts(head.length ? head[0] : rows[0]) : [];
+  var body = rows.filter(function (tr, i) { return head.indexOf(tr) < 0 && !(header && !head.length && i === 0); });
+  done({columns: columns, rows: body.map(texts)});
+})();
+"""
+
+
+class Step(NamedTuple):
+    """
+    compiled locator step, fields are resolved once by compile_case
+    """
+    index: int
+    by: str
+    locate: str
+    operate: str
+    list_index: int or None
+    local_wait: int or float
+    info: str
+    needs_text: bool
+    handler: object
+    wait_for: dict or None  # condition declared by the 'wait' key of the step, waited for after the action
+    native: bool  # 'native: true' keeps the step out of the batched mode, e.g. a text which needs the webdriver text
+
+    @property
+    def batchable(self) -> bool:
+        return self.operate in BATCH_OPERATIONS and not self.native and self.wait_for is None \
+            and self.by in OBSERVE_BY
+
+
+class ElementCache:
+    """
+    single elements found by driver_element on the current document of a driver: (by, locator, frame) -> WebElement
+    a hit costs no driver command. the cache is cleared on navigation, window or frame switch, session reset and
+    after actions which may load another page (click, submit, enter, js), and when a cached element went stale
+    during an action the action is retried with a new lookup (retry_stale)
+    lists of find_elements are not cached, an ajax update may append new matches without touching the old ones
+    demo：
+    element_cache(driver).stats     {'hits': 12, 'misses': 20, 'hit_rate': 0.375, 'clears': 9, 'stale': 1}
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = setting.WEB_UI.WEB_ELEMENT_CACHE if enabled is None else enabled
+        self.frame = ()  # locators of the frames switched into from the top document
+        self._elements = dict()
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+        self.stale = 0
+
+    def get(self, key: tuple) -> EM or None:
+        element = self._elements.get(key) if self.enabled else None
+        if element is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return element
+
+    def put(self, key: tuple, element: EM) -> None:
+        if self.enabled:
+            self._elements[key] = element
+
+    def clear(self) -> None:
+        if self._elements:
+            self._elements.clear()
+            self.clears += 1
+
+    def switch_frame(self, frame: tuple) -> None:
+        """
+        the driver switched to another frame, the elements of the last one are not used any more
+        :param frame: locators of the frames from the top document
+        :return:
+        """
+        self.frame = frame
+        self.clear()
+
+    @property
+    def stats(self) -> dict:
+        looked = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': round(self.hits / looked, 3) if looked else 0.0,
+                'clears': self.clears, 'stale': self.stale}
+
+
+# driver -> ElementCache, shared by the page objects of a driver and dropped with it
+_ELEMENT_CACHES = weakref.WeakKeyDictionary()
+
+
+def element_cache(driver) -> ElementCache:
+    """
+    element cache of the driver
+    :param driver: driver
+    :return: ElementCache
+    """
+    cache = _ELEMENT_CACHES.get(driver)
+    if cache is None:
+        cache = _ELEMENT_CACHES[driver] = ElementCache()
+    return cache
+
+
+def retry_stale(func):
+    """
+    retry the operation once with new lookups when an element of the cache went stale
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        except StaleElementReferenceException:
+            cache = self.element_cache
+            if not cache.enabled:
+                raise
+            logger.debug(f'stale element in {func.__name__}, find it again')
+            cache.stale += 1
+            cache.clear()
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
 class Base:
 
     def __init__(self, driver):
         self.driver = driver
 
-    def web_by(self, types: str) -> EM or None:
+    @property
+    def element_cache(self) -> ElementCache:
+        """
+        element cache of the driver
+        :return: ElementCache
+        """
+        return element_cache(self.driver)
+
+    @staticmethod
+    def web_by(types: str) -> EM or None:
         """
         get locate type
         :param types:  str  in(id,xpath,link_text/link,partial_link_text/partial,name,
         tag_name/tag,class_name/class,css_selector/css)
         :return:
         """
-        types = types.lower()
-        locate_types = Locate.web_types.value
-
-        if types not in locate_types:
+        by = WEB_BY.get(types.lower())
+        if by is None:
+            locate_types = Locate.web_types.value
             logger.error(f'web only support {locate_types}')
             raise ErrorException(f'operation type {types} is not supported yet')
-
-        if types == "id":
-            return By.ID
-        elif types == "xpath":
-            return By.XPATH
-        elif types == "link_text" or types == "link":
-            return By.LINK_TEXT
-        elif types == "partial_link_text" or types == "partial":
-            return By.PARTIAL_LINK_TEXT
-        elif types == "name":
-            return By.NAME
-        elif types == "tag_name" or types == "tag":
-            return By.TAG_NAME
-        elif types == "class_name" or types == "class":
-            return By.CLASS_NAME
-        elif types == "css" or types == "css_selector":
-            return By.CSS_SELECTOR
-        elif types == "function":
-            return types
-
-        else:
-            logger.error(f"web only support {locate_types}")
-            raise Exception(f'operation type {types} is not supported yet')
+        return by
 
     def get_by_type(self, types: str) -> EM or None:
         """
@@ -131,9 +351,38 @@ class Base:
         :param types:   定位类型
         :return:
         """
-        if CASE_TYPE.lower() == 'web':
+        if setting.CURRENCY.CASE_TYPE.lower() == 'web':
             return self.web_by(types)
 
+    def web_wait(self) -> WebDriverWait:
+        """
+        explicit wait with the timeout and poll frequency of the setting
+        :return: WebDriverWait
+        """
+        web_ui = setting.WEB_UI
+        return WebDriverWait(self.driver, timeout=web_ui.WEB_IMPLICITLY_WAIT_TIME,
+                             poll_frequency=web_ui.WEB_POLL_FREQUENCY)
+
+    def web_observe(self, by: str, locate: str, many: bool = False, visible: bool = False) -> EM or None:
+        """
+        wait for the locator with the observer backend when WEB_WAIT_BACKEND is observer
+        :param by: resolved locate type
+        :param locate: locator
+        :param many: every match
+        :param visible: only visible elements
+        :return: element(s), False when the polling wait has to be used
+        """
+        if setting.WEB_UI.WEB_WAIT_BACKEND != 'observer' or by not in OBSERVE_BY:
+            return False
+        try:
+            element = wait_engine().observe(self.driver, by, locate, many=many, visible=visible)
+        except WebDriverException as e:  # the page navigated during the wait, the script can not run
+            logger.debug(f'observer wait of {locate} failed, poll it. error: {e}')
+            return False
+        if element is None:
+            raise TimeoutException(f'{by}: {locate} not found within {setting.WEB_UI.WEB_IMPLICITLY_WAIT_TIME}s')
+        return element
+
     @property
     def web_title(self):
         """
@@ -176,12 +425,81 @@ class Base:
         else:
             pass
 
+    def web_wait_for(self, condition: str, types: str = None, locate: str = None, index: int = None,
+                     url: str = None, token: str = None, timeout: float = None, budget: float = None,
+                     quiet: float = None, raise_error: bool = False) -> bool:
+        """
+        wait until a condition of the page holds, see wait_engine.WAIT_CONDITIONS
+        ready / present / visible / value_empty / element_stable / dom_quiet / network_idle / url_changed /
+        document_changed / navigated
+        a wait which replaces a fixed sleep passes it as budget, it sleeps the budget when WEB_ADAPTIVE_WAIT is off
+        :param condition: condition
+        :param types: locate type of the element conditions
+        :param locate: locator of the element conditions
+        :param index: index of the element list
+        :param url: url before the action, for url_changed
+        :param token: web_document_token before the action, for document_changed / navigated
+        :param timeout: longest wait: s
+        :param budget: fixed sleep replaced: s
+        :param quiet: quiet period of dom_quiet / network_idle / element_stable: s
+        :param raise_error: raise ErrorException on timeout
+        :return: bool
+        """
+        if budget is not None and not setting.WEB_UI.WEB_ADAPTIVE_WAIT:
+            self.sleep(budget)
+            return True
+        by = self.get_by_type(types) if types else None
+        return wait_engine().wait(self.driver, condition, by=by, locate=locate, index=index, url=url, token=token,
+                                  timeout=timeout, budget=budget, quiet=quiet, raise_error=raise_error)
+
+    def web_document_token(self) -> str or None:
+        """
+        token of the current document, taken before an action to see whether it loaded another page
+        :return: str, None when the page can not run scripts
+        """
+        try:
+            return self.driver.execute_script(DOCUMENT_TOKEN_JS)
+        except WebDriverException:
+            return None
+
+    def web_settle(self, types: str = None, locate: str = None, index: int = None, budget: float = None) -> None:
+        """
+        wait instead of a fixed sleep around a step: for the element to be stable when a locator is given,
+        else for WEB_STEP_WAIT, at most budget
+        :param types: locate type
+        :param locate: locator
+        :param index: index of the element list
+        :param budget: fixed sleep replaced: s
+        :return:
+        """
+        if not budget:
+            return
+        if types and locate and types != 'function':
+            self.web_wait_for('element_stable', types, locate, index, budget=budget)
+        else:
+            self.web_wait_for(setting.WEB_UI.WEB_STEP_WAIT, budget=budget)
+
+    def web_settle_navigation(self, token: str, budget: float = None) -> None:
+        """
+        wait after an action which may load another page: a page which is still complete may not have started
+        the navigation yet, so look for a new document within budget, then wait for WEB_STEP_WAIT on it.
+        without a navigation the wait takes the whole budget like the fixed sleep it replaces
+        :param token: web_document_token before the action
+        :param budget: fixed sleep replaced: s
+        :return:
+        """
+        if not budget:
+            return
+        if self.web_wait_for('document_changed', token=token, budget=budget) and setting.WEB_UI.WEB_ADAPTIVE_WAIT:
+            self.web_wait_for(setting.WEB_UI.WEB_STEP_WAIT)
+
     def web_refresh(self):
         """
         refresh current page
         :return:
         """
         logger.debug('refresh current page')
+        self.element_cache.clear()
         return self.driver.refresh()
 
     def web_back(self):
@@ -190,6 +508,7 @@ class Base:
         :return:
         """
         logger.debug('back to last page')
+        self.element_cache.clear()
         return self.driver.back()
 
     def web_forward(self):
@@ -198,6 +517,7 @@ class Base:
         :return:
         """
         logger.debug('jump to next page')
+        self.element_cache.clear()
         return self.driver.forward()
 
     def web_click(self):
@@ -223,6 +543,7 @@ class Base:
             logger.debug('scroll to bottom')
             self.driver.execute_script("window.scrollBy(0, 10000)")
 
+    @retry_stale
     def web_scroll_to_ele(self, types: str, locate: str, index: int = None) -> None:
         """
         scroll to the position of ele
@@ -272,10 +593,12 @@ class Base:
 
         try:
             logger.debug(f'switch to handle: {handle}')
+            self.element_cache.switch_frame(())
             return self.driver.switch_to.window(handle)
         except Exception as e:
             logger.debug("error of switching to handle -> {0}".format(e))
 
+    @retry_stale
     def web_switch_frame(self, types: str, locate: str, index: int = None) -> None:
         """
         switch frame
@@ -297,6 +620,8 @@ class Base:
             # 单个定位点击
             element = self.driver_element(types=types, locate=locate)
             self.driver.switch_to.frame(element)
+        cache = self.element_cache
+        cache.switch_frame(cache.frame + ((types, locate, index),))
 
     def web_switch_default_content(self) -> None:
         """
@@ -305,6 +630,7 @@ class Base:
         """
         logger.debug('return default node')
         self.driver.switch_to.default_content()
+        self.element_cache.switch_frame(())
 
     def web_switch_parent_frame(self) -> None:
         """
@@ -313,6 +639,8 @@ class Base:
         """
         logger.debug('return parent node')
         self.driver.switch_to.parent_frame()
+        cache = self.element_cache
+        cache.switch_frame(cache.frame[:-1])
 
     def web_switch_to_alert(self) -> EM or None:
         """
@@ -363,25 +691,49 @@ class Base:
 
     def screen_shot(self, doc: str, img_report: bool = True) -> str or None:
         """
-        capture the current interface picture
+        capture the current interface picture, the png is captured once and written by the background writer
         :param doc:  str name of picture
         :param img_report:  bool add img to testing report,default True
         :return:
         """
-
-        filename = doc + "_" + str(round(time.time() * 1000)) + ".png"
+        writer = screen_writer()
+        filename = doc + "_" + str(round(time.time() * 1000)) + writer.extension
         if len(filename) >= 200:
-            filename = str(round(time.time() * 1000)) + ".png"
+            filename = str(round(time.time() * 1000)) + writer.extension
         filepath = os.path.join(RESULT_SCREEN_DIR, filename)
 
-        self.driver.save_screenshot(filepath)
+        start = time.perf_counter()
+        png = self.driver.get_screenshot_as_png()
+        writer.submit(filepath, png, time.perf_counter() - start)
         if img_report:
-            allure.attach(self.driver.get_screenshot_as_png(),
-                          name=filename,
+            import allure
+            allure.attach(png,
+                          name=os.path.splitext(filename)[0] + ".png",
                           attachment_type=allure.attachment_type.PNG)
         logger.debug(f"save the screen in : {filepath}")
         return filepath
 
+    @retry_stale
+    def web_assert_screen(self, name: str, ignore: list = None, ignore_elements: list = None,
+                          update: bool = None) -> dict:
+        """
+        compare the current interface with its baseline in DIFF_IMGPATH, see visual_diff.VisualDiff
+        demo：
+        self.web_assert_screen('google_home', ignore_elements=[('id', 'clock')])
+        :param name: name of the baseline
+        :param ignore: ignored regions [x, y, width, height] of the screenshot: px
+        :param ignore_elements: ignored elements [(types, locate)]
+        :param update: write the screenshot as the new baseline, default WEB_VISUAL_UPDATE
+        :return: dict
+        """
+        regions = list(ignore or [])
+        if ignore_elements:
+            # the screenshot is the viewport: boxes relative to it, not WebElement.rect of the document
+            elements = [self.driver_element(types, locate) for types, locate in ignore_elements]
+            regions += self.driver.execute_script(SCREEN_RECTS_JS, *elements)
+        return visual_diff().assert_image(self.driver.get_screenshot_as_png(), name, ignore=regions, update=update)
+
+    @retry_stale
     def web_get_dropdown_options_count(self, types: str, locate: str) -> str or None:
         """
         get the count of dropdown options
@@ -396,6 +748,7 @@ class Base:
         logger.debug(f'count of dropdown options : {options}')
         return options
 
+    @retry_stale
     def web_element_hover(self, types: str, locate: str) -> EM or None:
         """
         hover to target position
@@ -416,9 +769,8 @@ class Base:
         :param index: index of list
         :return:
         """
-        element = self.driver_element(types, locate)
-        ActionChains(self.driver).move_to_element(element).perform()
-        self.sleep(0.5)
+        self.web_element_hover(types, locate)
+        self.web_settle(types, locate, index, budget=0.5)
         self.often_click(types=types, locate=locate, index=index)
         logger.debug(f"mouse hover at: {locate} click")
 
@@ -451,6 +803,7 @@ class Base:
             logger.debug(f'path of pic: {filename}！')
             return pic_dir
 
+    @retry_stale
     def web_select_locate(self, types: str, locate: str, value: str) -> None:
         """
         operate select， only  used with select tag
@@ -467,8 +820,10 @@ class Base:
         """
         selcet = self.driver_element(types, locate)
         Select(selcet).select_by_visible_text(value)
+        self.element_cache.clear()
         logger.debug('web dropdown select')
 
+    @retry_stale
     def web_is_element_displayed(self, types: str, locate: str) -> EM or None:
         """
         check if the element exists
@@ -509,10 +864,9 @@ class Base:
         """
         types = self.get_by_type(types)
 
-        wait = WebDriverWait(self.driver, timeout=IMPLICITLY_WAIT_TIME,
-                             poll_frequency=POLL_FREQUENCY)
+        wait = self.web_wait()
         try:
-            em = wait.until(EC.presence_of_element_located((types, locate)))
+            em = self.web_observe(types, locate) or wait.until(EC.presence_of_element_located((types, locate)))
             if em:
                 return True
             else:
@@ -531,10 +885,10 @@ class Base:
         """
         types = self.get_by_type(types)
 
-        wait = WebDriverWait(self.driver, timeout=IMPLICITLY_WAIT_TIME,
-                             poll_frequency=POLL_FREQUENCY)
+        wait = self.web_wait()
         try:
-            em = wait.until(EC.visibility_of_element_located((types, locate)))
+            em = self.web_observe(types, locate, visible=True) \
+                 or wait.until(EC.visibility_of_element_located((types, locate)))
             if em:
                 return True
             else:
@@ -553,8 +907,7 @@ class Base:
         """
         types = self.get_by_type(types)
 
-        wait = WebDriverWait(self.driver, timeout=IMPLICITLY_WAIT_TIME,
-                             poll_frequency=POLL_FREQUENCY)
+        wait = self.web_wait()
         try:
             em = wait.until(EC.element_to_be_clickable((types, locate)))
             if em:
@@ -572,10 +925,11 @@ class Base:
         """
         types = self.get_by_type(types)
 
-        wait = WebDriverWait(self.driver, timeout=IMPLICITLY_WAIT_TIME,
-                             poll_frequency=POLL_FREQUENCY)
+        wait = self.web_wait()
         try:
             em = wait.until(EC.frame_to_be_available_and_switch_to_it((types, locate)))
+            cache = self.element_cache
+            cache.switch_frame(cache.frame + ((types, locate, None),))
             return em
         except Exception as e:
             logger.error(e)
@@ -590,8 +944,7 @@ class Base:
         """
         types = self.get_by_type(types)
 
-        wait = WebDriverWait(self.driver, timeout=IMPLICITLY_WAIT_TIME,
-                             poll_frequency=POLL_FREQUENCY)
+        wait = self.web_wait()
         try:
             em = wait.until(EC.element_to_be_selected((types, locate)))
             return em
@@ -599,6 +952,7 @@ class Base:
             logger.error(e)
             return False
 
+    @retry_stale
     def web_send_enter_key(self, types: str, locate: str, index: int = None) -> None:
         """
         send enter key
@@ -617,7 +971,9 @@ class Base:
         else:
             # return first one
             self.driver_element(types=types, locate=locate).send_keys(Keys.ENTER)
+        self.element_cache.clear()
 
+    @retry_stale
     def web_send_down_or_up_key(self, types: str, locate: str, index: int = None, key: str = 'down') -> None:
         """
         press up or down
@@ -651,18 +1007,24 @@ class Base:
         :return: driver
         """
         types = self.get_by_type(types)
+        cache = self.element_cache
+        key = (types, locate, cache.frame)
+        if el is None:  # lists are found every time, see ElementCache
+            element = cache.get(key)
+            if element is not None:
+                return element
+
+        element = self.web_observe(types, locate, many=el is not None)
+        if element is False:  # polling backend
+            if el is not None:  # find_elements
+                element = self.web_wait().until(lambda x: x.find_elements(types, locate))
+            else:  # find_element
+                element = self.web_wait().until(lambda x: x.find_element(types, locate))
+        if el is None:
+            cache.put(key, element)
+        return element
 
-        if el is not None:  # find_elements
-            element = WebDriverWait(self.driver, timeout=IMPLICITLY_WAIT_TIME,
-                                    poll_frequency=POLL_FREQUENCY).until(
-                lambda x: x.find_elements(types, locate))
-            return element
-        else:  # find_element
-            element = WebDriverWait(self.driver, timeout=IMPLICITLY_WAIT_TIME,
-                                    poll_frequency=POLL_FREQUENCY).until(
-                lambda x: x.find_element(types, locate))
-            return element
-
+    @retry_stale
     def web_submit(self, types: str, locate: str, index: int = None) -> None:
         """
         submit form
@@ -681,7 +1043,9 @@ class Base:
         else:
             #
             self.driver_element(types=types, locate=locate).submit()
+        self.element_cache.clear()
 
+    @retry_stale
     def web_right_click(self, types: str, locate: str, index: int = None) -> None:
         """
         right click
@@ -701,7 +1065,9 @@ class Base:
             # single locate click
             element = self.driver_element(types=types, locate=locate, ).click()
             ActionChains(self.driver).context_click(element).perform()
+        self.element_cache.clear()
 
+    @retry_stale
     def web_double_click(self, types: str, locate: str, index: int = None) -> None:
         """
         double click
@@ -721,7 +1087,9 @@ class Base:
 
             element = self.driver_element(types=types, locate=locate)
             ActionChains(self.driver).double_click(element).perform()
+        self.element_cache.clear()
 
+    @retry_stale
     def web_js_clear(self, types: str, locate: str, index: int = None) -> None:
         """
         clear input with js
@@ -748,6 +1116,7 @@ class Base:
         """
         logger.debug('web execute js')
         self.driver.execute_script(js)
+        self.element_cache.clear()
 
     def web_jsclear_continue_input(self, types: str, locate: str, text: str, index: int = None) -> None:
         """
@@ -760,9 +1129,92 @@ class Base:
         """
         logger.debug('clear by js and then input')
         self.web_js_clear(types=types, locate=locate, index=index)
-        self.sleep(0.5)
+        self.web_wait_for('value_empty', types, locate, index, budget=0.5)
         self.often_input(types=types, locate=locate, text=text, index=index)
 
+    def web_elements_data(self, types: str, locate: str, fields: tuple = ('text',), attrs: tuple = (),
+                          wait: bool = True) -> list:
+        """
+        text, value, tag, rect, visibility and attributes of every match of the locator in one call,
+        instead of find_elements and one call per element and field
+        demo：
+        rows = self.web_elements_data('css', 'table#grid tr', fields=('text', 'visible'), attrs=('data-id',))
+        [{'text': 'row 1', 'visible': True, 'attrs': {'data-id': '1'}}, ...]
+        :param types: locate type
+        :param locate: locator
+        :param fields: fields of BULK_FIELDS, rect is [x, y, width, height]
+        :param attrs: attribute names
+        :param wait: wait up to WEB_IMPLICITLY_WAIT_TIME for a first match, else read the page as it is
+        :return: list of dict, one per match in document order
+        """
+        by = self.get_by_type(types)
+        unknown = set(fields) - set(BULK_FIELDS)
+        if unknown or by not in OBSERVE_BY:
+            raise ErrorException(f'bulk data of {by} {fields} is not supported, fields in {BULK_FIELDS}')
+        timeout = setting.WEB_UI.WEB_IMPLICITLY_WAIT_TIME if wait else 0
+        script_timeout(self.driver, timeout + 5)
+        rows = self.driver.execute_async_script(BULK_JS, by, locate, list(fields), list(attrs), int(timeout * 1000))
+        logger.debug(f'bulk data of {locate}: {len(rows)} elements')
+        return rows
+
+    def web_texts(self, types: str, locate: str, wait: bool = True) -> list:
+        """
+        text of every match of the locator in one call
+        :param types: locate type
+        :param locate: locator
+        :param wait: wait for a first match
+        :return: list of str
+        """
+        return [row['text'] for row in self.web_elements_data(types, locate, fields=('text',), wait=wait)]
+
+    def web_attributes(self, types: str, locate: str, name: str, wait: bool = True) -> list:
+        """
+        attribute of every match of the locator in one call
+        :param types: locate type
+        :param locate: locator
+        :param name: attribute name
+        :param wait: wait for a first match
+        :return: list of str or None
+        """
+        rows = self.web_elements_data(types, locate, fields=(), attrs=(name,), wait=wait)
+        return [row['attrs'][name] for row in rows]
+
+    def web_table(self, types: str, locate: str, header: bool = True, numeric: bool = True) -> EM:
+        """
+        cells of a table in one call, as a numpy structured array with one field per column
+        demo：
+        grid = self.web_table('id', 'report')
+        grid['amount'].sum()
+        :param types: locate type
+        :param locate: locator of the table
+        :param header: the first row (or thead) holds the column names
+        :param numeric: number columns as float64
+        :return: numpy.recarray
+        """
+        by = self.get_by_type(types)
+        if by not in OBSERVE_BY:
+            raise ErrorException(f'table of locate type {by} is not supported')
+        timeout = setting.WEB_UI.WEB_IMPLICITLY_WAIT_TIME
+        script_timeout(self.driver, timeout + 5)
+        table = self.driver.execute_async_script(TABLE_JS, by, locate, header, int(timeout * 1000))
+        if table is None:
+            raise TimeoutException(f'table {by}: {locate} not found within {timeout}s')
+        logger.debug(f'table {locate}: {len(table["rows"])} rows, columns {table["columns"]}')
+        return table_array(table['rows'], columns=table['columns'], numeric=numeric)
+
+    def web_assert_table(self, types: str, locate: str, yaml_name: str, case_name: str, max_diff: int = 20) -> dict:
+        """
+        assert a table against the 'table' of a case in data/case, see table_assert.assert_table_case
+        :param types: locate type
+        :param locate: locator of the table
+        :param yaml_name: yaml of data/case, or the test file
+        :param case_name: case name
+        :param max_diff: mismatched cells listed in the error
+        :return: dict
+        """
+        return assert_table_case(self.web_table(types, locate), read_table_data(yaml_name, case_name), max_diff)
+
+    @retry_stale
     def often_text(self, types: str, locate: str, index: int = None) -> None or EM:
         """
         get content of text tag
@@ -782,6 +1234,7 @@ class Base:
             #
             return self.driver_element(types=types, locate=locate).text
 
+    @retry_stale
     def often_click(self, types: str, locate: str, index: int = None) -> None:
         """
         get element and then click
@@ -800,7 +1253,9 @@ class Base:
         else:
             #
             self.driver_element(types=types, locate=locate).click()
+        self.element_cache.clear()
 
+    @retry_stale
     def often_input(self, types: str, locate: str, text: str, index: int = None) -> None:
         """
         get element and type in (also support the input keys)
@@ -819,6 +1274,7 @@ class Base:
         else:
             self.driver_element(types=types, locate=locate, ).send_keys(text)
 
+    @retry_stale
     def often_clear(self, types: str, locate: str, index: int = None) -> None:
         """
         clear input, if it does not work then try to use js_clear
@@ -846,7 +1302,7 @@ class Base:
         """
         logger.debug('clear input and then input')
         self.often_clear(types=types, locate=locate, index=index)
-        self.sleep(0.5)
+        self.web_wait_for('value_empty', types, locate, index, budget=0.5)
         self.often_input(types=types, locate=locate, text=text, index=index)
 
     def get_case(self, yaml_names=None, case_names=None):
@@ -907,45 +1363,45 @@ class Web(Base):
         else:
             if operate == 'input':  # input
                 if text is not None:
-                    self.sleep(wait)
+                    self.web_settle(types, locate, index, budget=wait)
                     logger.debug(notes)
                     return self.often_input(types=types, locate=locate, text=text, index=index)
                 else:
                     logger.error(' the text param is needed for a function')
 
             elif operate == 'click':  # click
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.often_click(types=types, locate=locate, index=index)
 
             elif operate == 'text':  # extract text
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.often_text(types=types, locate=locate, index=index)
 
             elif operate == 'submit':  # submit
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.web_submit(types=types, locate=locate, index=index)
 
             elif operate == 'scroll':  # scroll
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.web_scroll_to_ele(types=types, locate=locate, index=index)
 
             elif operate == 'clear':  # clear
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.often_clear(types=types, locate=locate, index=index)
 
             elif operate == 'jsclear':  # clear with js
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.web_js_clear(types=types, locate=locate, index=index)
 
             elif operate == 'jsclear_continue_input':  # clear by js and then input
                 if text is not None:
-                    self.sleep(wait)
+                    self.web_settle(types, locate, index, budget=wait)
                     logger.debug(notes)
                     return self.web_jsclear_continue_input(types=types, locate=locate, text=text, index=index)
                 else:
@@ -953,60 +1409,131 @@ class Web(Base):
 
             elif operate == 'clear_continue_input':  # clear and then input
                 if text is not None:
-                    self.sleep(wait)
+                    self.web_settle(types, locate, index, budget=wait)
                     return self.often_clear_continue_input(types=types, locate=locate, text=text, index=index)
                 else:
                     logger.debug(' the text param is needed for a function')
 
             elif operate == 'iframe':  # iframe change   switch_default_content (outermost layer) switch_parent_frame
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.web_switch_frame(types=types, locate=locate, index=index)
 
             elif operate == 'web_url':  # get current url
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.web_url
 
             elif operate == 'web_title':  # title
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.web_title
 
             elif operate == 'web_html_content':  # htmle content
-                self.sleep(wait)
+                self.web_settle(types, locate, index, budget=wait)
                 logger.debug(notes)
                 return self.web_html_content
 
-    def webexe(self, yaml_file, case, text=None, wait=0.1):
+    def web_run_step(self, step: Step, text: str = None, wait: int or float = None,
+                     settle: int or float = None) -> EM or None:
+        """
+        execute a compiled step
+        :param step: step of compile_case
+        :param text: input text, only used when the operation types in
+        :param wait: wait time before the operation: s
+        :param settle: wait time after the operation: s, see web_settle / web_settle_navigation
+        :return:
+        """
+        if step.needs_text and text is None:
+            logger.error(' the text param is needed for a function')
+            return None
+        self.web_settle(step.by, step.locate, step.list_index, budget=wait)
+        logger.debug(step.info)
+        wait_for = dict(step.wait_for or {})
+        navigating = step.operate in NAVIGATING_OPERATIONS and settle
+        token = self.web_document_token() if navigating or wait_for.get('condition') in DOCUMENT_CONDITIONS \
+            else None
+        if wait_for.get('condition') == 'url_changed':
+            wait_for['url'] = self.driver.current_url
+        result = step.handler(self, step, text)
+
+        if wait_for:
+            if wait_for['condition'] in DOCUMENT_CONDITIONS:
+                wait_for['token'] = token
+            self.web_wait_for(wait_for.pop('condition'), types=wait_for.pop('types', step.by),
+                              locate=wait_for.pop('locate', step.locate), index=wait_for.pop('index', step.list_index),
+                              raise_error=True, **wait_for)
+        if navigating:
+            self.web_settle_navigation(token, budget=settle)
+        else:
+            self.web_settle(budget=settle)
+        return result
+
+    def web_run_batch(self, steps: Tuple[Step, ...]) -> list:
+        """
+        run batchable steps in one script, see BATCH_JS
+        :param steps: batchable steps
+        :return: [{'ok': bool, 'value': .., 'error': .., 'found': ..}] of the steps which ran, it stops at the
+        first failed one
+        """
+        timeout = setting.WEB_UI.WEB_IMPLICITLY_WAIT_TIME
+        script_timeout(self.driver, timeout * len(steps) + 5)
+        payload = [{'by': step.by, 'locate': step.locate, 'index': step.list_index, 'operate': step.operate}
+                   for step in steps]
+        logger.debug(f'run {len(steps)} steps in one script: {[step.info for step in steps]}')
+        return self.driver.execute_async_script(BATCH_JS, payload, int(timeout * 1000))
+
+    def web_run_steps(self, steps: Tuple[Step, ...], text: str = None, wait: int or float = 0.1,
+                      batch: bool = None) -> EM or None:
+        """
+        run compiled steps, consecutive batchable steps in one script when batch is on
+        a step which failed in the batch before it reached its element runs natively from there, with the usual
+        wait and error. a step which failed on its element is not run again, it raises
+        :param steps: steps of compile_case
+        :param text: input text
+        :param wait: wait time after every step: s
+        :param batch: default WEB_BATCH_STEPS
+        :return: result of the last step which returns one
+        """
+        result = None
+        batch = setting.WEB_UI.WEB_BATCH_STEPS if batch is None else batch
+        for group in group_steps(steps, batch):
+            ran = 0
+            if batch and group[0].batchable:
+                for step, outcome in zip(group, self.web_run_batch(group)):
+                    if not outcome['ok']:
+                        if outcome.get('found'):
+                            raise ErrorException(f'step {step.info} failed in the batch: {outcome["error"]}')
+                        logger.warning(f'step {step.info} failed in the batch: {outcome["error"]}, run it natively')
+                        break
+                    result = outcome['value']
+                    ran += 1
+                if ran:
+                    self.web_settle(budget=wait)
+            for step in group[ran:]:
+                if step.needs_text:
+                    self.web_run_step(step, text=text, settle=wait)
+                else:
+                    result = self.web_run_step(step, settle=wait)
+        return result
+
+    def webexe(self, yaml_file, case, text=None, wait=0.1, batch=None):
         """
         execute steps
+        batch runs consecutive text / scroll / jsclear steps in one script (BATCH_JS), they do what the native steps
+        do with these differences: text is innerText of the element (nbsp as space, trimmed, '' when hidden)
+        instead of the webdriver visible text, so the white space inside it may differ; the steps do not go through
+        the element cache and retry_stale. every other operation, a step with a declared wait and a step marked
+        'native: true' run natively
         :param yaml_file:  yaml
         :param case: yaml cases
         :param text:  context
         :param wait:  wait time: s
+        :param batch: run consecutive batchable steps in one script, default WEB_BATCH_STEPS
         :return:
         """
-        result = None  # result of assert
-
         yaml = replace_py_yaml(yaml_file)
-
-        locator_data = self.get_case(yaml, case)
-        locator_step = locator_data.step_count()
-
-        for locator in range(locator_step):
-            if locator_data.operate(locator) in ('input', 'clear_continue_input', 'jsclear_continue_input'):
-                self.web_judge_execution(types=locator_data.types(locator), locate=locator_data.locate(locator),
-                                         operate=locator_data.operate(locator), notes=locator_data.info(locator),
-                                         text=text, index=locator_data.list_index(locator))
-            else:
-                result = self.web_judge_execution(types=locator_data.types(locator),
-                                                  locate=locator_data.locate(locator),
-                                                  operate=locator_data.operate(locator),
-                                                  notes=locator_data.info(locator),
-                                                  index=locator_data.list_index(locator))
-            self.sleep(wait)
-        return result
+        return self.web_run_steps(compile_case(self.get_case(yaml, case)), text=text, wait=wait, batch=batch)
 
 
 class AutoRunCase(Web):
@@ -1031,26 +1558,112 @@ class AutoRunCase(Web):
         locator_data = self.get_case(yaml, case)
         test_dict = locator_data.test_data()
 
-        locator_step = locator_data.step_count()
-
-        for locator in range(locator_step):
+        for step in compile_case(locator_data):
 
-            if locator_data.operate(locator) in ('input', 'clear_continue_input', 'jsclear_continue_input'):
-
-                self.web_judge_execution(types=locator_data.types(locator), locate=locator_data.locate(locator),
-                                         operate=locator_data.operate(locator), notes=locator_data.info(locator),
-                                         text=test_data[locator], index=locator_data.list_index(locator),
-                                         wait=locator_data.local_wait(locator))
+            if step.needs_text:
+                self.web_run_step(step, text=test_data[step.index], wait=step.local_wait, settle=forwait)
             else:
-                result = self.web_judge_execution(types=locator_data.types(locator),
-                                                  locate=locator_data.locate(locator),
-                                                  operate=locator_data.operate(locator),
-                                                  notes=locator_data.info(locator),
-                                                  index=locator_data.list_index(locator),
-                                                  wait=locator_data.local_wait(locator))
-            self.sleep(forwait)
+                result = self.web_run_step(step, wait=step.local_wait, settle=forwait)
 
         # assert
         if ('assertion' and 'assertype') in test_dict[0] and result:  # only available when the assertion is needed
             is_assertion(test_data, result)
         # return relust
+
+
+# operation -> handler(web, step, text), bound into every compiled step
+STEP_HANDLERS = {
+    'input': lambda web, step, text: web.often_input(step.by, step.locate, text, index=step.list_index),
+    'click': lambda web, step, text: web.often_click(step.by, step.locate, index=step.list_index),
+    'text': lambda web, step, text: web.often_text(step.by, step.locate, index=step.list_index),
+    'submit': lambda web, step, text: web.web_submit(step.by, step.locate, index=step.list_index),
+    'scroll': lambda web, step, text: web.web_scroll_to_ele(step.by, step.locate, index=step.list_index),
+    'clear': lambda web, step, text: web.often_clear(step.by, step.locate, index=step.list_index),
+    'jsclear': lambda web, step, text: web.web_js_clear(step.by, step.locate, index=step.list_index),
+    'jsclear_continue_input': lambda web, step, text: web.web_jsclear_continue_input(step.by, step.locate, text,
+                                                                                    index=step.list_index),
+    'clear_continue_input': lambda web, step, text: web.often_clear_continue_input(step.by, step.locate, text,
+                                                                                  index=step.list_index),
+    'iframe': lambda web, step, text: web.web_switch_frame(step.by, step.locate, index=step.list_index),
+    'web_url': lambda web, step, text: web.web_url,
+    'web_title': lambda web, step, text: web.web_title,
+    'web_html_content': lambda web, step, text: web.web_html_content,
+}
+
+# (yaml path, case name) -> (parsed document, compiled plan)
+_STEP_PLANS = dict()
+
+
+# keys of a declared wait: wait: network_idle  or  wait: {condition: url_changed, timeout: 5}
+WAIT_KEYS = ('condition', 'types', 'locate', 'index', 'timeout', 'quiet')
+
+
+def compile_wait(wait: str or dict or None) -> dict or None:
+    """
+    the condition declared by the 'wait' key of a step
+    :param wait: condition name or dict of WAIT_KEYS
+    :return: dict or None
+    """
+    if not wait:
+        return None
+    wait = {'condition': wait} if isinstance(wait, str) else dict(wait)
+    unknown = set(wait) - set(WAIT_KEYS)
+    if wait.get('condition') not in WAIT_CONDITIONS or unknown:
+        raise ErrorException(f'wait {wait} is not supported, condition in {list(WAIT_CONDITIONS)}, keys in {WAIT_KEYS}')
+    return wait
+
+
+def group_steps(steps: Tuple[Step, ...], batch: bool = True) -> list:
+    """
+    consecutive batchable steps in one group, every other step in a group of its own
+    :param steps: compiled steps
+    :param batch: False puts every step in a group of its own
+    :return: list of tuples of steps
+    """
+    groups = []
+    for step in steps:
+        if batch and step.batchable and groups and groups[-1][-1].batchable:
+            groups[-1] += (step,)
+        else:
+            groups.append((step,))
+    return groups
+
+
+def compile_case(locator_data: GetCaseYaml) -> Tuple[Step, ...]:
+    """
+    compile the steps of a locator case into a plan, the plan is rebuilt only when the yaml file changed
+    :param locator_data: GetCaseYaml of the case
+    :return: tuple of Step
+    """
+    key = (locator_data.FLIE_PATH, locator_data.case_name)
+    document = locator_data.shared_yaml()
+    cached = _STEP_PLANS.get(key)
+    if cached is not None and cached[0] is document:
+        return cached[1]
+
+    case_data = locator_data.get_current_data()
+    if not isinstance(case_data, dict) or not case_data.get('element'):
+        logger.error('test case does not exist, please check the yaml file')
+        raise ErrorException(f'test case {locator_data.case_name} does not exist, please check the yaml file')
+
+    plan = []
+    for index, element in enumerate(case_data.get('element')):
+        operate = element.get('operate')
+        if operate not in Operation.web_operation.value:
+            logger.error(f'the operation {operate} is not supported yet！！！')
+            logger.error(f'only support {Operation.web_operation.value} right now')
+            raise ErrorException(f'the operation {operate} is not supported yet！！！')
+        plan.append(Step(index=index,
+                         by=Base.web_by(element.get('types')),
+                         locate=element.get('locate'),
+                         operate=operate,
+                         list_index=element.get('list_index'),
+                         local_wait=element.get('local_wait') or 0,
+                         info=element.get('info') or '',
+                         needs_text=operate in TEXT_OPERATIONS,
+                         handler=STEP_HANDLERS[operate],
+                         wait_for=compile_wait(element.get('wait')),
+                         native=bool(element.get('native'))))
+    plan = tuple(plan)
+    _STEP_PLANS[key] = (document, plan)
+    return plan
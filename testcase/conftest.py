@@ -5,13 +5,114 @@
 import pytest
 
 from common import WebInit
-from common import read_conf
+from common import setting
+from common.driver_init import close_driver_services, close_session_pool, session_pool
+from common.driver_init import close_health_check, close_local_grid, connect_local_grid, local_grid
+from common.screen_writer import close_screen_writer, flush_screen_writer
+from common.visual_diff import report_visual
+from common.wait_engine import report_waits
+from common.read_data import data_shard, load_data_cache, read_pytest_data, shard_items
 
 
 @pytest.fixture(scope="function")
-def GetDriver():
-    CASE_TYPE = read_conf('CURRENCY').get('CASE_TYPE')
-    if CASE_TYPE.lower() == 'web':
-        driver = WebInit().enable
-        yield driver
-        driver.quit()
+def GetDriver(request):
+    if setting.CURRENCY.CASE_TYPE.lower() == 'web':
+        if setting.WEB_UI.WEB_SESSION_REUSE:  # warm session of the worker pool
+            pool = session_pool()
+            driver = pool.acquire()
+            yield driver
+            failed = any(getattr(request.node, f'rep_{when}', None) is not None
+                         and getattr(request.node, f'rep_{when}').failed for when in ('setup', 'call'))
+            pool.release(driver, failed=failed)
+        else:
+            driver = WebInit().enable
+            yield driver
+            driver.quit()
+
+
+@pytest.hookimpl(tryfirst=True, hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    # keep the report of every phase on the item, GetDriver retires the session of a failed test
+    outcome = yield
+    report = outcome.get_result()
+    setattr(item, f'rep_{report.when}', report)
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_runtest_teardown(item):
+    # the screenshots of a test are on disk before the next one starts
+    flush_screen_writer()
+
+
+def pytest_sessionfinish(session):
+    close_session_pool()
+    close_driver_services()
+    close_local_grid()
+    report_waits()
+    report_visual()
+    close_screen_writer()
+
+
+def pytest_unconfigure(config):
+    # the refresher probes every WEB_HEALTH_TTL until it is stopped
+    close_health_check()
+
+
+def pytest_configure(config):
+    # parse data/ once per run, xdist workers load the precompiled cache
+    load_data_cache()
+
+    config.addinivalue_line('markers', 'testdata(argnames, case_name): parametrize with the rows of read_pytest_data')
+
+    # the controller (or the only process) runs the local grid, the workers connect to it
+    is_controller = bool(config.getoption('numprocesses', None)) and not hasattr(config, 'workerinput')
+    workerinput = getattr(config, 'workerinput', {})
+    if workerinput.get('local_grid'):
+        address, authkey = workerinput['local_grid']
+        connect_local_grid(address, bytes.fromhex(authkey))
+    elif setting.WEB_UI.WEB_LOCAL_GRID and not config.option.collectonly:
+        grid = local_grid()
+        if not is_controller:
+            connect_local_grid(grid.address, grid.authkey)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    # xdist controller: workers see dist == 'no', so the mode is passed in workerinput
+    node.workerinput['data_shard'] = node.config.getoption('dist') == 'each' and setting.CURRENCY.DATA_SHARD
+    grid = local_grid(start=False)
+    if grid is not None:
+        node.workerinput['local_grid'] = (grid.address, grid.authkey.hex())
+
+
+def pytest_generate_tests(metafunc):
+    # --dist each runs every test on every worker; with DATA_SHARD on, each worker only collects its shard instead.
+    # the default load scheduling needs the same collection on every worker and is left as it is
+    mark = metafunc.definition.get_closest_marker('testdata')
+    if mark is not None:
+        argnames, case_name = mark.args
+        metafunc.parametrize(argnames, read_pytest_data(metafunc.module.__file__, case_name,
+                                                        shard=data_shard(metafunc.config)))
+
+
+def pytest_collection_finish(session):
+    # launch the first browsers of this worker in background, only when a selected test uses the driver.
+    # --co, runs without browser tests and the xdist controller (it runs no test) launch none
+    config = session.config
+    web_ui = setting.WEB_UI
+    is_controller = bool(config.getoption('numprocesses', None)) and not hasattr(config, 'workerinput')
+    if setting.CURRENCY.CASE_TYPE.lower() == 'web' and web_ui.WEB_SESSION_REUSE and web_ui.WEB_SESSION_PREWARM \
+            and not is_controller and not config.option.collectonly \
+            and any('GetDriver' in getattr(item, 'fixturenames', ()) for item in session.items):
+        session_pool().prewarm(web_ui.WEB_SESSION_PREWARM)
+
+
+def pytest_collection_modifyitems(config, items):
+    # rows of read_pytest_data are sharded when parametrized, the other tests are sharded by node id
+    shard = data_shard(config)
+    if shard is None:
+        return
+    selected, deselected = shard_items(items, shard)
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
@@ -4,7 +4,6 @@
 import allure
 import pytest
 from page_object.google import Google
-from common.read_data import read_pytest_data
 
 
 class TestGoogle:
@@ -14,7 +13,7 @@ class TestGoogle:
     @allure.title("type in data and search")  # title of testcase
     @allure.description('type in multiple params')  # description of testcase
     @pytest.mark.testgoogle_web  # case tag
-    @pytest.mark.parametrize('content', read_pytest_data(__file__, 'test_google_search'))  # test data
+    @pytest.mark.testdata('content', 'test_google_search')  # test data, see read_pytest_data
     def test_baidu_search(self, GetDriver, content):
         google = Google(GetDriver)
 
@@ -24,7 +23,7 @@ class TestGoogle:
         with allure.step('click search'):
             google.click_search_button()
 
-            google.sleep(3)
+            google.web_wait_for('network_idle', budget=3)
 
             # 对比查询后图片结果
             search_relust = google.screen_shot('search')
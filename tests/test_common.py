@@ -0,0 +1,73 @@
+import pytest
+
+from common.common import ErrorException, Setting, logger
+
+SETTING_YAML = """
+- CURRENCY:
+    LEVEL: 'INFO'
+- WEB_UI:
+    WEB_URL: 'https://example.com'
+    WEB_HUB_HOST: ['hub1:4444', ' hub2:4444 ']
+    WEB_IMPLICITY_WAIT_TIME: 3
+"""
+
+
+@pytest.fixture
+def setting_yaml(tmp_path):
+    path = tmp_path / 'setting.yaml'
+    path.write_text(SETTING_YAML, encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def warnings():
+    messages = []
+    sink = logger.add(messages.append, level='WARNING', format='{message}')
+    yield messages
+    logger.remove(sink)
+
+
+def test_setting_reads_the_typed_sections(setting_yaml):
+    setting = Setting(setting_yaml)
+    assert setting.CURRENCY.LEVEL == 'INFO'
+    assert setting.WEB_UI.WEB_URL == 'https://example.com'
+    assert setting.WEB_UI.hub_hosts == ['hub1:4444', 'hub2:4444']
+    assert setting.WEB_UI.WEB_IMPLICITLY_WAIT_TIME == 10  # the misspelled key is not applied
+
+
+def test_setting_warns_about_unknown_keys(setting_yaml, warnings):
+    Setting(setting_yaml)
+    assert any('WEB_IMPLICITY_WAIT_TIME' in message for message in warnings)
+
+
+def test_setting_environment_overrides(setting_yaml, monkeypatch):
+    monkeypatch.setenv('WEBUI_WEB_IS_COLONY', 'true')
+    monkeypatch.setenv('WEBUI_WEB_HUB_SLOTS', '7')
+    monkeypatch.setenv('WEBUI_WEB_HUB_HOST', 'a:1,b:2')
+    setting = Setting(setting_yaml)
+    assert setting.WEB_UI.WEB_IS_COLONY is True
+    assert setting.WEB_UI.WEB_HUB_SLOTS == 7
+    assert setting.WEB_UI.hub_hosts == ['a:1', 'b:2']
+
+
+def test_setting_converts_the_yaml_values_to_the_field_types(tmp_path):
+    path = tmp_path / 'setting.yaml'
+    path.write_text("- WEB_UI:\n    WEB_IS_COLONY: 'false'\n    WEB_HUB_SLOTS: '3'\n    WEB_POLL_FREQUENCY: 1\n"
+                    "    WEB_URL:\n", encoding='utf-8')
+    setting = Setting(str(path))
+    assert setting.WEB_UI.WEB_IS_COLONY is False
+    assert setting.WEB_UI.WEB_HUB_SLOTS == 3
+    assert isinstance(setting.WEB_UI.WEB_POLL_FREQUENCY, float)
+    assert setting.WEB_UI.WEB_URL == ''  # an empty key keeps the default
+
+
+def test_setting_rejects_a_value_of_the_wrong_type(tmp_path):
+    path = tmp_path / 'setting.yaml'
+    path.write_text("- WEB_UI:\n    WEB_HUB_SLOTS: 'many'\n", encoding='utf-8')
+    with pytest.raises(ErrorException, match='WEB_HUB_SLOTS'):
+        Setting(str(path))
+
+
+def test_setting_fails_on_an_unreadable_yaml(tmp_path):
+    with pytest.raises(ErrorException, match='can not be read'):
+        Setting(str(tmp_path / 'missing.yaml'))
@@ -0,0 +1,374 @@
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import SessionNotCreatedException, WebDriverException
+
+from common import driver_init
+from common.driver_init import FONT_URLS, DriverServices, GridClient, HealthCheck, HubDispatcher, LocalGrid, \
+    SessionPool, WebInit, close_health_check
+from common.web_base import element_cache
+
+
+class FakeDriver:
+    def __init__(self):
+        self.window_handles = ['main']
+        self.switch_to = self
+        self.url = None
+        self.quit_called = False
+
+    def window(self, handle):
+        pass
+
+    def delete_all_cookies(self):
+        pass
+
+    def execute_script(self, script, *args):
+        pass
+
+    def execute_cdp_cmd(self, cmd, params):
+        pass
+
+    def get(self, url):
+        self.url = url
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_session_pool_reuses_a_released_session():
+    pool = SessionPool(factory=FakeDriver, max_uses=2, url='about:blank', standby=0)
+    driver = pool.acquire()
+    element_cache(driver).enabled = True
+    element_cache(driver).put(('id', 'su', ()), object())
+    pool.release(driver)
+    assert pool.acquire() is driver and driver.url == 'about:blank'
+    assert not element_cache(driver)._elements  # reset drops the elements of the last page
+    pool.release(driver)  # used up after max_uses tests
+    assert driver.quit_called
+    assert pool.stats['hits'] == 1 and pool.stats['misses'] == 1
+
+
+def test_session_pool_retires_the_session_of_a_failed_test():
+    pool = SessionPool(factory=FakeDriver, url='about:blank', standby=0)
+    driver = pool.acquire()
+    pool.release(driver, failed=True)
+    assert driver.quit_called and pool.acquire() is not driver
+
+
+def test_session_pool_does_not_wait_forever_for_a_hung_launch():
+    hang = threading.Event()
+    launches = []
+
+    def factory():
+        if not launches:
+            launches.append('hung')
+            hang.wait(10)
+        return FakeDriver()
+
+    pool = SessionPool(factory=factory, url='about:blank', standby=0, launch_wait=0.2)
+    pool.prewarm(1)
+    time.sleep(0.05)
+    start = time.monotonic()
+    assert pool.acquire() is not None
+    assert time.monotonic() - start < 2
+    assert pool.stats['waits'] == 1 and pool.stats['misses'] == 1
+    hang.set()
+    pool.close(timeout=5)
+
+
+def probing(results: list):
+    check = HealthCheck(ttl=60, timeout=1, head=True)
+    probed = []
+
+    def probe(url):
+        probed.append(url)
+        return results.pop(0)
+
+    check.probe = probe
+    return check, probed
+
+
+def test_health_check_caches_an_available_url():
+    check, probed = probing([True])
+    assert check.check('http://a') and check.check('http://a')
+    assert probed == ['http://a']
+    check.stop()
+
+
+def test_health_check_probes_again_after_a_failure():
+    check, probed = probing([False, True])
+    assert check.check('http://a') is False
+    assert check.check('http://a') is True
+    assert probed == ['http://a', 'http://a']
+    check.stop()
+
+
+def test_close_health_check_stops_the_refresher(monkeypatch):
+    check, _ = probing([True])
+    monkeypatch.setattr(driver_init, '_HEALTH_CHECK', check)
+    check.check('http://a')
+    close_health_check()
+    check._refresher.join(2)
+    assert not check._refresher.is_alive() and driver_init._HEALTH_CHECK is None
+
+
+def dispatcher(**kwargs) -> HubDispatcher:
+    hubs = HubDispatcher(hubs=['hub1:4444'], slots=2, timeout=5, poll=0.01, backoff=0.01, **kwargs)
+    hubs.grid_free = lambda host: None  # own accounting, no grid status
+    return hubs
+
+
+def test_hub_dispatcher_retries_a_busy_hub():
+    hubs, attempts = dispatcher(), []
+
+    def create(host):
+        attempts.append(host)
+        if len(attempts) < 3:
+            raise SessionNotCreatedException('Could not start a new session. New session request timed out')
+        return FakeDriver()
+
+    driver = hubs.create(create)
+    assert len(attempts) == 3 and hubs.stats['hub1:4444']['active'] == 1
+    driver.quit()
+    assert hubs.stats['hub1:4444']['active'] == 0
+
+
+def test_hub_dispatcher_raises_a_deterministic_error_at_once():
+    hubs, attempts = dispatcher(), []
+
+    def create(host):
+        attempts.append(host)
+        raise SessionNotCreatedException('cannot find : Capabilities {browserName: netscape}')
+
+    start = time.monotonic()
+    with pytest.raises(SessionNotCreatedException):
+        hubs.create(create)
+    assert len(attempts) == 1 and time.monotonic() - start < 1
+    assert hubs.stats['hub1:4444']['active'] == 0
+
+
+def test_hub_dispatcher_retryable_errors():
+    assert HubDispatcher.retryable(ConnectionRefusedError())
+    assert not HubDispatcher.retryable(WebDriverException('invalid argument: unrecognized capability'))
+    assert not HubDispatcher.retryable(ValueError('bad'))
+
+
+class FakeRemoteDriver:
+    """remote sessions of selenium 4.1 have no execute_cdp_cmd"""
+
+    def __init__(self):
+        self.command_executor = type('Executor', (), {'_commands': {}})()
+        self.commands = []
+        self.url = None
+
+    def execute(self, command, params=None):
+        self.commands.append((command, params))
+        return {'value': {}}
+
+    def maximize_window(self):
+        pass
+
+    def get(self, url):
+        self.url = url
+
+
+def test_cluster_session_gets_the_launch_profile(monkeypatch):
+    init = WebInit()
+    init.browser = 'chrome'
+    init.profile = dict(init.profile, blocked_urls=['*.gif'], disable_fonts=True, disable_images=True)
+    driver = FakeRemoteDriver()
+    created = {}
+
+    class Hubs:
+        def create(self, factory):
+            created['factory'] = factory
+            return driver
+
+    monkeypatch.setattr(driver_init, 'hub_dispatcher', lambda: Hubs())
+    options = init.remote_options()
+    assert options.experimental_options['prefs']['profile.managed_default_content_settings.images'] == 2
+
+    assert init.browaer_setups_args({}) is driver and driver.url == init.url
+    assert 'executeCdpCommand' in driver.command_executor._commands
+    assert driver.commands[-1] == ('executeCdpCommand', {'cmd': 'Network.setBlockedURLs',
+                                                         'params': {'urls': ['*.gif'] + FONT_URLS}})
+
+
+class FakeProcess:
+    def __init__(self):
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+
+class FakeService:
+    started = []
+
+    def __init__(self, browser, delay=0.0):
+        self.browser = browser
+        self.delay = delay
+        self.process = None
+        self.service_url = None
+        self.stopped = False
+
+    def start(self):
+        time.sleep(self.delay)
+        self.process = FakeProcess()
+        self.service_url = f'http://localhost:{9000 + len(FakeService.started)}'
+        FakeService.started.append(self)
+
+    def stop(self):
+        self.stopped = True
+        self.process.kill()
+
+
+class FakeServices(DriverServices):
+    delays = {}
+
+    @staticmethod
+    def new_service(browser, executable, log_path=None):
+        return FakeService(browser, FakeServices.delays.get(browser, 0.0))
+
+
+def test_driver_service_is_reused_across_sessions():
+    services = FakeServices()
+    first = services.lease('chrome', 'chromedriver')
+    url = first.service_url
+    first.stop()
+    first.stop()  # a second stop does not give the session back twice
+    second = services.lease('chrome', 'chromedriver')
+    assert second.service_url == url and services.stats['starts'] == 1 and services.stats['leases'] == 2
+    second.stop()
+    services.close()
+
+
+def test_driver_service_is_restarted_after_its_process_died():
+    services = FakeServices()
+    lease = services.lease('chrome', 'chromedriver')
+    lease.stop()
+    lease.process.kill()
+    assert services.lease('chrome', 'chromedriver').service_url != lease.service_url
+    assert services.stats['restarts'] == 1 and services.stats['starts'] == 2
+
+
+def test_driver_service_sessions_are_limited_per_browser():
+    services = FakeServices()
+    chrome = [services.lease('chrome', 'chromedriver') for _ in range(3)]
+    firefox = [services.lease('firefox', 'geckodriver') for _ in range(2)]
+    assert len({lease.service_url for lease in chrome}) == 1  # SERVICE_SESSIONS chrome: 0 is unlimited
+    assert len({lease.service_url for lease in firefox}) == 2  # geckodriver serves one session
+    firefox[0].stop()
+    assert services.lease('firefox', 'geckodriver').service_url == firefox[0].service_url
+
+
+def test_slow_driver_start_does_not_hold_up_other_browsers(monkeypatch):
+    monkeypatch.setattr(FakeServices, 'delays', {'chrome': 0.5})
+    services = FakeServices()
+    thread = threading.Thread(target=services.lease, args=('chrome', 'chromedriver'))
+    thread.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    services.lease('firefox', 'geckodriver')
+    assert time.monotonic() - start < 0.3
+    thread.join()
+
+
+def test_lease_writes_reach_the_service():
+    services = FakeServices()
+    lease = services.lease('chrome', 'chromedriver')
+    lease.log_file = 'driver.log'
+    assert lease._entry.service.log_file == 'driver.log' and lease.browser == 'chrome'
+
+
+def grid(max_browsers, timeout=5.0):
+    return LocalGrid(max_browsers=max_browsers, timeout=timeout,
+                     service_factory=lambda browser, executable: FakeService(browser))
+
+
+def test_local_grid_never_runs_more_than_max_browsers():
+    hosts, lock, held, peak = grid(2), threading.Lock(), [0], [0]
+
+    def worker(name):
+        for _ in range(5):
+            slot = hosts._grant(name, ('chrome', 'chromedriver'))
+            with lock:
+                held[0] += 1
+                peak[0] = max(peak[0], held[0])
+            time.sleep(0.005)
+            with lock:
+                held[0] -= 1
+            hosts._release(name, slot)
+
+    threads = [threading.Thread(target=worker, args=(f'gw{index}',)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2 and hosts.stats['max_active'] == 2 and hosts.stats['granted'] == 30
+    assert hosts.stats['starts'] == 2 and hosts.stats['active'] == 0
+
+
+def test_local_grid_serves_waiters_in_order():
+    hosts, order = grid(1), []
+    holder = hosts._grant('gw0', ('chrome', 'chromedriver'))
+
+    def worker(name):
+        slot = hosts._grant(name, ('chrome', 'chromedriver'))
+        order.append(name)
+        hosts._release(name, slot)
+
+    threads = []
+    for name in ('gw1', 'gw2', 'gw3'):
+        threads.append(threading.Thread(target=worker, args=(name,)))
+        threads[-1].start()
+        time.sleep(0.05)  # queued one after the other
+    assert hosts.stats['queued'] == 3
+    hosts._release('gw0', holder)
+    for thread in threads:
+        thread.join()
+    assert order == ['gw1', 'gw2', 'gw3']
+
+
+def test_local_grid_swaps_an_idle_process_of_another_driver():
+    hosts = grid(1)
+    chrome = hosts._grant('gw0', ('chrome', 'chromedriver'))
+    service = chrome.service
+    hosts._release('gw0', chrome)
+    firefox = hosts._grant('gw0', ('firefox', 'geckodriver'))
+    assert service.stopped and firefox.service.browser == 'firefox' and hosts.stats['starts'] == 2
+
+
+def test_local_grid_times_out_when_every_browser_is_busy():
+    hosts = grid(1, timeout=0.1)
+    hosts._grant('gw0', ('chrome', 'chromedriver'))
+    assert hosts._grant('gw1', ('chrome', 'chromedriver')) is None and hosts.stats['timeouts'] == 1
+
+
+def wait_until(check, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not check() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return check()
+
+
+def test_grid_client_lease_and_disconnect_free_the_slot():
+    hosts = grid(1)
+    hosts.start()
+    try:
+        client = GridClient(hosts.address, hosts.authkey, worker='gw1')
+        lease = client.lease('chrome', 'chromedriver')
+        assert lease.service_url.startswith('http://localhost:') and hosts.stats['active'] == 1
+        lease.stop()  # driver.quit gives the process back
+        assert wait_until(lambda: hosts.stats['active'] == 0)
+
+        lease = client.lease('chrome', 'chromedriver')
+        lease._conn.close()  # the worker died without releasing
+        assert wait_until(lambda: hosts.stats['active'] == 0)
+        assert client.lease('chrome', 'chromedriver').service_url == lease.service_url
+    finally:
+        hosts.close()
@@ -0,0 +1,198 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from common import read_data
+from common.common import ErrorException, load_yaml
+from common.read_data import (RANDOM_BLOCK, DataRows, GetCaseYaml, RandomPool, RedaExcel, YamlCache, data_shard,
+                              read_pytest_data, shard_items, stable_shard, yaml_cache)
+
+CASE_YAML = """
+- model: demo
+- case_name: test_login
+  title: login
+  testdata:
+    - {user: u1, tags: [a, b]}
+    - {user: u2, tags: [c]}
+"""
+
+
+def write(path, text: str) -> str:
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_yaml_cache_parses_once(tmp_path):
+    cache = YamlCache()
+    path = write(tmp_path / 'case.yaml', CASE_YAML)
+    first = cache.get(path, load_yaml)
+    assert cache.get(path, load_yaml) is first
+    assert cache.stats == {'hits': 1, 'misses': 1, 'entries': 1}
+
+
+def test_yaml_cache_touched_file_is_not_parsed_again(tmp_path):
+    cache = YamlCache()
+    path = write(tmp_path / 'case.yaml', CASE_YAML)
+    first = cache.get(path, load_yaml)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.get(path, load_yaml) is first
+    assert cache.misses == 1
+
+
+def test_yaml_cache_changed_file_is_parsed_again(tmp_path):
+    cache = YamlCache()
+    path = write(tmp_path / 'case.yaml', CASE_YAML)
+    cache.get(path, load_yaml)
+    write(tmp_path / 'case.yaml', CASE_YAML.replace('u1', 'user1'))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.get(path, load_yaml)[1]['testdata'][0]['user'] == 'user1'
+    assert cache.misses == 2
+
+
+def test_readers_get_their_own_copy_of_a_record(tmp_path):
+    path = write(tmp_path / 'case.yaml', CASE_YAML)
+    reader = GetCaseYaml(path, 'test_login')
+    assert reader.open_yaml() is yaml_cache.get(path, load_yaml)  # no copy of the whole document per call
+    reader.get_current_data()['title'] = 'changed'
+    reader.get_param('testdata')[0]['tags'].append('x')
+    reader.test_data_values()[0][1].append('y')
+    assert reader.get_param('title') == 'login'
+    assert reader.get_param('testdata')[0]['tags'] == ['a', 'b']
+    assert reader.shared_yaml() is yaml_cache.get(path, load_yaml)
+
+
+@pytest.fixture
+def data_tree(tmp_path, monkeypatch):
+    case_dir, locator_dir = tmp_path / 'case', tmp_path / 'locator'
+    case_dir.mkdir()
+    locator_dir.mkdir()
+    monkeypatch.setattr(read_data, 'CASE_YMAL_DIR', str(case_dir))
+    monkeypatch.setattr(read_data, 'LOCATOR_YMAL_DIR', str(locator_dir))
+    monkeypatch.setattr(read_data, 'yaml_cache', YamlCache())
+    good = write(case_dir / 'good.yaml', CASE_YAML)
+    broken = write(locator_dir / 'broken.yaml', '- case_name: [unclosed\n')
+    return good, broken
+
+
+def test_data_cache_is_built_once_and_loaded(data_tree, tmp_path):
+    good, _ = data_tree
+    cache_dir = str(tmp_path / 'temp')
+    assert read_data.load_data_cache(cache_dir) is False
+    read_data.yaml_cache = YamlCache()
+    assert read_data.load_data_cache(cache_dir) is True
+    assert good in read_data.yaml_cache.export()
+
+
+def test_data_cache_leaves_out_a_broken_yaml(data_tree, tmp_path):
+    good, broken = data_tree
+    read_data.load_data_cache(str(tmp_path / 'temp'))
+    cached = read_data.yaml_cache.export()
+    assert good in cached and broken not in cached
+    assert GetCaseYaml(good, 'test_login').get_param('title') == 'login'
+
+
+def test_data_cache_goes_without_an_unwritable_dir(data_tree, tmp_path):
+    good, _ = data_tree
+    blocker = write(tmp_path / 'not_a_dir', '')
+    assert read_data.load_data_cache(os.path.join(blocker, 'temp')) is False
+    assert good in read_data.yaml_cache.export()
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    excel = RedaExcel(write(tmp_path / 'data.xlsx', ''))
+    excel._columnar = (['A', 'B', 'C'], [tuple(f'{c}{row}' for row in range(10)) for c in 'ABC'])
+    return excel
+
+
+def test_iter_rows_projects_columns_and_rows(sheet):
+    assert list(sheet.iter_rows(columns=['C', 'A'], start=2, stop=4)) == [{'C': 'C2', 'A': 'A2'},
+                                                                         {'C': 'C3', 'A': 'A3'}]
+    assert len(sheet.data) == 10
+
+
+def test_iter_rows_shards_cover_every_row_once(sheet):
+    shards = [[row['A'] for row in sheet.iter_rows(start=1, shard=(index, 3))] for index in range(3)]
+    assert sorted(sum(shards, [])) == [f'A{row}' for row in range(1, 10)]
+    assert shards[1] == ['A1', 'A4', 'A7']
+
+
+def test_iter_rows_rejects_unknown_columns(sheet):
+    with pytest.raises(ErrorException):
+        list(sheet.iter_rows(columns=['D']))
+
+
+def test_random_pool_workers_split_one_stream():
+    single = RandomPool(seed=7, size=4 * RANDOM_BLOCK, shard=(0, 1))
+    stream = [single.take('name') for _ in range(4 * RANDOM_BLOCK)]
+    workers = [RandomPool(seed=7, size=2 * RANDOM_BLOCK, low_water=0, shard=(index, 2)) for index in range(2)]
+    taken = [[pool.take('name') for _ in range(2 * RANDOM_BLOCK)] for pool in workers]
+
+    blocks = [stream[b * RANDOM_BLOCK:(b + 1) * RANDOM_BLOCK] for b in range(4)]
+    assert taken[0] == blocks[0] + blocks[2]
+    assert taken[1] == blocks[1] + blocks[3]
+    assert [pool.stats['generated'] for pool in workers] == [2 * RANDOM_BLOCK] * 2  # nothing thrown away
+
+
+def test_random_pool_unique_values_do_not_repeat():
+    pool = RandomPool(seed=1, size=100, unique=('month',), shard=(0, 1))
+    months = [pool.take('month') for _ in range(12)]
+    assert len(set(months)) == 12
+    with pytest.raises(ErrorException):
+        pool.take('month')
+
+
+def test_random_pool_rejects_unknown_fields():
+    with pytest.raises(ErrorException):
+        RandomPool(shard=(0, 1)).take('planet')
+
+
+class Item:
+    def __init__(self, nodeid: str, *marks):
+        self.nodeid = nodeid
+        self.marks = [getattr(mark, 'mark', mark) for mark in marks]
+
+    def iter_markers(self, name: str):
+        return (mark for mark in self.marks if mark.name == name)
+
+
+def test_stable_shard_is_stable_and_spread():
+    assert stable_shard(('u1', 'p1'), 4) == stable_shard(('u1', 'p1'), 4)
+    spread = [stable_shard(f'test_{index}', 4) for index in range(400)]
+    assert all(60 < spread.count(index) < 140 for index in range(4))
+
+
+def test_read_pytest_data_marks_the_sharded_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(read_data, 'CASE_YMAL_DIR', str(tmp_path))
+    write(tmp_path / 'test_login.yaml', CASE_YAML)
+    rows = read_pytest_data('test_login.py', 'test_login', shard=(0, 1))
+    assert isinstance(rows, DataRows) and rows.shard == (0, 1) and len(rows) == 2
+    assert read_pytest_data('test_login.py', 'test_login').shard is None
+
+
+def test_data_shard_comes_from_the_workerinput():
+    class Config:
+        def __init__(self, **workerinput):
+            self.workerinput = workerinput
+
+    assert data_shard(object()) is None  # no xdist worker
+    assert data_shard(Config(workerid='gw1', workercount=3, data_shard=False)) is None
+    assert data_shard(Config(workerid='gw1', workercount=3, data_shard=True)) == (1, 3)
+
+
+def test_shard_items_keeps_data_rows_and_splits_the_rest():
+    sharded = DataRows([('a',), ('b',)], shard=(0, 2))
+    items = [Item(f'test_data[{index}]', pytest.mark.parametrize('x', sharded)) for index in range(2)]
+    items += [Item(f'test_marked[{index}]', SimpleNamespace(name='testdata')) for index in range(2)]
+    items += [Item(f'test_other[{index}]', pytest.mark.parametrize('x', [1, 2])) for index in range(20)]
+    items += [Item(f'test_plain_{index}') for index in range(20)]
+
+    selected, deselected = shard_items(items, (0, 2))
+    assert items[:4] == selected[:4]
+    assert set(map(id, selected)) | set(map(id, deselected)) == set(map(id, items))
+    others = [item for item in items[4:] if item in selected]
+    assert all(stable_shard(item.nodeid, 2) == 0 for item in others)
+    assert 0 < len([item for item in others if item.nodeid.startswith('test_other')]) < 20
@@ -0,0 +1,63 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from common.screen_writer import ScreenWriter
+
+
+def png(width: int = 8, height: int = 6) -> bytes:
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :width // 2] = (0, 0, 255)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def test_writer_writes_every_queued_screenshot_on_flush(tmp_path):
+    writer = ScreenWriter(fmt='png', queue_size=4)
+    data = png()
+    for index in range(10):
+        writer.submit(str(tmp_path / f'shot_{index}.png'), data, 0.01)
+    writer.flush()
+    assert sorted(os.listdir(tmp_path)) == sorted(f'shot_{index}.png' for index in range(10))
+    stats = writer.stats
+    assert stats['captures'] == 10 and stats['written'] == 10 and stats['queue_depth'] == 0
+    assert stats['capture_avg_ms'] == 10.0 and stats['queue_max'] <= 4
+    writer.close()
+
+
+def test_full_queue_blocks_the_test_thread(tmp_path):
+    writer = ScreenWriter(fmt='png', queue_size=1)
+    release = threading.Event()
+    write = writer.write
+    writer.write = lambda filepath, data: (release.wait(5), write(filepath, data))
+    for index in range(3):
+        if index == 2:
+            threading.Timer(0.1, release.set).start()
+        writer.submit(str(tmp_path / f'shot_{index}.png'), png())
+    writer.close()
+    assert writer.stats['blocked'] >= 1 and writer.stats['written'] == 3
+
+
+def test_writer_without_queue_writes_in_the_test_thread(tmp_path):
+    writer = ScreenWriter(fmt='png', queue_size=0)
+    writer.submit(str(tmp_path / 'shot.png'), png())
+    assert writer._thread is None and (tmp_path / 'shot.png').read_bytes() == png()
+
+
+def test_jpg_is_encoded_with_opencv(tmp_path):
+    writer = ScreenWriter(fmt='jpeg', quality=80, queue_size=0)
+    assert writer.format == 'jpg' and writer.extension == '.jpg'
+    writer.submit(str(tmp_path / 'shot.jpg'), png())
+    image = cv2.imread(str(tmp_path / 'shot.jpg'))
+    assert image.shape == (6, 8, 3)
+
+
+def test_unknown_format_falls_back_to_png():
+    assert ScreenWriter(fmt='bmp', queue_size=0).format == 'png'
+
+
+def test_failed_write_is_counted_not_raised(tmp_path):
+    writer = ScreenWriter(fmt='jpg', queue_size=0)
+    writer.submit(str(tmp_path / 'broken.jpg'), b'not a png')
+    assert writer.stats['failed'] == 1 and writer.stats['written'] == 0
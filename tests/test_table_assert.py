@@ -0,0 +1,51 @@
+import pytest
+
+from common.table_assert import TableMismatch, assert_table, assert_table_case, table_array
+
+COLUMNS = ['name', 'qty', 'price']
+
+
+def test_table_array_types_the_columns_and_keeps_the_text():
+    data = table_array([['apple', '3', '1,200.50'], ['pear', '5']], columns=COLUMNS)
+    assert data.dtype['name'].kind == 'U' and data.dtype['qty'].kind == 'f'
+    assert data['qty'].sum() == 8 and data.text[0, 2] == '1,200.50' and data.text[1, 2] == ''
+
+
+@pytest.mark.parametrize('columns', [[], ['name', 'qty']])
+def test_table_array_of_no_rows_is_an_empty_structured_array(columns):
+    data = table_array([], columns=columns)
+    assert len(data) == 0 and list(data.dtype.names or []) == columns
+
+
+def test_assert_table_lists_the_mismatched_cells():
+    actual = table_array([['apple', '3', '1.20'], ['pear', '6', '0.80']], columns=COLUMNS)
+    expect = table_array([['apple', '3', '1.21'], ['pear', '5', '0.80']], columns=COLUMNS)
+    assert assert_table(actual, expect, columns=['name', 'price'], tolerance={'price': 0.02})['mismatched'] == 0
+    with pytest.raises(TableMismatch) as error:
+        assert_table(actual, expect, tolerance=0.02)
+    assert error.value.diff == [{'row': 1, 'column': 'qty', 'actual': 6.0, 'expect': 5.0}]
+
+
+def test_text_column_of_the_case_is_compared_with_the_text_of_the_page():
+    table = {'columns': ['code', 'qty'], 'rows': [['007', 1], ['010', 2]]}
+    assert_table_case(table_array([['007', '1.0'], ['010', '2']], columns=['code', 'qty']), table)
+    with pytest.raises(TableMismatch):  # 7 is not the code 007, though both are numbers
+        assert_table_case(table_array([['7', '1'], ['10', '2']], columns=['code', 'qty']), table)
+
+
+def test_unordered_tables_sort_both_sides_by_the_same_typed_keys():
+    # the page column holds numbers, the expected one text: both sort as text
+    table = {'columns': ['code', 'name'], 'rows': [['10', 'b'], ['9', 'a']], 'ordered': False}
+    assert_table_case(table_array([['9', 'a'], ['10', 'b']], columns=['code', 'name']), table)
+    # number columns sort by value on both sides, 10 after 9
+    actual = table_array([['10', 'b'], ['9', 'a']], columns=['qty', 'name'])
+    expect = table_array([['9.0', 'a'], ['10.0', 'b']], columns=['qty', 'name'])
+    assert assert_table(actual, expect, ordered=False, key=['qty'])['mismatched'] == 0
+
+
+def test_assert_table_checks_the_shape():
+    actual = table_array([['apple', '3']], columns=['name', 'qty'])
+    with pytest.raises(TableMismatch):
+        assert_table(actual, table_array([['apple', '3', '1']], columns=COLUMNS))
+    with pytest.raises(TableMismatch):
+        assert_table(actual, table_array([['apple', '3'], ['pear', '5']], columns=['name', 'qty']))
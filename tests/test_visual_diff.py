@@ -0,0 +1,84 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from common.visual_diff import VisualDiff, VisualMismatch, region_mask
+from common.web_base import Base
+
+
+def page(width: int = 320, height: int = 200) -> np.ndarray:
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    cv2.rectangle(image, (0, 0), (width, 30), (60, 60, 60), -1)
+    for line in range(50, height - 10, 20):
+        cv2.putText(image, f'line {line}', (10, line), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (30, 30, 30), 1)
+    return image
+
+
+def engine(tmp_path, **kwargs) -> VisualDiff:
+    return VisualDiff(baseline_dir=str(tmp_path / 'baseline'), output_dir=str(tmp_path / 'visual'), threshold=0.001,
+                      tolerance=16, min_ssim=0.98, update=False, **kwargs)
+
+
+def test_missing_baseline_fails_unless_update(tmp_path):
+    diff = engine(tmp_path)
+    with pytest.raises(VisualMismatch, match='there is no baseline'):
+        diff.assert_image(page(), 'home')
+    assert not os.path.isfile(diff.baseline('home')) and diff.stats['missing'] == 1
+    assert diff.assert_image(page(), 'home', update=True)['status'] == 'created'
+    assert diff.assert_image(page(), 'home')['status'] == 'compared'
+
+
+def test_changed_region_fails_and_writes_the_heatmap(tmp_path):
+    diff = engine(tmp_path)
+    diff.assert_image(page(), 'home', update=True)
+    changed = page()
+    cv2.rectangle(changed, (100, 80), (160, 120), (0, 0, 255), -1)
+    with pytest.raises(VisualMismatch) as error:
+        diff.assert_image(changed, 'home')
+    result = error.value.result
+    assert result['ratio'] > 0.001 and os.path.isfile(result['heatmap']) and diff.stats['failed'] == 1
+    # the same change inside an ignored region passes
+    assert diff.assert_image(changed, 'home', ignore=[[95, 75, 70, 50]])['passed']
+
+
+def test_size_change_fails_with_a_reason(tmp_path):
+    diff = engine(tmp_path)
+    diff.assert_image(page(), 'home', update=True)
+    result = diff.compare(page(width=300), 'home')
+    assert not result['passed'] and 'size 300x200' in result['reason']
+
+
+def test_region_mask_clips_regions_to_the_image():
+    mask = region_mask((10, 10), [[-5, -5, 8, 8], {'x': 8, 'y': 8, 'width': 10, 'height': 10}])
+    assert (mask[:3, :3] == 0).all() and (mask[8:, 8:] == 0).all() and mask[5, 5] == 255
+
+
+class ViewportDriver:
+    """answers SCREEN_RECTS_JS with one viewport box per element"""
+
+    def __init__(self):
+        self.scripts = []
+
+    def execute_script(self, script, *args):
+        self.scripts.append((script, args))
+        return [[20.0, 10.0, 100.0, 40.0] for _ in args]
+
+    def get_screenshot_as_png(self):
+        return cv2.imencode('.png', page())[1].tobytes()
+
+
+def test_ignored_elements_use_viewport_boxes(tmp_path, monkeypatch):
+    from common import web_base
+
+    diff = engine(tmp_path)
+    diff.assert_image(page(), 'home', update=True)
+    monkeypatch.setattr(web_base, 'visual_diff', lambda: diff)
+    driver, compared = ViewportDriver(), {}
+    base = Base(driver)
+    monkeypatch.setattr(base, 'driver_element', lambda types, locate: f'{types}={locate}')
+    monkeypatch.setattr(diff, 'assert_image', lambda png, name, ignore, update: compared.update(ignore=ignore))
+    base.web_assert_screen('home', ignore=[[0, 0, 10, 10]], ignore_elements=[('id', 'clock'), ('id', 'ad')])
+    assert compared['ignore'] == [[0, 0, 10, 10], [20.0, 10.0, 100.0, 40.0], [20.0, 10.0, 100.0, 40.0]]
+    assert len(driver.scripts) == 1 and driver.scripts[0][1] == ('id=clock', 'id=ad')
@@ -0,0 +1,147 @@
+import dataclasses
+import time
+
+import pytest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from common.common import ErrorException, setting
+from common.wait_engine import DOCUMENT_TOKEN_JS, WaitEngine
+from common.web_base import Base, element_cache
+
+
+class NavigatingDriver:
+    """a page which starts loading the next document after `start` polls and finishes it `load` polls later"""
+
+    def __init__(self, start: int = None, load: int = 2):
+        self.start = start
+        self.load = load
+        self.polls = 0
+
+    def execute_script(self, script, *args):
+        self.polls += 1
+        navigated = self.start is not None and self.polls > self.start
+        if script == DOCUMENT_TOKEN_JS:
+            return 'doc2' if navigated else 'doc1'
+        loaded = not navigated or self.polls >= self.start + self.load
+        return 'complete' if loaded else 'loading'
+
+
+def engine():
+    return WaitEngine(poll_min=0.01, poll_max=0.01, quiet=0.05)
+
+
+def test_navigated_waits_for_the_new_document_not_the_old_complete_one():
+    driver = NavigatingDriver(start=3)
+    assert engine().wait(driver, 'navigated', token='doc1', timeout=1)
+    assert driver.polls >= 5  # the old document was complete all along
+
+
+def test_document_changed_times_out_without_a_navigation():
+    assert not engine().wait(NavigatingDriver(), 'document_changed', token='doc1', timeout=0.05)
+
+
+def test_settle_navigation_waits_for_the_page_loaded_by_the_action():
+    driver = NavigatingDriver(start=2, load=3)
+    base = Base(driver)
+    base.web_settle_navigation('doc1', budget=0.5)
+    assert driver.polls >= driver.start + driver.load  # a new document, then its load
+
+
+def test_settle_navigation_takes_the_budget_when_nothing_navigates():
+    base = Base(NavigatingDriver())
+    start = time.perf_counter()
+    base.web_settle_navigation('doc1', budget=0.1)
+    assert 0.1 <= time.perf_counter() - start < 1
+
+
+class StableDriver:
+    """a visible element which never moves"""
+
+    def find_elements(self, by, value):
+        return ['element']
+
+    def execute_script(self, script, *args):
+        return [0, 0, 10, 10, True]
+
+
+@pytest.mark.parametrize('budget', [0.05, 0.1])
+def test_element_stable_within_a_budget_shorter_than_its_quiet_period(budget):
+    wait = WaitEngine(poll_min=0.01, poll_max=0.01)
+    assert wait.wait(StableDriver(), 'element_stable', by='id', locate='a', budget=budget)
+    assert wait.met == 1 and wait.timeouts == 0
+
+
+class ObserverDriver:
+    """answers OBSERVE_JS with a scripted result and records the calls"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+        self.script_timeouts = []
+
+    def set_script_timeout(self, seconds):
+        self.script_timeouts.append(seconds)
+
+    def execute_async_script(self, script, *args):
+        self.calls.append(args)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def find_element(self, by, value):
+        self.calls.append(('find_element', by, value))
+        return 'polled'
+
+
+@pytest.fixture
+def observer(monkeypatch):
+    monkeypatch.setattr(setting, 'WEB_UI', dataclasses.replace(setting.WEB_UI, WEB_WAIT_BACKEND='observer'))
+
+
+@pytest.mark.parametrize('many, visible, result, expect', [
+    (False, False, 'element', 'element'),
+    (True, True, ['a', 'b'], ['a', 'b']),
+    (False, False, None, None),  # timeout in the page
+    (True, False, [], None),
+])
+def test_observe_result_shapes(many, visible, result, expect):
+    driver, wait = ObserverDriver(result), engine()
+    assert wait.observe(driver, 'css selector', '#item', many=many, visible=visible, timeout=2) == expect
+    assert driver.calls == [('css selector', '#item', many, visible, 2000)]
+    assert wait.stats['observed'] == 1 and wait.stats['observe_timeouts'] == (expect is None)
+
+
+def test_observe_raises_the_script_timeout_once_and_never_lowers_it():
+    driver, wait = ObserverDriver('element'), engine()
+    wait.observe(driver, 'id', 'a', timeout=10)
+    wait.observe(driver, 'id', 'b', timeout=10)
+    wait.observe(driver, 'id', 'c', timeout=2)
+    assert driver.script_timeouts == [15]
+
+
+def test_observe_rejects_locate_types_it_can_not_find():
+    with pytest.raises(ErrorException):
+        engine().observe(ObserverDriver(), '-ios predicate string', 'a')
+
+
+def test_web_observe_falls_back_to_polling(observer):
+    assert Base(ObserverDriver('element')).web_observe('id', 'a') == 'element'
+    assert Base(ObserverDriver(error=WebDriverException('navigated'))).web_observe('id', 'a') is False
+    assert Base(ObserverDriver(error=TimeoutException('script timeout'))).web_observe('id', 'a') is False
+    assert Base(ObserverDriver('element')).web_observe('-android uiautomator', 'a') is False
+    with pytest.raises(TimeoutException):
+        Base(ObserverDriver(None)).web_observe('id', 'a')
+
+
+def test_web_observe_is_off_with_the_poll_backend():
+    driver = ObserverDriver('element')
+    assert Base(driver).web_observe('id', 'a') is False and driver.calls == []
+
+
+def test_driver_element_polls_when_the_observer_can_not_run(observer):
+    driver = ObserverDriver(error=WebDriverException('navigated'))
+    base = Base(driver)
+    element_cache(driver).enabled = False
+    assert base.driver_element('id', 'a') == 'polled'
+    assert driver.calls[-1] == ('find_element', 'id', 'a')
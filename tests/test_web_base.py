@@ -0,0 +1,252 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+from selenium.webdriver.common.by import By
+
+from common.common import ErrorException
+from common.read_data import GetCaseYaml
+from common.web_base import Base, Web, compile_case, element_cache, group_steps
+
+LOCATOR_YAML = """
+- model: demo
+- case_name: search
+  element:
+    - types: name
+      operate: input
+      locate: wd
+      info: type in
+    - types: id
+      operate: click
+      locate: su
+      local_wait: 1
+- case_name: unsupported
+  element:
+    - types: id
+      operate: fly
+      locate: su
+"""
+
+
+@pytest.fixture
+def locator(tmp_path):
+    path = tmp_path / 'locator.yaml'
+    path.write_text(LOCATOR_YAML, encoding='utf-8')
+    return str(path)
+
+
+def test_compile_case_resolves_the_steps(locator):
+    plan = compile_case(GetCaseYaml(locator, 'search'))
+    assert [(step.by, step.locate, step.operate) for step in plan] == [(By.NAME, 'wd', 'input'), (By.ID, 'su', 'click')]
+    assert plan[0].needs_text and not plan[1].needs_text
+    assert plan[1].local_wait == 1 and plan[0].local_wait == 0
+    assert plan[0].info == 'type in'
+
+
+def test_compile_case_reuses_the_plan_until_the_file_changes(locator):
+    plan = compile_case(GetCaseYaml(locator, 'search'))
+    assert compile_case(GetCaseYaml(locator, 'search')) is plan
+
+    with open(locator, 'w', encoding='utf-8') as f:
+        f.write(LOCATOR_YAML.replace('locate: wd', 'locate: kw'))
+    stat = os.stat(locator)
+    os.utime(locator, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert compile_case(GetCaseYaml(locator, 'search'))[0].locate == 'kw'
+
+
+def test_compile_case_rejects_unknown_operations_and_cases(locator):
+    with pytest.raises(ErrorException):
+        compile_case(GetCaseYaml(locator, 'unsupported'))
+    with pytest.raises(ErrorException):
+        compile_case(GetCaseYaml(locator, 'missing'))
+
+
+class CountingDriver:
+    """counts the driver commands: finds return a new element, every other command is recorded too"""
+
+    def __init__(self):
+        self.commands = []
+
+    def find_element(self, by, value):
+        self.commands.append(('find_element', by, value))
+        return object()
+
+    def find_elements(self, by, value):
+        self.commands.append(('find_elements', by, value))
+        return [object()]
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name,) + args)
+        return command
+
+
+def test_element_cache_hit_issues_no_driver_command():
+    driver = CountingDriver()
+    base = Base(driver)
+    element_cache(driver).enabled = True
+    element = base.driver_element('id', 'su')
+    assert [command[0] for command in driver.commands] == ['find_element']
+    assert base.driver_element('id', 'su') is element and len(driver.commands) == 1
+    assert element_cache(driver).stats['hits'] == 1
+
+
+def test_element_cache_is_cleared_by_a_frame_switch_and_does_not_keep_lists():
+    driver = CountingDriver()
+    base = Base(driver)
+    element_cache(driver).enabled = True
+    element = base.driver_element('id', 'su')
+    element_cache(driver).switch_frame((('id', 'frame', None),))
+    assert base.driver_element('id', 'su') is not element
+    base.driver_element('id', 'row', el='l')
+    base.driver_element('id', 'row', el='l')
+    assert [command[0] for command in driver.commands].count('find_elements') == 2
+
+
+BATCH_YAML = """
+- model: demo
+- case_name: read
+  element:
+    - types: id
+      operate: scroll
+      locate: list
+    - types: id
+      operate: text
+      locate: title
+    - types: id
+      operate: click
+      locate: more
+    - types: id
+      operate: jsclear
+      locate: filter
+    - types: name
+      operate: input
+      locate: wd
+    - types: id
+      operate: text
+      locate: total
+      native: true
+"""
+
+
+@pytest.fixture
+def batch_plan(tmp_path):
+    path = tmp_path / 'batch.yaml'
+    path.write_text(BATCH_YAML, encoding='utf-8')
+    return compile_case(GetCaseYaml(str(path), 'read'))
+
+
+def test_group_steps_batches_only_consecutive_batchable_steps(batch_plan):
+    assert [[step.locate for step in group] for group in group_steps(batch_plan)] == \
+        [['list', 'title'], ['more'], ['filter'], ['wd'], ['total']]
+    assert all(len(group) == 1 for group in group_steps(batch_plan, batch=False))
+
+
+class BatchWeb(Web):
+    """runs the batch script against scripted outcomes and records the native steps"""
+
+    def __init__(self, outcomes):
+        super().__init__(CountingDriver())
+        self.outcomes = outcomes
+        self.batches = []
+        self.native = []
+
+    def web_run_batch(self, steps):
+        self.batches.append([step.locate for step in steps])
+        return self.outcomes.pop(0)
+
+    def web_run_step(self, step, text=None, wait=None, settle=None):
+        self.native.append(step.locate)
+        return f'native {step.locate}'
+
+
+def test_batched_steps_return_the_value_of_the_script(batch_plan):
+    web = BatchWeb([[{'ok': True, 'value': None}, {'ok': True, 'value': 'Title'}]])
+    assert web.web_run_steps(batch_plan[:2], wait=0, batch=True) == 'Title'
+    assert web.batches == [['list', 'title']] and web.native == []
+
+
+def test_step_not_found_in_the_batch_runs_natively_from_there(batch_plan):
+    web = BatchWeb([[{'ok': True, 'value': None}, {'ok': False, 'found': False, 'error': 'not found'}]])
+    assert web.web_run_steps(batch_plan[:2], wait=0, batch=True) == 'native title'
+    assert web.native == ['title']
+
+
+def test_step_which_failed_on_its_element_is_not_run_again(batch_plan):
+    web = BatchWeb([[{'ok': False, 'found': True, 'error': 'TypeError'}]])
+    with pytest.raises(ErrorException):
+        web.web_run_steps(batch_plan[:2], wait=0, batch=True)
+    assert web.native == []
+
+
+def test_web_run_batch_sends_one_script(batch_plan):
+    driver = CountingDriver()
+    Web(driver).web_run_batch(batch_plan[:2])
+    names = [command[0] for command in driver.commands]
+    assert names == ['set_script_timeout', 'execute_async_script']
+    payload = driver.commands[-1][2]
+    assert payload == [{'by': 'id', 'locate': 'list', 'index': None, 'operate': 'scroll'},
+                       {'by': 'id', 'locate': 'title', 'index': None, 'operate': 'text'}]
+
+
+# a page of plain objects for the scripts of web_base: css selectors match by name, the rest of FIND_JS is unused
+NODE_PAGE_JS = """
+const input = JSON.parse(require('fs').readFileSync(0, 'utf-8'));
+const elements = input.elements.map(e => ({
+  innerText: e.text, value: e.value, tagName: e.tag.toUpperCase(),
+  offsetWidth: e.visible ? e.rect[2] : 0, offsetHeight: e.visible ? e.rect[3] : 0,
+  getClientRects: () => e.visible ? [e.rect] : [],
+  getBoundingClientRect: () => ({x: e.rect[0], y: e.rect[1], width: e.rect[2], height: e.rect[3]}),
+  getAttribute: name => name in e.attrs ? e.attrs[name] : null,
+  selectors: e.selectors
+}));
+global.document = {querySelectorAll: s => elements.filter(e => e.selectors.includes(s))};
+new Function(input.script).apply(null, input.args.concat([r => console.log(JSON.stringify(r))]));
+"""
+
+
+class NodePageDriver:
+    """runs the async scripts in node against NODE_PAGE_JS, no browser needed"""
+
+    def __init__(self, elements):
+        self.elements = elements
+        self.calls = []
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def execute_async_script(self, script, *args):
+        self.calls.append(args)
+        payload = json.dumps({'elements': self.elements, 'script': script, 'args': list(args)})
+        done = subprocess.run(['node', '-e', NODE_PAGE_JS], input=payload, capture_output=True, text=True,
+                              timeout=30, check=True)
+        return json.loads(done.stdout)
+
+
+PAGE = [
+    {'selectors': ['tr'], 'text': 'row 1', 'value': None, 'tag': 'tr', 'rect': [0, 0, 100, 20], 'visible': True,
+     'attrs': {'data-id': '1'}},
+    {'selectors': ['tr'], 'text': 'row 2', 'value': None, 'tag': 'tr', 'rect': [0, 20, 100, 20], 'visible': False,
+     'attrs': {}},
+]
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node runs the page scripts')
+def test_web_elements_data_reads_every_match_in_one_call():
+    driver = NodePageDriver(PAGE)
+    rows = Base(driver).web_elements_data('css', 'tr', fields=('text', 'tag', 'rect', 'visible'),
+                                          attrs=('data-id',), wait=False)
+    assert driver.calls == [('css selector', 'tr', ['text', 'tag', 'rect', 'visible'], ['data-id'], 0)]
+    assert rows == [{'text': 'row 1', 'tag': 'tr', 'rect': [0, 0, 100, 20], 'visible': True,
+                     'attrs': {'data-id': '1'}},
+                    {'text': '', 'tag': 'tr', 'rect': [0, 20, 100, 20], 'visible': False,
+                     'attrs': {'data-id': None}}]  # a hidden element has no text
+    assert Base(driver).web_texts('css', 'tr', wait=False) == ['row 1', '']
+    assert Base(NodePageDriver([])).web_elements_data('css', 'tr', wait=False) == []
+
+
+def test_web_elements_data_rejects_unknown_fields():
+    with pytest.raises(ErrorException):
+        Base(NodePageDriver(PAGE)).web_elements_data('css', 'tr', fields=('colour',))